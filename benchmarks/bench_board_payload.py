@@ -0,0 +1,84 @@
+"""
+Benchmark of the bytes per /node/<target>/<board> response for each way of drawing the board (see
+constants.BOARD_RENDERING_MODE):
+    • inline_svg: the page embeds the whole board as rendered by chess.svg.board(), against
+    • sprite: the page carries only the FEN, last move, and checked-king square, and the browser composes the board
+      from the piece sprite (static/js/sprite_board.js), which, like the script itself, is fetched once and then cached.
+
+Reports, for a sample of pages of the built-in PGN, the mean bytes per response, both as sent and gzip-compressed (as
+by a compressing proxy), and the one-time bytes of the sprite and the script.
+
+Usage (from the project directory):
+    python benchmarks/bench_board_payload.py [--pages N]
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pgn4people_poc_demo import constants
+from pgn4people_poc_demo import create_app
+from pgn4people_poc_demo import traverse
+
+
+DIRECTORY_OF_STATIC_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         "..", "pgn4people_poc_demo", "static")
+
+
+def bytes_of_pages(client, list_of_urls):
+    """
+    Returns (mean bytes, mean gzip-compressed bytes) of the responses to list_of_urls
+    """
+    total_bytes = total_compressed_bytes = 0
+    for url in list_of_urls:
+        response = client.get(url)
+        if response.status_code != 200:
+            sys.exit(f"{url} returned {response.status_code}")
+        total_bytes += len(response.data)
+        total_compressed_bytes += len(gzip.compress(response.data))
+    return total_bytes / len(list_of_urls), total_compressed_bytes / len(list_of_urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+
+    client = create_app().test_client()
+    number_of_nodes = len(traverse.game_tree_cache.get_nodedict(traverse.path_of_built_in_pgn_file()))
+    random_generator = random.Random(0)
+    list_of_urls = []
+    for _ in range(args.pages):
+        target_node_id = random_generator.randrange(number_of_nodes)
+        list_of_urls.append(f"/node/{target_node_id}/{target_node_id}")
+
+    header = f"{'mode':<12} {'bytes/page':>11} {'gzip bytes/page':>16}"
+    print(header)
+    print("-" * len(header))
+    results = {}
+    for mode in (constants.BOARD_RENDERING_MODE_INLINE_SVG, constants.BOARD_RENDERING_MODE_SPRITE):
+        constants.BOARD_RENDERING_MODE = mode
+        traverse.page_cache.clear()
+        results[mode] = bytes_of_pages(client, list_of_urls)
+        print(f"{mode:<12} {results[mode][0]:>11,.0f} {results[mode][1]:>16,.0f}")
+
+    inline_bytes, inline_compressed_bytes = results[constants.BOARD_RENDERING_MODE_INLINE_SVG]
+    sprite_bytes, sprite_compressed_bytes = results[constants.BOARD_RENDERING_MODE_SPRITE]
+    print(f"\nsprite saves {inline_bytes - sprite_bytes:,.0f} bytes/page ({1 - sprite_bytes / inline_bytes:.0%}); "
+          f"gzip-compressed, {inline_compressed_bytes - sprite_compressed_bytes:,.0f} bytes/page "
+          f"({1 - sprite_compressed_bytes / inline_compressed_bytes:.0%}).")
+
+    for filename in (constants.BOARD_SPRITE_FILENAME, "js/sprite_board.js"):
+        with open(os.path.join(DIRECTORY_OF_STATIC_FILES, filename), "rb") as file:
+            content = file.read()
+        print(f"One-time (cached) {filename}: {len(content):,} bytes ({len(gzip.compress(content)):,} gzip-compressed)")
+
+    print(f"\n{args.pages} pages of the built-in PGN, /node/<n>/<n> for random n.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark of building the game tree from a PGN.
+
+Compares, in build time and in peak memory (as traced by tracemalloc):
+    • the two-pass build: chess.pgn.read_game with PGNTokenizer, then buildtree() on the resulting TokenizedGame, against
+    • the single-pass build: chess.pgn.read_game with PGNTreeBuilder, which builds the tree as the PGN is read.
+
+Also compares:
+    • buildtree() as it is now, which computes no FENs at build time (FENs are computed lazily; see
+      game_tree.fen_of_node()), against
+    • the former approach, which computed every node’s FEN during the build by round-tripping through a FEN string
+      (python_chess_utilities.update_position_with_move_uci()). This is emulated by computing, after the build, every
+      node’s FEN that way.
+
+Runs on every built-in demo PGN and on a synthetic repertoire of (by default) 100,000 moves.
+
+Usage (from the project directory):
+    python benchmarks/bench_build_tree.py [--synthetic-moves N] [--repeat R]
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import chess
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.build_tree import buildtree
+from pgn4people_poc_demo.constants import INITIAL_NODE_ID
+from pgn4people_poc_demo.pgn_tokenizer import PGNTokenizer
+from pgn4people_poc_demo.pgn_tree_builder import PGNTreeBuilder
+from pgn4people_poc_demo.python_chess_utilities import update_position_with_move_uci
+
+
+DIRECTORY_OF_DEMO_PGNS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      "..", "pgn4people_poc_demo", "static", "data")
+
+
+def time_build(pgn_string, repeat):
+    """
+    Returns (best seconds to parse, best seconds to buildtree(), nodedict) for the two-pass build
+    """
+    best_parse_seconds = best_build_seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokenized_game = chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTokenizer)
+        middle = time.perf_counter()
+        nodedict = buildtree(tokenized_game)
+        end = time.perf_counter()
+        best_parse_seconds = min(best_parse_seconds, middle - start)
+        best_build_seconds = min(best_build_seconds, end - middle)
+    return best_parse_seconds, best_build_seconds, nodedict
+
+
+def time_single_pass_build(pgn_string, repeat):
+    """
+    Returns the best seconds for the single-pass build
+    """
+    best_seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTreeBuilder)
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+    return best_seconds
+
+
+def peak_megabytes(function, *args):
+    """
+    Returns the peak memory, in MB, traced while function(*args) runs
+    """
+    tracemalloc.start()
+    function(*args)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak_bytes / 1e6
+
+
+def two_pass_build(pgn_string):
+    return buildtree(chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTokenizer))
+
+
+def single_pass_build(pgn_string):
+    return chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTreeBuilder)
+
+
+def time_eager_fens(nodedict):
+    """
+    Returns the seconds needed to compute every node’s FEN by FEN round-trips, as buildtree() formerly did.
+    """
+    fen_of_node_id = {INITIAL_NODE_ID: nodedict[INITIAL_NODE_ID].fen}
+    start = time.perf_counter()
+    # Node ids are assigned in creation order, so every originating node precedes its destinations
+    for node_id in sorted(nodedict)[1:]:
+        node = nodedict[node_id]
+        originating_node = nodedict[node.originatingnode_id]
+        move_uci = originating_node.edgeslist[node.choice_id_at_originatingnode].movetext_dict["uci"]
+        fen_of_node_id[node_id] = update_position_with_move_uci(fen_of_node_id[node.originatingnode_id], move_uci)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-moves", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = []
+    for pgn_filepath in sorted(glob.glob(os.path.join(DIRECTORY_OF_DEMO_PGNS, "*.pgn"))):
+        with open(pgn_filepath, "r") as file:
+            inputs.append((os.path.basename(pgn_filepath), file.read()))
+    if args.synthetic_moves:
+        inputs.append((f"synthetic ({args.synthetic_moves:,} moves)", synthetic_repertoire_pgn(args.synthetic_moves)))
+
+    header = (f"{'input':<42} {'nodes':>8} {'2-pass s':>9} {'1-pass s':>9} {'2-pass MB':>10} {'1-pass MB':>10} "
+              f"{'build s':>8} {'old FEN s':>10}")
+    print(header)
+    print("-" * len(header))
+    for name, pgn_string in inputs:
+        parse_seconds, build_seconds, nodedict = time_build(pgn_string, args.repeat)
+        single_pass_seconds = time_single_pass_build(pgn_string, args.repeat)
+        two_pass_megabytes = peak_megabytes(two_pass_build, pgn_string)
+        single_pass_megabytes = peak_megabytes(single_pass_build, pgn_string)
+        eager_fen_seconds = time_eager_fens(nodedict)
+        print(f"{name:<42} {len(nodedict):>8} {parse_seconds + build_seconds:>9.3f} {single_pass_seconds:>9.3f} "
+              f"{two_pass_megabytes:>10.1f} {single_pass_megabytes:>10.1f} "
+              f"{build_seconds:>8.3f} {build_seconds + eager_fen_seconds:>10.3f}")
+    print("\n2-pass: read_game with PGNTokenizer, then buildtree(). 1-pass: read_game with PGNTreeBuilder.")
+    print("build s: buildtree() alone. old FEN s: buildtree() plus the per-move FEN round-trips it formerly did.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark of the parallel compilation of a PGN collection (see compile_pgn_collection.py): throughput, in games/sec and
+moves/sec, with 1, 2, 4, and 8 worker processes.
+
+The collection is synthetic: --games repertoires of about --moves-per-game moves each (see synthetic_repertoire.py),
+each with its own seed. Throughput can scale with workers only up to the number of CPUs available, which is reported.
+
+Usage (from the project directory):
+    python benchmarks/bench_bulk_compile.py [--games G] [--moves-per-game M] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.compile_pgn_collection import compile_pgn_collection
+from pgn4people_poc_demo.pgn_game_index import load_game_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=400)
+    parser.add_argument("--moves-per-game", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pgn_filepath = os.path.join(directory, "collection.pgn")
+        with open(pgn_filepath, "w") as pgn_file:
+            for seed in range(args.games):
+                pgn_file.write(synthetic_repertoire_pgn(args.moves_per_game, seed=seed))
+                pgn_file.write("\n\n")
+        # Indexes the collection once, up front, so that every run below reuses the index
+        load_game_index(pgn_filepath)
+
+        header = f"{'workers':>7} {'seconds':>8} {'games/s':>9} {'moves/s':>10} {'speedup':>8}"
+        print(header)
+        print("-" * len(header))
+        baseline_seconds = None
+        for number_of_workers in args.workers:
+            output_directory = os.path.join(directory, f"compiled-{number_of_workers}")
+            result = compile_pgn_collection(pgn_filepath, output_directory, number_of_workers)
+            if result.list_of_failures:
+                sys.exit(f"{len(result.list_of_failures)} games failed, e.g., {result.list_of_failures[0]}")
+            if baseline_seconds is None:
+                baseline_seconds = result.seconds
+            print(f"{number_of_workers:>7} {result.seconds:>8.2f} {result.games_per_second():>9,.1f} "
+                  f"{result.moves_per_second():>10,.0f} {baseline_seconds / result.seconds:>7.2f}×")
+
+        print(f"\n{result.number_of_games:,} games, {result.number_of_moves:,} moves, "
+              f"{os.path.getsize(pgn_filepath) / 1e6:.1f} MB; {os.cpu_count()} CPUs available.")
+
+
+if __name__ == "__main__":
+    main()
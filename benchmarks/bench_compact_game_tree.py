@@ -0,0 +1,107 @@
+"""
+Benchmark of the array-backed CompactGameTree against the GameTree of GameNode/Edge objects.
+
+For each input, builds the tree both ways (single pass, with PGNTreeBuilder and PGNCompactTreeBuilder, respectively)
+and reports:
+    • resident memory of the built tree (memory still allocated, as traced by tracemalloc, once the build completes);
+    • build time;
+    • time of the queries the app makes on the tree: deviation_history_of_node() and
+      construct_list_of_rows_for_variations_table() for a sample of target nodes, and characterize_gametree().
+
+Runs on every built-in demo PGN and on a synthetic repertoire of (by default) 100,000 moves. Pass, e.g.,
+--synthetic-moves 1000000 to check a million-node repertoire (generating that PGN takes a few minutes).
+
+Usage (from the project directory):
+    python benchmarks/bench_compact_game_tree.py [--synthetic-moves N] [--sample S] [--repeat R]
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_build_tree import DIRECTORY_OF_DEMO_PGNS
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.game_tree import characterize_gametree
+from pgn4people_poc_demo.game_tree import deviation_history_of_node
+from pgn4people_poc_demo.pgn_tree_builder import PGNCompactTreeBuilder
+from pgn4people_poc_demo.pgn_tree_builder import PGNTreeBuilder
+from pgn4people_poc_demo.variations_table import construct_list_of_rows_for_variations_table
+
+
+def build_and_measure(pgn_string, Visitor):
+    """
+    Returns (tree, seconds to build, MB of memory held by the built tree).
+
+    The build is timed untraced and then repeated under tracemalloc, which would otherwise inflate the time.
+    """
+    start = time.perf_counter()
+    tree = chess.pgn.read_game(io.StringIO(pgn_string), Visitor=Visitor)
+    build_seconds = time.perf_counter() - start
+    del tree
+
+    tracemalloc.start()
+    tree = chess.pgn.read_game(io.StringIO(pgn_string), Visitor=Visitor)
+    resident_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return tree, build_seconds, resident_bytes / 1e6
+
+
+def best_seconds(repeat, function, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def render_rows_for_targets(tree, target_node_ids):
+    for target_node_id in target_node_ids:
+        deviation_history = deviation_history_of_node(tree, target_node_id)
+        construct_list_of_rows_for_variations_table(tree, deviation_history, target_node_id, target_node_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-moves", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=200, help="number of target nodes for which rows are rendered")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = []
+    for pgn_filepath in sorted(glob.glob(os.path.join(DIRECTORY_OF_DEMO_PGNS, "*.pgn"))):
+        with open(pgn_filepath, "r") as file:
+            inputs.append((os.path.basename(pgn_filepath), file.read()))
+    if args.synthetic_moves:
+        inputs.append((f"synthetic ({args.synthetic_moves:,} moves)", synthetic_repertoire_pgn(args.synthetic_moves)))
+
+    header = (f"{'input':<40} {'tree':<8} {'nodes':>8} {'MB':>8} {'B/node':>7} {'build s':>8} "
+              f"{'rows s':>8} {'report s':>9}")
+    print(header)
+    print("-" * len(header))
+    for name, pgn_string in inputs:
+        for tree_name, Visitor in (("GameTree", PGNTreeBuilder), ("compact", PGNCompactTreeBuilder)):
+            tree, build_seconds, megabytes = build_and_measure(pgn_string, Visitor)
+            target_node_ids = random.Random(0).sample(range(len(tree)), min(args.sample, len(tree)))
+            rows_seconds = best_seconds(args.repeat, render_rows_for_targets, tree, target_node_ids)
+            report_seconds = best_seconds(args.repeat, characterize_gametree, tree)
+            print(f"{name:<40} {tree_name:<8} {len(tree):>8} {megabytes:>8.1f} {megabytes * 1e6 / len(tree):>7.0f} "
+                  f"{build_seconds:>8.3f} {rows_seconds:>8.3f} {report_seconds:>9.3f}")
+            del tree
+    print(f"\nMB: memory held by the built tree. rows s: deviation history plus variations-table rows for "
+          f"{args.sample} random target nodes. report s: characterize_gametree().")
+
+
+if __name__ == "__main__":
+    main()
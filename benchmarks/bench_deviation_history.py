@@ -0,0 +1,99 @@
+"""
+Benchmark of game_tree.deviation_history_of_node(), which hops from deviation to deviation via each node’s
+.nearest_deviation_node_id, against the former halfmove-by-halfmove walk back to the initial node.
+
+Computes the deviation history of every node of each tree with both methods, checks that they agree, and reports the
+time per lookup together with the average number of halfmoves and of deviations on the path to a node.
+
+Usage (from the project directory):
+    python benchmarks/bench_deviation_history.py [--synthetic-moves N] [--repeat R]
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_build_tree import DIRECTORY_OF_DEMO_PGNS
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.constants import INDEX_MAINLINE
+from pgn4people_poc_demo.constants import INITIAL_NODE_ID
+from pgn4people_poc_demo.game_tree import deviation_history_of_node
+from pgn4people_poc_demo.pgn_tree_builder import PGNCompactTreeBuilder
+from pgn4people_poc_demo.pgn_tree_builder import PGNTreeBuilder
+
+
+def deviation_history_of_node_by_halfmove_walk(nodedict, target_node_id):
+    """
+    The former implementation of deviation_history_of_node(): walks back to the initial node one halfmove at a time.
+    """
+    deviation_history = {}
+    current_node_id = target_node_id
+    while current_node_id != INITIAL_NODE_ID:
+        immediate_predecessor_node_id = nodedict[current_node_id].originatingnode_id
+        choice_at_predecessor = nodedict[current_node_id].choice_id_at_originatingnode
+        if choice_at_predecessor != INDEX_MAINLINE:
+            deviation_history[immediate_predecessor_node_id] = choice_at_predecessor
+        current_node_id = immediate_predecessor_node_id
+    return deviation_history
+
+
+def best_seconds_over_all_nodes(repeat, function, nodedict):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for node_id in nodedict:
+            function(nodedict, node_id)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-moves", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = []
+    for pgn_filepath in sorted(glob.glob(os.path.join(DIRECTORY_OF_DEMO_PGNS, "*.pgn"))):
+        with open(pgn_filepath, "r") as file:
+            inputs.append((os.path.basename(pgn_filepath), file.read()))
+    if args.synthetic_moves:
+        inputs.append((f"synthetic ({args.synthetic_moves:,} moves)", synthetic_repertoire_pgn(args.synthetic_moves)))
+
+    header = (f"{'input':<40} {'tree':<8} {'nodes':>8} {'plies':>6} {'devs':>5} {'walk µs':>8} {'hop µs':>7} "
+              f"{'speedup':>7} {'agree':>6}")
+    print(header)
+    print("-" * len(header))
+    for name, pgn_string in inputs:
+        for tree_name, Visitor in (("GameTree", PGNTreeBuilder), ("compact", PGNCompactTreeBuilder)):
+            nodedict = chess.pgn.read_game(io.StringIO(pgn_string), Visitor=Visitor)
+            number_of_nodes = len(nodedict)
+
+            agree = all(deviation_history_of_node(nodedict, node_id)
+                        == deviation_history_of_node_by_halfmove_walk(nodedict, node_id)
+                        for node_id in nodedict)
+            average_plies = sum(nodedict[node_id].halfmovenumber for node_id in nodedict) / number_of_nodes
+            average_deviations = sum(len(deviation_history_of_node(nodedict, node_id))
+                                     for node_id in nodedict) / number_of_nodes
+
+            walk_seconds = best_seconds_over_all_nodes(args.repeat, deviation_history_of_node_by_halfmove_walk,
+                                                       nodedict)
+            hop_seconds = best_seconds_over_all_nodes(args.repeat, deviation_history_of_node, nodedict)
+            print(f"{name:<40} {tree_name:<8} {number_of_nodes:>8} {average_plies:>6.1f} {average_deviations:>5.1f} "
+                  f"{walk_seconds / number_of_nodes * 1e6:>8.2f} {hop_seconds / number_of_nodes * 1e6:>7.2f} "
+                  f"{walk_seconds / hop_seconds:>6.1f}× {'yes' if agree else 'NO':>6}")
+    print("\nplies/devs: average halfmove number of, and number of deviations on the path to, a node. "
+          "walk/hop µs: time per lookup, averaged over every node.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Benchmark suite covering every stage of the request pipeline, with machine-readable results and a regression check
+against a stored baseline.
+
+For each input, times separately (best of --repeat runs):
+    parse           chess.pgn.read_game() with PGNTokenizer
+    buildtree       buildtree() on the resulting TokenizedGame
+    deviation       deviation_history_of_node() for every node
+    rows            construct_list_of_rows_for_variations_table() for each sampled target node, from a cold
+                    row-fragment cache
+    board           compile_parameters_for_chessboard_svg() and construct_svg_chessboard() for each sampled node, from a
+                    cold SVG-board cache
+    comments        extract_text_comments_for_current_node() for each sampled node
+    report          characterize_gametree()
+    page            GET /<pgn_id>/node/<target>/<target> through the Flask test client for each sampled node, from a
+                    cold page cache (the input being served from a temporary PGN library; see pgn_library.py)
+The sampled nodes (--sample, default 200) are drawn with a fixed seed, so runs are comparable.
+
+Inputs are every built-in demo PGN and synthetic repertoires (see synthetic_repertoire.py) of the sizes given by
+--synthetic-moves (default 100,000 moves).
+
+Results are printed as a table and, with --output, written as JSON:
+    {
+        "format": 1,
+        "environment": {"python": …, "platform": …, "pgn4people_version": …},
+        "parameters": {"repeat": …, "sample": …, "synthetic_moves": […]},
+        "inputs": {
+            name: {"nodes": number of nodes, "stages": {stage: {"seconds": best seconds, "calls": calls per run}}},
+            …
+        }
+    }
+If the baseline file (--baseline; default benchmarks/baseline.json) exists, each stage is compared with the same stage
+and input of the baseline, and is reported as a regression if it is slower by more than --tolerance (a fraction,
+default 0.25) and by more than REGRESSION_NOISE_FLOOR_SECONDS; the exit status is then 1. --update-baseline writes the
+results as the new baseline. A baseline is particular to the machine that recorded it: record one before comparing on a
+different machine.
+
+Usage (from the project directory):
+    python benchmarks/bench_pipeline.py [--synthetic-moves N [N ...]] [--sample S] [--repeat R] [--output PATH]
+                                        [--baseline PATH] [--tolerance T] [--update-baseline]
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_build_tree import DIRECTORY_OF_DEMO_PGNS
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo import create_app
+from pgn4people_poc_demo import display_chess_board
+from pgn4people_poc_demo import traverse
+from pgn4people_poc_demo.build_tree import buildtree
+from pgn4people_poc_demo.display_chess_board import compile_parameters_for_chessboard_svg
+from pgn4people_poc_demo.display_chess_board import construct_svg_chessboard
+from pgn4people_poc_demo.display_text_comments import extract_text_comments_for_current_node
+from pgn4people_poc_demo.game_tree import characterize_gametree
+from pgn4people_poc_demo.game_tree import deviation_history_of_node
+from pgn4people_poc_demo.game_tree_cache import GameTreeCache
+from pgn4people_poc_demo.pgn_library import PGNLibrary
+from pgn4people_poc_demo.pgn_tokenizer import PGNTokenizer
+from pgn4people_poc_demo.variations_table import construct_list_of_rows_for_variations_table
+from pgn4people_poc_demo.__version__ import __version__
+
+RESULTS_FORMAT = 1
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A stage is not reported as a regression unless it is slower than the baseline by at least this much, however large
+# the relative slowdown: stages that take a millisecond or so vary by more than any sensible tolerance from run to run.
+REGRESSION_NOISE_FLOOR_SECONDS = 0.002
+
+STAGES = ("parse", "buildtree", "deviation", "rows", "board", "comments", "report", "page")
+
+
+def best_seconds(repeat, function, *args, before_each_run=None):
+    """
+    Returns the least of repeat timings of function(*args), calling before_each_run() (untimed) before each
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if before_each_run is not None:
+            before_each_run()
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse(pgn_string):
+    return chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTokenizer)
+
+
+def deviation_histories_of_all_nodes(nodedict):
+    for node_id in range(len(nodedict)):
+        deviation_history_of_node(nodedict, node_id)
+
+
+def rows_of_targets(nodedict, target_node_ids):
+    for target_node_id in target_node_ids:
+        deviation_history = deviation_history_of_node(nodedict, target_node_id)
+        construct_list_of_rows_for_variations_table(nodedict, deviation_history, target_node_id, target_node_id)
+
+
+def boards_of_nodes(nodedict, node_ids):
+    for node_id in node_ids:
+        construct_svg_chessboard(compile_parameters_for_chessboard_svg(nodedict, node_id))
+
+
+def comments_of_nodes(nodedict, node_ids):
+    for node_id in node_ids:
+        extract_text_comments_for_current_node(nodedict, node_id)
+
+
+def pages_of_targets(client, pgn_id, target_node_ids):
+    for target_node_id in target_node_ids:
+        response = client.get(f"/{pgn_id}/node/{target_node_id}/{target_node_id}")
+        if response.status_code != 200:
+            raise RuntimeError(f"/{pgn_id}/node/{target_node_id}/{target_node_id} returned {response.status_code}")
+
+
+def benchmark_input(pgn_id, pgn_string, client, sample, repeat):
+    """
+    Returns {"nodes": …, "stages": {stage: {"seconds": …, "calls": …}}} for one input (see module docstring)
+    """
+    stages = {}
+
+    stages["parse"] = {"seconds": best_seconds(repeat, parse, pgn_string), "calls": 1}
+    tokenized_game = parse(pgn_string)
+    stages["buildtree"] = {"seconds": best_seconds(repeat, buildtree, tokenized_game), "calls": 1}
+    nodedict = buildtree(tokenized_game)
+    del tokenized_game
+
+    node_ids = random.Random(0).sample(range(len(nodedict)), min(sample, len(nodedict)))
+
+    def clear_row_fragment_cache():
+        nodedict.row_fragment_cache = None
+
+    stages["deviation"] = {"seconds": best_seconds(repeat, deviation_histories_of_all_nodes, nodedict),
+                           "calls": len(nodedict)}
+    stages["rows"] = {"seconds": best_seconds(repeat, rows_of_targets, nodedict, node_ids,
+                                              before_each_run=clear_row_fragment_cache),
+                      "calls": len(node_ids)}
+    stages["board"] = {"seconds": best_seconds(repeat, boards_of_nodes, nodedict, node_ids,
+                                               before_each_run=display_chess_board.svg_board_cache.clear),
+                       "calls": len(node_ids)}
+    stages["comments"] = {"seconds": best_seconds(repeat, comments_of_nodes, nodedict, node_ids),
+                          "calls": len(node_ids)}
+    stages["report"] = {"seconds": best_seconds(repeat, characterize_gametree, nodedict), "calls": 1}
+
+    # Builds the library’s tree of the input before timing pages
+    client.get(f"/{pgn_id}/node/0/0")
+    stages["page"] = {"seconds": best_seconds(repeat, pages_of_targets, client, pgn_id, node_ids,
+                                              before_each_run=traverse.page_cache.clear),
+                      "calls": len(node_ids)}
+
+    return {"nodes": len(nodedict), "stages": stages}
+
+
+def list_of_inputs(synthetic_moves):
+    """
+    Returns a list of (name, PGN string) of the inputs (see module docstring)
+    """
+    inputs = []
+    for pgn_filepath in sorted(glob.glob(os.path.join(DIRECTORY_OF_DEMO_PGNS, "*.pgn"))):
+        with open(pgn_filepath, "r") as file:
+            inputs.append((os.path.splitext(os.path.basename(pgn_filepath))[0], file.read()))
+    for number_of_moves in synthetic_moves:
+        inputs.append((f"synthetic_{number_of_moves}", synthetic_repertoire_pgn(number_of_moves)))
+    return inputs
+
+
+def run_benchmarks(synthetic_moves, sample, repeat):
+    """
+    Runs every stage on every input and returns the results (see module docstring)
+    """
+    results = {
+        "format": RESULTS_FORMAT,
+        "environment": {"python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "pgn4people_version": __version__},
+        "parameters": {"repeat": repeat, "sample": sample, "synthetic_moves": synthetic_moves},
+        "inputs": {},
+    }
+
+    app = create_app()
+    client = app.test_client()
+    with tempfile.TemporaryDirectory() as library_directory:
+        # Serves the inputs from a PGN library of their own, so that every input can be requested as a page
+        traverse.pgn_library = PGNLibrary(library_directory, GameTreeCache(traverse.build_nodedict_from_pgn_file))
+        for name, pgn_string in list_of_inputs(synthetic_moves):
+            with open(os.path.join(library_directory, f"{name}.pgn"), "w") as file:
+                file.write(pgn_string)
+            results["inputs"][name] = benchmark_input(name, pgn_string, client, sample, repeat)
+            print_results_of_input(name, results["inputs"][name])
+    return results
+
+
+def print_header():
+    header = f"{'input':<40} {'nodes':>8} " + " ".join(f"{stage + ' ms':>12}" for stage in STAGES)
+    print(header)
+    print("-" * len(header))
+
+
+def print_results_of_input(name, result_of_input):
+    print(f"{name:<40} {result_of_input['nodes']:>8} "
+          + " ".join(f"{1000 * result_of_input['stages'][stage]['seconds']:>12.2f}" for stage in STAGES),
+          flush=True)
+
+
+def list_of_regressions(results, baseline, tolerance):
+    """
+    Returns a list of (input, stage, seconds, baseline seconds) of the stages of results that are slower than in
+    baseline by more than the fraction tolerance and by more than REGRESSION_NOISE_FLOOR_SECONDS. Inputs and stages
+    absent from baseline are not compared.
+    """
+    regressions = []
+    for name, result_of_input in results["inputs"].items():
+        baseline_of_input = baseline["inputs"].get(name)
+        if baseline_of_input is None:
+            continue
+        for stage, timing in result_of_input["stages"].items():
+            baseline_timing = baseline_of_input["stages"].get(stage)
+            if baseline_timing is None:
+                continue
+            seconds = timing["seconds"]
+            baseline_seconds = baseline_timing["seconds"]
+            if (seconds > baseline_seconds * (1 + tolerance)
+                    and seconds - baseline_seconds > REGRESSION_NOISE_FLOOR_SECONDS):
+                regressions.append((name, stage, seconds, baseline_seconds))
+    return regressions
+
+
+def write_json(results, path):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+        file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-moves", type=int, nargs="*", default=[100_000])
+    parser.add_argument("--sample", type=int, default=200, help="number of nodes for per-node stages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="path of JSON results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="path of JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="fractional slowdown beyond which a stage is a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the baseline")
+    args = parser.parse_args()
+
+    print_header()
+    results = run_benchmarks(args.synthetic_moves, args.sample, args.repeat)
+
+    if args.output:
+        write_json(results, args.output)
+
+    if args.update_baseline:
+        write_json(results, args.baseline)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to record one")
+        return
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    if baseline.get("parameters") != results["parameters"]:
+        print("\nNote: baseline was recorded with different parameters; only matching inputs are compared")
+    regressions = list_of_regressions(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        return
+    print(f"\n{len(regressions)} regression(s) against {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for name, stage, seconds, baseline_seconds in regressions:
+        print(f"    {name:<40} {stage:<10} {1000 * seconds:>10.2f} ms vs {1000 * baseline_seconds:>10.2f} ms "
+              f"({seconds / baseline_seconds - 1:+.0%})")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
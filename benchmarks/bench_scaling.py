@@ -0,0 +1,136 @@
+"""
+Scaling benchmark: time and memory of the tree stages against the size of the repertoire, up to millions of nodes.
+
+For each size given by --sizes (numbers of moves), generates a synthetic repertoire (see synthetic_repertoire.py; the
+generator’s parameters can be varied with the options below) and measures:
+    build           single-pass build of the tree (chess.pgn.read_game() with PGNTreeBuilder, as the app builds it)
+    tree_mb         memory held by the built tree (traced by tracemalloc in a second, untimed build; --no-memory skips
+                    it, which halves the running time on large sizes)
+    deviation       deviation_history_of_node() for every node
+    rows            deviation history and construct_list_of_rows_for_variations_table() for --sample target nodes
+    report          characterize_gametree()
+and also the generation time and the size of the PGN. Results are printed as CSV (one row per size), suitable for
+plotting time and memory against nodes, and written to --output if given.
+
+Usage (from the project directory):
+    python benchmarks/bench_scaling.py [--sizes N [N ...]] [--sample S] [--no-memory] [--output results.csv]
+                                       [--branching-factor B] [--variation-depth D] [--comment-density C]
+                                       [--nag-density N]
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.game_tree import characterize_gametree
+from pgn4people_poc_demo.game_tree import deviation_history_of_node
+from pgn4people_poc_demo.pgn_tree_builder import PGNTreeBuilder
+from pgn4people_poc_demo.variations_table import construct_list_of_rows_for_variations_table
+
+FIELDS = ("moves", "nodes", "pgn_mb", "generate_s", "build_s", "tree_mb", "deviation_s", "rows_s", "report_s")
+
+
+def seconds_of(function, *args, **kwargs):
+    """
+    Returns (result of function(*args, **kwargs), seconds it took)
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def build(pgn_string):
+    return chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTreeBuilder)
+
+
+def deviation_histories_of_all_nodes(nodedict):
+    for node_id in range(len(nodedict)):
+        deviation_history_of_node(nodedict, node_id)
+
+
+def rows_of_targets(nodedict, target_node_ids):
+    for target_node_id in target_node_ids:
+        deviation_history = deviation_history_of_node(nodedict, target_node_id)
+        construct_list_of_rows_for_variations_table(nodedict, deviation_history, target_node_id, target_node_id)
+
+
+def measure(number_of_moves, generator_parameters, sample, measure_memory):
+    """
+    Returns a dictionary of the FIELDS of one size
+    """
+    pgn_string, generate_seconds = seconds_of(synthetic_repertoire_pgn, number_of_moves, **generator_parameters)
+    nodedict, build_seconds = seconds_of(build, pgn_string)
+
+    tree_megabytes = ""
+    if measure_memory:
+        del nodedict
+        tracemalloc.start()
+        nodedict = build(pgn_string)
+        tree_megabytes = round(tracemalloc.get_traced_memory()[0] / 1e6, 2)
+        tracemalloc.stop()
+
+    target_node_ids = random.Random(0).sample(range(len(nodedict)), min(sample, len(nodedict)))
+    _, deviation_seconds = seconds_of(deviation_histories_of_all_nodes, nodedict)
+    _, rows_seconds = seconds_of(rows_of_targets, nodedict, target_node_ids)
+    _, report_seconds = seconds_of(characterize_gametree, nodedict)
+
+    return {"moves": number_of_moves,
+            "nodes": len(nodedict),
+            "pgn_mb": round(len(pgn_string.encode("utf-8")) / 1e6, 2),
+            "generate_s": round(generate_seconds, 3),
+            "build_s": round(build_seconds, 3),
+            "tree_mb": tree_megabytes,
+            "deviation_s": round(deviation_seconds, 3),
+            "rows_s": round(rows_seconds, 3),
+            "report_s": round(report_seconds, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 30_000, 100_000, 300_000, 1_000_000])
+    parser.add_argument("--sample", type=int, default=200, help="number of target nodes for which rows are built")
+    parser.add_argument("--no-memory", dest="measure_memory", action="store_false")
+    parser.add_argument("--output", default=None, help="path of CSV results")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--branching-factor", type=float, default=0.15)
+    parser.add_argument("--variation-depth", type=int, default=8)
+    parser.add_argument("--comment-density", type=float, default=0.02)
+    parser.add_argument("--nag-density", type=float, default=0.05)
+    args = parser.parse_args()
+
+    generator_parameters = dict(seed=args.seed,
+                                branching_factor=args.branching_factor,
+                                variation_depth=args.variation_depth,
+                                comment_density=args.comment_density,
+                                nag_density=args.nag_density)
+
+    writer = csv.DictWriter(sys.stdout, FIELDS)
+    writer.writeheader()
+    list_of_rows = []
+    for number_of_moves in args.sizes:
+        row = measure(number_of_moves, generator_parameters, args.sample, args.measure_memory)
+        writer.writerow(row)
+        sys.stdout.flush()
+        list_of_rows.append(row)
+
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writer = csv.DictWriter(file, FIELDS)
+            writer.writeheader()
+            writer.writerows(list_of_rows)
+
+
+if __name__ == "__main__":
+    main()
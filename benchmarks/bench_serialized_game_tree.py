@@ -0,0 +1,107 @@
+"""
+Benchmark of loading the game tree from its serializations against reparsing the PGN.
+
+For each input, reports the size (raw and gzip-compressed, the latter being what a browser would download) and the load
+time of:
+    • the PGN itself, loaded by parsing and building the tree (chess.pgn.read_game with PGNTreeBuilder);
+    • the JSON serialization (serialized_game_tree.game_tree_from_json);
+    • the msgpack serialization (serialized_game_tree.game_tree_from_msgpack);
+    • the compiled binary file (compiled_game_tree.load_compiled_game_tree), for comparison.
+
+Each serialization is also checked to round-trip exactly.
+
+Usage (from the project directory):
+    python benchmarks/bench_serialized_game_tree.py [--synthetic-moves N] [--repeat R]
+"""
+
+import argparse
+import glob
+import gzip
+import io
+import os
+import sys
+import tempfile
+import time
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_build_tree import DIRECTORY_OF_DEMO_PGNS
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.compiled_game_tree import load_compiled_game_tree
+from pgn4people_poc_demo.compiled_game_tree import write_compiled_game_tree
+from pgn4people_poc_demo.pgn_tree_builder import PGNTreeBuilder
+from pgn4people_poc_demo.serialized_game_tree import game_tree_from_json
+from pgn4people_poc_demo.serialized_game_tree import game_tree_from_msgpack
+from pgn4people_poc_demo.serialized_game_tree import game_tree_to_document
+from pgn4people_poc_demo.serialized_game_tree import game_tree_to_json
+from pgn4people_poc_demo.serialized_game_tree import game_tree_to_msgpack
+
+
+def best_seconds(repeat, function, *args):
+    """
+    Returns (best seconds of repeat calls of function(*args), result of the last call)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def parse_pgn(pgn_string):
+    return chess.pgn.read_game(io.StringIO(pgn_string), Visitor=PGNTreeBuilder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-moves", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = []
+    for pgn_filepath in sorted(glob.glob(os.path.join(DIRECTORY_OF_DEMO_PGNS, "*.pgn"))):
+        with open(pgn_filepath, "r") as file:
+            inputs.append((os.path.basename(pgn_filepath), file.read()))
+    if args.synthetic_moves:
+        inputs.append((f"synthetic ({args.synthetic_moves:,} moves)", synthetic_repertoire_pgn(args.synthetic_moves)))
+
+    header = f"{'input':<40} {'encoding':<9} {'KB':>8} {'gzip KB':>8} {'load ms':>9} {'vs PGN':>7} {'exact':>6}"
+    print(header)
+    print("-" * len(header))
+    for name, pgn_string in inputs:
+        parse_seconds, nodedict = best_seconds(args.repeat, parse_pgn, pgn_string)
+        document = game_tree_to_document(nodedict)
+
+        json_string = game_tree_to_json(nodedict)
+        msgpack_bytes = game_tree_to_msgpack(nodedict)
+        with tempfile.TemporaryDirectory() as directory:
+            compiled_filepath = os.path.join(directory, "tree.pgn4tree")
+            write_compiled_game_tree(nodedict, compiled_filepath)
+            with open(compiled_filepath, "rb") as file:
+                compiled_bytes = file.read()
+            compiled_seconds, compiled_tree = best_seconds(args.repeat, load_compiled_game_tree, compiled_filepath)
+            compiled_is_exact = game_tree_to_document(compiled_tree) == document
+            del compiled_tree
+
+        json_seconds, json_tree = best_seconds(args.repeat, game_tree_from_json, json_string)
+        msgpack_seconds, msgpack_tree = best_seconds(args.repeat, game_tree_from_msgpack, msgpack_bytes)
+
+        rows = (("PGN", pgn_string.encode("utf-8"), parse_seconds, True),
+                ("JSON", json_string.encode("utf-8"), json_seconds, game_tree_to_document(json_tree) == document),
+                ("msgpack", msgpack_bytes, msgpack_seconds, game_tree_to_document(msgpack_tree) == document),
+                ("compiled", compiled_bytes, compiled_seconds, compiled_is_exact))
+        for encoding, encoded_bytes, load_seconds, is_exact in rows:
+            print(f"{name:<40} {encoding:<9} {len(encoded_bytes) / 1e3:>8.1f} "
+                  f"{len(gzip.compress(encoded_bytes)) / 1e3:>8.1f} {load_seconds * 1e3:>9.2f} "
+                  f"{parse_seconds / load_seconds:>6.0f}× {'yes' if is_exact else 'NO':>6}")
+    print("\nload ms: time to obtain a usable tree (for PGN, parse and build). vs PGN: speedup over reparsing the PGN.")
+    print("The compiled file is mapped lazily, so its load time excludes the per-node decoding done when nodes are read.")
+
+
+if __name__ == "__main__":
+    main()
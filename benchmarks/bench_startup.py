@@ -0,0 +1,241 @@
+"""
+Startup benchmark: how long a fresh worker takes to import the app, to create it, and to serve its first page, with a
+breakdown of import time by package, checked against a startup budget.
+
+Each measurement runs in a fresh interpreter (--repeat times; medians are reported), as a newly spawned worker would:
+    interpreter     `python -c pass`, for reference
+    import          import of pgn4people_poc_demo
+    create_app      create_app()
+    ready           wall time from spawning the interpreter until create_app() returns
+    first_response  the first GET of a page (the tree being built from the PGN, or memory-mapped from its compiled file)
+    to_first_page   wall time from spawning the interpreter until the first page has been served
+for two scenarios:
+    pgn             the built-in PGN, parsed on the first request
+    compiled        a copy of the built-in PGN, with its compiled file (see compiled_game_tree.py), served from a
+                    temporary PGN library
+It also runs `python -X importtime` on the import and creation of the app and prints the import time of each top-level
+package (the sum of the “self” times of its modules), largest first, and lists the python-chess modules (and asyncio,
+which chess.pgn imports) loaded by create_app(); there should be none, since they are imported on first use.
+
+The run fails (exit status 1) if a median exceeds its target in STARTUP_BUDGET_SECONDS or if create_app() loads any of
+DEFERRED_MODULES. The targets are generous for a typical development machine (two to three times what one measures);
+they catch a heavy import slipping back onto the startup path rather than small drifts. --budget-scale scales them for a
+slower machine.
+
+Usage (from the project directory):
+    python benchmarks/bench_startup.py [--repeat R] [--top N] [--output results.json] [--budget-scale S]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, PROJECT_DIRECTORY)
+
+from pgn4people_poc_demo import constants
+from pgn4people_poc_demo.compile_pgn import compile_pgn_file
+
+# Targets, in seconds, of the medians of the measurements (see module docstring)
+STARTUP_BUDGET_SECONDS = {
+    "ready": 0.4,
+    "pgn to_first_page": 1.5,
+    "compiled to_first_page": 0.5,
+}
+
+# Modules that create_app() must not load: they are imported when first needed (see traverse.py)
+DEFERRED_MODULES = ("chess", "chess.pgn", "chess.svg", "chess.polyglot", "asyncio")
+
+PGN_ID_OF_COMPILED_SCENARIO = "startup"
+
+# Run in each fresh interpreter. Prints, as JSON, the timings (perf_counter seconds, and the time.time() at which the
+# first page had been served, for comparison with the parent’s time.time() at spawning), and the DEFERRED_MODULES
+# loaded by create_app().
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from pgn4people_poc_demo import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+created_at = time.time()
+loaded_modules = [name for name in DEFERRED_MODULES if name in sys.modules]
+
+url = "/node/0/0"
+if library_directory is not None:
+    from pgn4people_poc_demo import traverse
+    from pgn4people_poc_demo.game_tree_cache import GameTreeCache
+    from pgn4people_poc_demo.pgn_library import PGNLibrary
+    traverse.pgn_library = PGNLibrary(library_directory, GameTreeCache(traverse.build_nodedict_from_pgn_file))
+    url = "/" + pgn_id + "/node/0/0"
+
+client = app.test_client()
+before_request = time.perf_counter()
+status_code = client.get(url).status_code
+responded = time.perf_counter()
+responded_at = time.time()
+print(json.dumps({"import": imported - start, "create_app": created - imported,
+                  "first_response": responded - before_request, "created_at": created_at,
+                  "responded_at": responded_at, "status_code": status_code, "loaded_modules": loaded_modules}))
+"""
+
+
+def environment_of_child():
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, (PROJECT_DIRECTORY, environment.get("PYTHONPATH"))))
+    return environment
+
+
+def run_child(working_directory, library_directory):
+    """
+    Runs CHILD_SCRIPT in a fresh interpreter and returns its measurements, with "ready" and "to_first_page" (wall
+    seconds from spawning) added
+    """
+    script = (f"DEFERRED_MODULES = {DEFERRED_MODULES!r}\n"
+              f"library_directory = {library_directory!r}\n"
+              f"pgn_id = {PGN_ID_OF_COMPILED_SCENARIO!r}\n" + CHILD_SCRIPT)
+    spawned_at = time.time()
+    completed = subprocess.run([sys.executable, "-c", script], cwd=working_directory, env=environment_of_child(),
+                               capture_output=True, text=True, check=True)
+    measurements = json.loads(completed.stdout.splitlines()[-1])
+    if measurements["status_code"] != 200:
+        sys.exit(f"First request answered {measurements['status_code']}")
+    measurements["ready"] = measurements.pop("created_at") - spawned_at
+    measurements["to_first_page"] = measurements.pop("responded_at") - spawned_at
+    return measurements
+
+
+def seconds_of_interpreter(working_directory):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], cwd=working_directory, check=True)
+    return time.perf_counter() - start
+
+
+def import_seconds_by_package(working_directory):
+    """
+    Runs `python -X importtime` on the import and creation of the app and returns {top-level package: seconds}
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                "from pgn4people_poc_demo import create_app; create_app()"],
+                               cwd=working_directory, env=environment_of_child(), capture_output=True, text=True,
+                               check=True)
+    seconds_by_package = {}
+    for line in completed.stderr.splitlines():
+        # E.g., “import time:       284 |      87828 |     flask.json”, times in microseconds
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_microseconds, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        seconds_by_package[package] = seconds_by_package.get(package, 0) + int(self_microseconds) / 1e6
+    return seconds_by_package
+
+
+def median_of_each(list_of_dicts):
+    """
+    Returns {key: median of the numeric values of key across list_of_dicts} (a missing key counts as 0)
+    """
+    keys = {key for dictionary in list_of_dicts for key, value in dictionary.items() if isinstance(value, float)}
+    return {key: statistics.median(dictionary.get(key, 0.0) for dictionary in list_of_dicts) for key in keys}
+
+
+def run_benchmarks(repeat):
+    """
+    Returns the results: medians of every measurement of every scenario, import seconds by package, and the deferred
+    modules loaded by create_app()
+    """
+    results = {"scenarios": {}, "deferred_modules_loaded": []}
+    with tempfile.TemporaryDirectory() as working_directory:
+        library_directory = os.path.join(working_directory, "library")
+        os.mkdir(library_directory)
+        pgn_filepath = os.path.join(library_directory, PGN_ID_OF_COMPILED_SCENARIO + ".pgn")
+        shutil.copyfile(os.path.join(PROJECT_DIRECTORY, "pgn4people_poc_demo", constants.PATH_OF_PGN_FILE),
+                        pgn_filepath)
+        compile_pgn_file(pgn_filepath)
+
+        results["interpreter"] = statistics.median(seconds_of_interpreter(working_directory) for _ in range(repeat))
+        for scenario, scenario_library_directory in (("pgn", None), ("compiled", library_directory)):
+            list_of_measurements = [run_child(working_directory, scenario_library_directory) for _ in range(repeat)]
+            results["scenarios"][scenario] = median_of_each(list_of_measurements)
+            for measurements in list_of_measurements:
+                for name in measurements["loaded_modules"]:
+                    if name not in results["deferred_modules_loaded"]:
+                        results["deferred_modules_loaded"].append(name)
+
+        results["import_seconds_by_package"] = median_of_each([import_seconds_by_package(working_directory)
+                                                               for _ in range(repeat)])
+    return results
+
+
+def list_of_budget_failures(results, budget_scale):
+    """
+    Returns [(name, median seconds, target seconds)] for each target of STARTUP_BUDGET_SECONDS that is exceeded
+    """
+    failures = []
+    for name, target_seconds in STARTUP_BUDGET_SECONDS.items():
+        if " " in name:
+            scenario, measurement = name.split(" ")
+            seconds = results["scenarios"][scenario][measurement]
+        else:
+            seconds = max(measurements[name] for measurements in results["scenarios"].values())
+        if seconds > target_seconds * budget_scale:
+            failures.append((name, seconds, target_seconds * budget_scale))
+    return failures
+
+
+def print_results(results, top):
+    print(f"Median of each measurement, in ms (interpreter alone: {1000 * results['interpreter']:.1f} ms)")
+    measurement_names = ("import", "create_app", "ready", "first_response", "to_first_page")
+    print(f"{'scenario':<10}" + "".join(f"{name:>16}" for name in measurement_names))
+    for scenario, medians in results["scenarios"].items():
+        print(f"{scenario:<10}" + "".join(f"{1000 * medians[name]:>16.1f}" for name in measurement_names))
+
+    seconds_by_package = results["import_seconds_by_package"]
+    total_seconds = sum(seconds_by_package.values())
+    print(f"\nImport time of create_app() by top-level package (python -X importtime; "
+          f"total {1000 * total_seconds:.1f} ms)")
+    for package, seconds in sorted(seconds_by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"    {package:<30} {1000 * seconds:>8.1f} ms {seconds / total_seconds:>6.0%}")
+
+    loaded = results["deferred_modules_loaded"]
+    print(f"\nDeferred modules loaded by create_app(): {', '.join(loaded) if loaded else 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=12, help="number of packages in the import-time breakdown")
+    parser.add_argument("--output", default=None, help="path of JSON results")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="factor applied to every target")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat)
+    print_results(results, args.top)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4, sort_keys=True)
+            file.write("\n")
+
+    failures = list_of_budget_failures(results, args.budget_scale)
+    if results["deferred_modules_loaded"]:
+        failures.append(("deferred modules", len(results["deferred_modules_loaded"]), 0))
+    if not failures:
+        print("\nWithin the startup budget")
+        return
+    print("\nStartup budget exceeded:")
+    for name, value, target in failures:
+        if name == "deferred modules":
+            print(f"    create_app() loaded {value} module(s) that should be imported on first use")
+        else:
+            print(f"    {name:<25} {1000 * value:>8.1f} ms vs target {1000 * target:>8.1f} ms")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
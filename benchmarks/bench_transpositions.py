@@ -0,0 +1,93 @@
+"""
+Benchmark of the transposition index (see pgn4people_poc_demo/transpositions.py): how much merging transpositions
+reduces the size of each tree, and what the index costs.
+
+For each input, builds the GameTree and its TranspositionIndex, and reports:
+    • nodes of the tree, distinct positions (nodes of the transposition DAG), and positions reached by more than one
+      node;
+    • the reduction, by the merge, in the number of nodes and in the number of edges;
+    • memory held by the tree, and the memory that a tree with one node per position would hold (the tree’s memory per
+      node times the number of positions);
+    • memory held by the index, and the time to build it.
+
+Runs on every built-in demo PGN and on a synthetic repertoire of (by default) 20,000 moves. (The synthetic repertoire
+chooses moves at random, so it has far fewer transpositions than a real repertoire; it measures the cost of the index
+rather than the benefit of the merge.)
+
+Usage (from the project directory):
+    python benchmarks/bench_transpositions.py [--synthetic-moves N] [--repeat R]
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import chess.pgn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_build_tree import DIRECTORY_OF_DEMO_PGNS
+from synthetic_repertoire import synthetic_repertoire_pgn
+
+from pgn4people_poc_demo.pgn_tree_builder import PGNTreeBuilder
+from pgn4people_poc_demo.transpositions import build_transposition_index
+
+
+def traced_megabytes(function, *args, **kwargs):
+    """
+    Returns (result of function(*args, **kwargs), MB of memory held by that result once function returns)
+    """
+    tracemalloc.start()
+    result = function(*args, **kwargs)
+    resident_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, resident_bytes / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic-moves", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = []
+    for pgn_filepath in sorted(glob.glob(os.path.join(DIRECTORY_OF_DEMO_PGNS, "*.pgn"))):
+        with open(pgn_filepath, "r") as file:
+            inputs.append((os.path.basename(pgn_filepath), file.read()))
+    if args.synthetic_moves:
+        inputs.append((f"synthetic ({args.synthetic_moves:,} moves)", synthetic_repertoire_pgn(args.synthetic_moves)))
+
+    header = (f"{'input':<40} {'nodes':>8} {'positions':>9} {'transp.':>7} {'node -%':>7} {'edge -%':>7} "
+              f"{'tree MB':>8} {'merged MB':>9} {'index MB':>8} {'index s':>8}")
+    print(header)
+    print("-" * len(header))
+    for name, pgn_string in inputs:
+        tree, tree_megabytes = traced_megabytes(chess.pgn.read_game, io.StringIO(pgn_string),
+                                                Visitor=PGNTreeBuilder)
+
+        index_seconds = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            build_transposition_index(tree)
+            index_seconds = min(index_seconds, time.perf_counter() - start)
+        transposition_index, index_megabytes = traced_megabytes(build_transposition_index, tree)
+
+        report = transposition_index.merge_report()
+        merged_megabytes = tree_megabytes * report["number_of_positions"] / report["number_of_nodes"]
+        print(f"{name:<40} {report['number_of_nodes']:>8} {report['number_of_positions']:>9} "
+              f"{report['number_of_transposed_positions']:>7} {100 * report['node_reduction']:>7.2f} "
+              f"{100 * report['edge_reduction']:>7.2f} {tree_megabytes:>8.2f} {merged_megabytes:>9.2f} "
+              f"{index_megabytes:>8.2f} {index_seconds:>8.3f}")
+        del tree, transposition_index
+    print("\ntransp.: positions reached by more than one node. node -%, edge -%: reduction by the merge. "
+          "merged MB: estimated memory of a tree with one node per position. index MB, index s: memory held by, and "
+          "time to build, the TranspositionIndex.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Generator of synthetic opening repertoires—legal, deeply nested PGN of any size—for load and scaling tests.
+
+A repertoire is generated in two phases, both with a fixed seed, so that the same parameters always yield the same
+PGN:
+    1. The tree is grown in compact arrays (parent, first child, next sibling, packed move, nesting depth, NAG, and
+       whether a comment follows), one line at a time. A line is extended from a node by choosing legal moves at random
+       on a chess.Board; after each move, each of a number of alternatives to that move (branching_factor on average) is
+       scheduled as a new line, one variation level deeper, unless that would exceed variation_depth. Scheduled lines
+       are taken in random order, which keeps the tree from being lopsided. Lines continue to be taken (and, when none
+       is scheduled, started at random nodes) until the tree has number_of_moves moves.
+    2. The tree is written as PGN, depth first, with each variation after the move for which it is an alternative,
+       move numbers where PGN requires them, and NAGs and comments where phase 1 placed them.
+Holding the tree in arrays rather than as chess.pgn.GameNode objects keeps memory to a few tens of bytes per move, so
+that repertoires of millions of moves can be generated (at roughly 7,000 moves per second, most of it python-chess
+move generation).
+
+The resulting tree has number_of_moves + 1 nodes (counting the initial node).
+
+Usage (from the project directory):
+    python benchmarks/synthetic_repertoire.py NUMBER_OF_MOVES [-o path.pgn] [--seed S] [--branching-factor B]
+                                              [--variation-depth D] [--max-variation-length L] [--max-ply P]
+                                              [--comment-density C] [--nag-density N]
+"""
+
+import argparse
+from array import array
+import io
+import os
+import random
+import sys
+
+import chess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pgn4people_poc_demo.compact_game_tree import decode_move_code
+from pgn4people_poc_demo.compact_game_tree import encode_move_uci
+
+NO_NODE = -1
+
+# Number of consecutive attempts to start a line that adds no move, after which growth stops (the tree then being
+# unable to grow within variation_depth and max_ply)
+MAXIMUM_NUMBER_OF_FAILED_STARTS = 10_000
+
+# NAGs attached at random: move assessments ($1–$6) and positional assessments ($10, $13–$19)
+LIST_OF_NAGS = (1, 2, 3, 4, 5, 6, 10, 13, 14, 15, 16, 17, 18, 19)
+
+WORDS_OF_COMMENTS = ("the", "idea", "is", "to", "play", "for", "a", "kingside", "queenside", "attack", "with", "pawn",
+                     "break", "center", "white", "black", "keeps", "slight", "edge", "equal", "chances", "endgame",
+                     "pressure", "on", "file", "diagonal", "bishop", "pair", "knight", "outpost", "plan", "typical",
+                     "maneuver", "counterplay", "initiative", "weak", "square", "structure", "main", "line", "sideline")
+
+MAXIMUM_WIDTH_OF_PGN_LINE = 79
+
+
+class SyntheticTree:
+    """
+    A synthetic repertoire’s tree, in arrays indexed by node (0 being the initial node); see module docstring
+    """
+
+    __slots__ = {
+        "parent": "array('i'): parent node (NO_NODE for the initial node)",
+        "first_child": "array('i'): first child (the main-line continuation), or NO_NODE",
+        "last_child": "array('i'): last child, or NO_NODE, so that a child can be appended in O(1)",
+        "next_sibling": "array('i'): next child of the parent, or NO_NODE",
+        "move_code": "array('H'): the move leading to the node, packed by encode_move_uci()",
+        "nesting": "array('B'): variation depth of the node (0 on the main line)",
+        "nag": "array('B'): NAG of the move leading to the node, or 0",
+        "has_comment": "array('B'): 1 if a comment follows the move leading to the node",
+    }
+
+    def __init__(self):
+        self.parent = array('i', [NO_NODE])
+        self.first_child = array('i', [NO_NODE])
+        self.last_child = array('i', [NO_NODE])
+        self.next_sibling = array('i', [NO_NODE])
+        self.move_code = array('H', [0])
+        self.nesting = array('B', [0])
+        self.nag = array('B', [0])
+        self.has_comment = array('B', [0])
+
+
+    def __len__(self):
+        return len(self.parent)
+
+
+    def add_child(self, parent, move, nesting, nag, has_comment):
+        """
+        Appends a node reached from parent by move, and returns its index
+        """
+        node = len(self.parent)
+        self.parent.append(parent)
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.move_code.append(encode_move_uci(move.uci()))
+        self.nesting.append(nesting)
+        self.nag.append(nag)
+        self.has_comment.append(has_comment)
+        if self.first_child[parent] == NO_NODE:
+            self.first_child[parent] = node
+        else:
+            self.next_sibling[self.last_child[parent]] = node
+        self.last_child[parent] = node
+        return node
+
+
+    def children(self, node):
+        child = self.first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+
+    def move(self, node):
+        return chess.Move.from_uci(decode_move_code(self.move_code[node]))
+
+
+    def board(self, node):
+        """
+        Returns the chess.Board of node, by replaying the moves from the initial position
+        """
+        moves = []
+        while node != 0:
+            moves.append(self.move(node))
+            node = self.parent[node]
+        board = chess.Board()
+        for move in reversed(moves):
+            board.push(move)
+        return board
+
+
+def grow_tree(number_of_moves, random_generator, branching_factor, variation_depth, max_variation_length, max_ply,
+              comment_density, nag_density):
+    """
+    Returns a SyntheticTree of number_of_moves moves (phase 1 of the module docstring)
+    """
+    tree = SyntheticTree()
+
+    # Each scheduled line is (node from which to extend, nesting depth of the line, maximum length of the line)
+    scheduled_lines = [(0, 0, max_ply)]
+    number_of_consecutive_failed_starts = 0
+    while len(tree) <= number_of_moves:
+        if scheduled_lines:
+            index = random_generator.randrange(len(scheduled_lines))
+            scheduled_lines[index], scheduled_lines[-1] = scheduled_lines[-1], scheduled_lines[index]
+            node, nesting, max_length = scheduled_lines.pop()
+        else:
+            # Every scheduled line has been played out; starts an alternative at a random node
+            node = random_generator.randrange(len(tree))
+            nesting = tree.nesting[node] + (tree.first_child[node] != NO_NODE)
+            max_length = max_variation_length
+
+        if nesting > variation_depth:
+            number_of_consecutive_failed_starts += 1
+            if number_of_consecutive_failed_starts > MAXIMUM_NUMBER_OF_FAILED_STARTS:
+                break
+            continue
+        board = tree.board(node)
+        moves_already_played = {tree.move(child) for child in tree.children(node)}
+        max_length = min(max_length, max_ply - board.ply())
+        number_of_moves_of_line = 0
+        while number_of_moves_of_line < max_length and len(tree) <= number_of_moves:
+            legal_moves = [move for move in board.legal_moves if move not in moves_already_played]
+            if not legal_moves:
+                break
+            move = random_generator.choice(legal_moves)
+
+            number_of_alternatives = int(branching_factor)
+            if random_generator.random() < branching_factor - number_of_alternatives:
+                number_of_alternatives += 1
+            if nesting < variation_depth:
+                for _ in range(number_of_alternatives):
+                    scheduled_lines.append((node, nesting + 1, random_generator.randint(1, max_variation_length)))
+
+            nag = random_generator.choice(LIST_OF_NAGS) if random_generator.random() < nag_density else 0
+            has_comment = 1 if random_generator.random() < comment_density else 0
+            node = tree.add_child(node, move, nesting, nag, has_comment)
+            board.push(move)
+            moves_already_played = set()
+            number_of_moves_of_line += 1
+
+        if number_of_moves_of_line:
+            number_of_consecutive_failed_starts = 0
+        else:
+            number_of_consecutive_failed_starts += 1
+            if number_of_consecutive_failed_starts > MAXIMUM_NUMBER_OF_FAILED_STARTS:
+                break
+
+    return tree
+
+
+class PGNWriter:
+    """
+    Writes tokens of movetext to file, separated by spaces and wrapped at MAXIMUM_WIDTH_OF_PGN_LINE
+    """
+
+    __slots__ = ("file", "width_of_line")
+
+    def __init__(self, file):
+        self.file = file
+        self.width_of_line = 0
+
+
+    def write_token(self, token):
+        if self.width_of_line and self.width_of_line + 1 + len(token) > MAXIMUM_WIDTH_OF_PGN_LINE:
+            self.file.write("\n")
+            self.width_of_line = 0
+        elif self.width_of_line:
+            self.file.write(" ")
+            self.width_of_line += 1
+        self.file.write(token)
+        self.width_of_line += len(token)
+
+
+def write_tree_as_pgn(tree, file, random_generator):
+    """
+    Writes tree as the movetext of a PGN game (phase 2 of the module docstring)
+    """
+    writer = PGNWriter(file)
+    board = chess.Board()
+
+    def write_move(node, needs_move_number):
+        move = tree.move(node)
+        if board.turn == chess.WHITE:
+            writer.write_token(f"{board.fullmove_number}.")
+        elif needs_move_number:
+            writer.write_token(f"{board.fullmove_number}...")
+        writer.write_token(board.san(move))
+        if tree.nag[node]:
+            writer.write_token(f"${tree.nag[node]}")
+        if tree.has_comment[node]:
+            words = random_generator.choices(WORDS_OF_COMMENTS, k=random_generator.randint(3, 12))
+            for index_of_word, word in enumerate(words):
+                writer.write_token(("{" if index_of_word == 0 else "") + word
+                                   + ("}" if index_of_word == len(words) - 1 else ""))
+        return tree.has_comment[node]
+
+    def write_line(node, needs_move_number):
+        # Writes the moves that follow node, iteratively along the main line of the line and recursively into its
+        # variations, leaving board as it found it. Recursion depth is thus bounded by the variation depth.
+        number_of_moves_pushed = 0
+        child = tree.first_child[node]
+        while child != NO_NODE:
+            needs_move_number = write_move(child, needs_move_number)
+            alternative = tree.next_sibling[child]
+            while alternative != NO_NODE:
+                writer.write_token("(")
+                needs_move_number_in_variation = write_move(alternative, True)
+                board.push(tree.move(alternative))
+                write_line(alternative, needs_move_number_in_variation)
+                board.pop()
+                writer.write_token(")")
+                needs_move_number = True
+                alternative = tree.next_sibling[alternative]
+            board.push(tree.move(child))
+            number_of_moves_pushed += 1
+            child = tree.first_child[child]
+        for _ in range(number_of_moves_pushed):
+            board.pop()
+
+    write_line(0, True)
+    writer.write_token("*")
+    file.write("\n")
+
+
+def write_synthetic_repertoire(file, number_of_moves, seed=0, branching_factor=0.15, variation_depth=8,
+                               max_variation_length=20, max_ply=80, comment_density=0.02, nag_density=0.05):
+    """
+    Writes to file a PGN game of a legal, nested repertoire of number_of_moves moves (see module docstring):
+        branching_factor        average number of alternatives to each move
+        variation_depth         maximum depth to which variations are nested (0: main line only)
+        max_variation_length    maximum length, in halfmoves, of a variation (not counting its own variations)
+        max_ply                 maximum ply of any node
+        comment_density         fraction of moves followed by a comment
+        nag_density             fraction of moves with a NAG
+    Returns the number of moves written, which is less than number_of_moves only if no more could be fit within
+    variation_depth and max_ply.
+    """
+    random_generator = random.Random(seed)
+    tree = grow_tree(number_of_moves, random_generator, branching_factor, variation_depth, max_variation_length,
+                     max_ply, comment_density, nag_density)
+    file.write(f'[Event "Synthetic repertoire"]\n[Site "?"]\n[Date "????.??.??"]\n[Round "?"]\n'
+               f'[White "{number_of_moves} moves"]\n[Black "seed {seed}"]\n[Result "*"]\n\n')
+    write_tree_as_pgn(tree, file, random_generator)
+    return len(tree) - 1
+
+
+def synthetic_repertoire_pgn(number_of_moves, seed=0, **parameters):
+    """
+    Returns, as a string, the PGN written by write_synthetic_repertoire()
+    """
+    file = io.StringIO()
+    write_synthetic_repertoire(file, number_of_moves, seed, **parameters)
+    return file.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("number_of_moves", type=int)
+    parser.add_argument("-o", "--output", default=None, help="path of the PGN file (default: standard output)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--branching-factor", type=float, default=0.15)
+    parser.add_argument("--variation-depth", type=int, default=8)
+    parser.add_argument("--max-variation-length", type=int, default=20)
+    parser.add_argument("--max-ply", type=int, default=80)
+    parser.add_argument("--comment-density", type=float, default=0.02)
+    parser.add_argument("--nag-density", type=float, default=0.05)
+    args = parser.parse_args()
+
+    parameters = dict(seed=args.seed,
+                      branching_factor=args.branching_factor,
+                      variation_depth=args.variation_depth,
+                      max_variation_length=args.max_variation_length,
+                      max_ply=args.max_ply,
+                      comment_density=args.comment_density,
+                      nag_density=args.nag_density)
+    if args.output is None:
+        number_of_moves_written = write_synthetic_repertoire(sys.stdout, args.number_of_moves, **parameters)
+    else:
+        with open(args.output, "w") as file:
+            number_of_moves_written = write_synthetic_repertoire(file, args.number_of_moves, **parameters)
+    print(f"{number_of_moves_written:,} moves written", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
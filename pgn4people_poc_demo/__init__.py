@@ -6,14 +6,24 @@ from flask import render_template
 from . constants import (LOGGING_LEVEL,
                          LOG_FILE_NAME,
                          LOGGING_FORMAT)
-from . import experimental
-from . import traverse
 
 
 from . __version__ import __version__
 
 
-logging.basicConfig(level=LOGGING_LEVEL, filename=LOG_FILE_NAME, format=LOGGING_FORMAT)
+def configure_logging(app):
+    """
+    Configures the root logger from the app’s config (LOGGING_LEVEL, LOG_FILE_NAME, and LOGGING_FORMAT, which default
+    to the values in constants.py; a LOG_FILE_NAME of None logs to stderr).
+
+    Done by create_app() rather than on import of the package, so that merely importing the package (e.g., by the
+    command-line tools or benchmarks) neither opens the log file nor overrides the importer’s logging. As with
+    logging.basicConfig(), nothing is changed if the root logger already has handlers (e.g., those of the WSGI server).
+    """
+    logging.basicConfig(level=app.config.get("LOGGING_LEVEL", LOGGING_LEVEL),
+                        filename=app.config.get("LOG_FILE_NAME", LOG_FILE_NAME),
+                        format=app.config.get("LOGGING_FORMAT", LOGGING_FORMAT))
+
 
 def create_app(test_config=None):
     # Create and configure the app
@@ -26,6 +36,15 @@ def create_app(test_config=None):
     # overridden if this file exists in the instance folder
     app.config.from_pyfile('config.py', silent=True)
 
+    configure_logging(app)
+
+    # Imported here, as the Flask tutorial does, so that importing the package does not import the views and
+    # everything they import. (Nor do the views import python-chess until it is first needed; see traverse.py.)
+    from . import api
+    from . import experimental
+    from . import metrics
+    from . import traverse
+
     @app.route("/")
     def index():
         # Index has no independent function; it returns the tree-traversal, reset to 0.
@@ -39,5 +58,7 @@ def create_app(test_config=None):
    
     app.register_blueprint(traverse.blueprint)
     app.register_blueprint(experimental.blueprint)
+    app.register_blueprint(api.blueprint)
+    app.register_blueprint(metrics.blueprint)
 
     return app
@@ -0,0 +1,203 @@
+"""
+JSON API for navigating the game tree without reloading the page: '/api/line/<target>/<board>' and
+'/api/subtree/<node_id>'.
+
+/api/line/<target_node_id>/<node_id_for_board> returns as data what /node/<target_node_id>/<node_id_for_board> renders
+as HTML:
+    {
+        "target_node_id":       target_node_id,
+        "node_id_for_board":    node_id_for_board,
+        "rows":                 [row, ...],
+        "board":                board,
+        "comments":             comments,
+    }
+where each row is as returned by variations_table.structured_row_of_variations_line() (the invisible faux first row is
+omitted), and board and comments are as described in display_chess_board.board_of_node() and
+display_text_comments.comments_of_node().
+
+/api/subtree/<node_id>?plies=n returns the nodes within n plies (default API_SUBTREE_DEFAULT_PLIES) below node_id,
+together with everything needed to show each of them on the board and in the text-annotation area, so that a client
+can step along the moves of a line it already shows without asking the server again:
+    {
+        "root_node_id":     node_id,
+        "plies":            n,
+        "is_truncated":     true iff nodes within n plies were omitted to respect API_SUBTREE_MAXIMUM_NODES,
+        "node_fields":      SUBTREE_NODE_FIELDS,
+        "nodes":            [node, ...],
+    }
+Each node is a list of values in the order of SUBTREE_NODE_FIELDS (as in serialized_game_tree.py, to keep the response
+small); its "edges" are the destination node_ids of all of its edges, in order of reference index, whether or not they
+fall within the slice. Nodes are listed breadth first, beginning with node_id itself.
+
+/api/prefetch/<target_node_id>/<node_id_for_board> returns the prefetch bundle of the view
+/node/<target_node_id>/<node_id_for_board>: the tables of the lines reachable from it with one click, as deltas from its
+own table (see prefetch_bundle.py).
+
+Like the pages they mirror, responses carry a strong ETag and a public Cache-Control header (see
+traverse.set_caching_headers_of_page()).
+"""
+
+from collections import deque
+
+from flask import Blueprint
+from flask import jsonify
+from flask import make_response
+from flask import request
+
+from . import constants
+from . display_chess_board import board_of_node
+from . display_text_comments import comments_of_node
+from . game_tree import deviation_history_of_node
+from . game_tree import memoize_fens_of_subtree
+from . prefetch_bundle import prefetch_bundle_of_view
+from . traverse import game_tree_cache
+from . traverse import path_of_built_in_pgn_file
+from . traverse import set_caching_headers_of_page
+from . variations_table import list_of_row_fragments_for_variations_table
+from . __version__ import __version__
+
+blueprint = Blueprint('api', __name__, url_prefix='/api')
+
+SUBTREE_NODE_FIELDS = ("node_id", "originatingnode_id", "fen", "last_move", "check", "movetext", "precomment",
+                       "postcomment", "edges")
+
+
+@blueprint.route('/line/<int:target_node_id>/<int:node_id_for_board>')
+def line(target_node_id, node_id_for_board):
+    """
+    Returns, as JSON, the variations table with target_node_id elevated to the main line, and the board and comments
+    for node_id_for_board (see module docstring).
+    """
+    game_tree_entry = game_tree_cache.get_entry(path_of_built_in_pgn_file())
+    nodedict = game_tree_entry.nodedict
+
+    for node_id in (target_node_id, node_id_for_board):
+        if node_id not in nodedict:
+            return error_response(f"No node {node_id}", 404)
+
+    etag = etag_for_api_response(game_tree_entry.content_hash, "line", target_node_id, node_id_for_board)
+    if request.if_none_match.contains(etag):
+        return response_with_caching_headers(make_response("", 304), etag)
+
+    deviation_history = deviation_history_of_node(nodedict, target_node_id)
+    list_of_row_fragments = list_of_row_fragments_for_variations_table(nodedict, deviation_history)
+    rows = [row_fragment.structured_row() for row_fragment in list_of_row_fragments if not row_fragment.is_first_row]
+
+    document = {
+                "target_node_id": target_node_id,
+                "node_id_for_board": node_id_for_board,
+                "rows": rows,
+                "board": board_of_node(nodedict, node_id_for_board),
+                "comments": comments_of_node(nodedict, node_id_for_board),
+               }
+    return response_with_caching_headers(jsonify(document), etag)
+
+
+@blueprint.route('/subtree/<int:root_node_id>')
+def subtree(root_node_id):
+    """
+    Returns, as JSON, the nodes within the requested number of plies below root_node_id (see module docstring).
+    """
+    game_tree_entry = game_tree_cache.get_entry(path_of_built_in_pgn_file())
+    nodedict = game_tree_entry.nodedict
+
+    if root_node_id not in nodedict:
+        return error_response(f"No node {root_node_id}", 404)
+
+    plies = request.args.get("plies", default=constants.API_SUBTREE_DEFAULT_PLIES, type=int)
+    if not 0 <= plies <= constants.API_SUBTREE_MAXIMUM_PLIES:
+        return error_response(f"plies must be an integer from 0 through {constants.API_SUBTREE_MAXIMUM_PLIES}", 400)
+
+    etag = etag_for_api_response(game_tree_entry.content_hash, "subtree", root_node_id, plies)
+    if request.if_none_match.contains(etag):
+        return response_with_caching_headers(make_response("", 304), etag)
+
+    list_of_node_ids, is_truncated = node_ids_of_subtree(nodedict, root_node_id, plies,
+                                                         constants.API_SUBTREE_MAXIMUM_NODES)
+    memoize_fens_of_subtree(nodedict, root_node_id, set(list_of_node_ids[1:]))
+
+    nodes = []
+    for node_id in list_of_node_ids:
+        node = nodedict[node_id]
+        board = board_of_node(nodedict, node_id)
+        comments = comments_of_node(nodedict, node_id)
+        nodes.append([node_id,
+                      node.originatingnode_id,
+                      board["fen"],
+                      board["last_move"],
+                      board["check"],
+                      comments["movetext"],
+                      comments["precomment"],
+                      comments["postcomment"],
+                      list(nodedict.destination_node_ids_of(node_id))])
+
+    document = {
+                "root_node_id": root_node_id,
+                "plies": plies,
+                "is_truncated": is_truncated,
+                "node_fields": list(SUBTREE_NODE_FIELDS),
+                "nodes": nodes,
+               }
+    return response_with_caching_headers(jsonify(document), etag)
+
+
+@blueprint.route('/prefetch/<int:target_node_id>/<int:node_id_for_board>')
+def prefetch(target_node_id, node_id_for_board):
+    """
+    Returns, as JSON, the prefetch bundle of the view /node/<target_node_id>/<node_id_for_board> (see module
+    docstring).
+    """
+    game_tree_entry = game_tree_cache.get_entry(path_of_built_in_pgn_file())
+    nodedict = game_tree_entry.nodedict
+
+    for node_id in (target_node_id, node_id_for_board):
+        if node_id not in nodedict:
+            return error_response(f"No node {node_id}", 404)
+
+    etag = etag_for_api_response(game_tree_entry.content_hash, "prefetch", target_node_id, node_id_for_board,
+                                 constants.PREFETCH_BUNDLE_BYTE_BUDGET)
+    if request.if_none_match.contains(etag):
+        return response_with_caching_headers(make_response("", 304), etag)
+
+    bundle = prefetch_bundle_of_view(nodedict, target_node_id, node_id_for_board, constants.PREFETCH_BUNDLE_BYTE_BUDGET)
+    return response_with_caching_headers(jsonify(bundle), etag)
+
+
+def node_ids_of_subtree(nodedict, root_node_id, plies, maximum_number_of_nodes):
+    """
+    Returns (list_of_node_ids, is_truncated): the node_ids within plies plies below root_node_id, breadth first and
+    beginning with root_node_id, but no more than maximum_number_of_nodes of them; and whether any were left out for
+    that reason.
+    """
+    list_of_node_ids = [root_node_id]
+    queue = deque([(root_node_id, 0)])
+    while queue:
+        node_id, ply = queue.popleft()
+        if ply == plies:
+            continue
+        for destination_node_id in nodedict.destination_node_ids_of(node_id):
+            if len(list_of_node_ids) == maximum_number_of_nodes:
+                return list_of_node_ids, True
+            list_of_node_ids.append(destination_node_id)
+            queue.append((destination_node_id, ply + 1))
+    return list_of_node_ids, False
+
+
+def etag_for_api_response(content_hash, endpoint_name, *parameters):
+    """
+    Returns the (strong) ETag of an API response: derived, like a page’s (see traverse.etag_for_page()), from the PGN’s
+    content hash, the app version, the endpoint, and the request’s parameters.
+    """
+    return "-".join([content_hash[:20], __version__, endpoint_name, *map(str, parameters)])
+
+
+def response_with_caching_headers(response, etag):
+    set_caching_headers_of_page(response, etag)
+    return response
+
+
+def error_response(message, status_code):
+    """
+    Returns a JSON error response, {"error": message}, with the given status code
+    """
+    return make_response(jsonify(error=message), status_code)
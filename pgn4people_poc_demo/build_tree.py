@@ -1,10 +1,12 @@
-""" Exports the buildtree() function """
+""" Exports the buildtree() function and the GameTreeBuilder class on which it is based """
 
 import logging
 
 from . classes_arboreal import Edge
 from . classes_arboreal import GameNode
+from . classes_arboreal import GameTree
 from . constants import (
+                              BUILD_TRANSPOSITION_INDEX,
                               CLOSE_VARIATION_INDICATOR,
                               COMMENT_INDICATOR,
                               FEN_INITIAL,
@@ -15,8 +17,8 @@ from . constants import (
                               UNDEFINED_TREEISH_VALUE,
                               )
 from . error_processing import fatal_pgn_error
-from . python_chess_utilities import update_position_with_move_uci
-# from . import pgn_tokenizer
+from . principal_lines import principal_line_index_of
+from . transpositions import transposition_index_of
 
 
 def buildtree(tokenized_game):
@@ -24,273 +26,398 @@ def buildtree(tokenized_game):
     Build the game tree—as a dictionary (“gamenodes”) of game nodes—from supplied tokenized_game, which is an object of
     class TokenizedGame.
     
-    Return gamenodes.
+    Return gamenodes, an instance of GameTree (a dict subclass that also carries the tree’s node-ID sets).
+
+    The tree is built by feeding each token, in order, to an instance of GameTreeBuilder. The same builder is fed
+    directly by the visitor PGNTreeBuilder (see pgn_tree_builder.py) when the PGN is parsed without first being
+    tokenized.
 
     See generally pgn4people-poc/docs/game-tree-concepts.md
     """
 
-    ###############   Initializations  ###############
-    # Initialize empty dictionaries
-    # gamenodes is indexed by a node_id
-    gamenodes = {}
-    # current_halfmovenumber is indexed by depth
-    current_halfmovenumber = {}
-    # current_originatingnode_id is indexed by depth
-    current_originatingnode_id = {}
-    # latest_mainline_destination is indexed by depth
-    latest_mainline_destination = {}
-    # Initializes empty movetext_dict
-    movetext_dict = {}
-    # Initialize string to hold a comment that occurs at the beginning of a variation, i.e., before the first move
-    # of that variation
-    comment_at_beginning_of_a_variation = ""
- 
-    # Initializations to begin the looping through tokens
-    # The first movetext token is necessarily the main line and thus depth=0
-    depth = 0
-    # The first movetext token is White's first move, which has halfmovenumber=1, and depth=0
-    current_halfmovenumber[depth] = 1
-
-    # FEN for initial position
-    fen_for_initial_node = FEN_INITIAL
-
-    # Create the id=constants.INITIAL_NODE_ID=0 node corresponding to the initial position (and to White's first move)
-    originating_node_id_of_initial_node = UNDEFINED_TREEISH_VALUE
-    new_node = GameNode(depth = depth,
-                       halfmovenumber = current_halfmovenumber[depth],
-                       fen = fen_for_initial_node,
-                       originating_node_id = originating_node_id_of_initial_node,
-                       node_id = INITIAL_NODE_ID)
-    # Adds this new node as the first node in the gamenodes dictionary
-    gamenodes[INITIAL_NODE_ID] = new_node
-
-    lastcreated_node_id = INITIAL_NODE_ID
-
-    # The next node at current depth (0) will be spawned from node with id zero.
-    current_originatingnode_id[depth]=INITIAL_NODE_ID
-    # Node_id for the next node to be created
-    current_node_id = 1
-
-    # Initializes boolean variables that are meant to be true only if the current movetext was immediately
-    # preceded by a closed/open parenthesis, respectively
-    is_preceded_by_open_paren = False
-    is_preceded_by_closed_paren = False
-
-    # Initializes Boolean variation to apply constraints that apply only to the first
-    are_awaiting_first_movetext_token = True
-
-    # Most-recent previous token, to apply constraints based on what kinds of tokens can or cannot immediately follow
-    # other kinds of tokens
-    most_recently_found_token_type = "root"
-
-    # When a comment is encountered BEFORE the movetext to which it applies, the variable
-    # comment_at_beginning_of_a_variation is set to that comment text to await the next node created, and then that
-    # comment will be attached to that node.
-    # This variable must be reset to None everytime it is transferred to a node, because the way a node knows whether
-    # there is a preceding comment to attach is by checking whether this variable is None.
-    # There are two cases where this scenario can occur: (a) If there is a comment at the beginning of the PGN, i.e.,
-    # before the first movetext or (b) if there is a comment at the beginning of a variation (i.e., immediately after
-    # the “(” that begins the variation (before the first movetext of the variation).
-
-    comment_at_beginning_of_a_variation = None
+    builder = GameTreeBuilder()
+    for (tagname, tagvalue) in tokenized_game.headers:
+        builder.store_header(tagname, tagvalue)
 
     tokenlist = tokenized_game.tokenlist
     for token in tokenlist:
         token_type = token[0]
 
-        if are_awaiting_first_movetext_token:
-            if token_type in (OPEN_VARIATION_INDICATOR, CLOSE_VARIATION_INDICATOR, NAG_INDICATOR):
-                error_string = (f"Token type {token_type} encountered before first movetext token.\n",
-                                f"½#: {current_halfmovenumber[depth]}, token: {token}")
-                fatal_pgn_error(error_string)
-
-            # Check for a comment before even the first movetext
-            if token_type == COMMENT_INDICATOR:
-                # There is a comment before the first move of a game. This comment is assigned to the root node
-                comment_at_beginning_of_a_variation = token[1]
-                gamenodes[INITIAL_NODE_ID].comment = comment_at_beginning_of_a_variation
-                most_recently_found_token_type = COMMENT_INDICATOR
-
-                # Resets comment_at_beginning_of_a_variation
-                comment_at_beginning_of_a_variation = None
-                continue # Proceeds to the next token
-
-        if token_type == COMMENT_INDICATOR:
-            if most_recently_found_token_type in (COMMENT_INDICATOR, CLOSE_VARIATION_INDICATOR):
-                error_string = (f"Comment token cannot immediately follow token type {token_type}.\n",
-                                f"½#: {current_halfmovenumber[depth]}, token: {token}")
-                fatal_pgn_error(error_string)
+        if token_type == MOVETEXT_INDICATOR:
+            builder.add_movetext(token[1], checked_king_square = token[2])
+        elif token_type == COMMENT_INDICATOR:
+            builder.add_comment(token[1])
+        elif token_type == NAG_INDICATOR:
+            builder.add_nag(token[1])
+        elif token_type == OPEN_VARIATION_INDICATOR:
+            builder.open_variation()
+        elif token_type == CLOSE_VARIATION_INDICATOR:
+            builder.close_variation()
+        else:
+            # It’s not that obvious what would trigger this branch, because currently any token not a “(” or “)” *IS*
+            # by definition movetext.
+            error_string = (f"Unexpected token type encountered, “{token_type}”\n",
+                            f"½#: {builder.current_halfmovenumber[builder.depth]}, token: {token}")
+            fatal_pgn_error(error_string)
+
+    return builder.result()
+
+
+class GameTreeBuilder:
+    """
+    Builds the game tree incrementally, one PGN element at a time, in the order in which the elements occur in the
+    PGN. Each element is fed by calling one of:
+        add_movetext(movetext_dict, checked_king_square)
+        add_nag(nag_integer)
+        add_comment(comment_text)
+        open_variation()    # “(”
+        close_variation()   # “)”
+    after which result() returns the GameTree.
+
+    The attributes hold the state that buildtree() formerly kept in local variables while looping through the tokens.
+    The sequencing constraints (e.g., no NAG before the first movetext, no two consecutive “(”s) are enforced here, so
+    they apply whether the elements come from a TokenizedGame or directly from chess.pgn.read_game().
+
+    How nodes, edges, comments, and NAGs are stored is isolated in the methods under “Storage” below, which build a
+    GameTree of GameNode and Edge objects. A subclass can override them to store the same tree differently (see
+    compact_game_tree.CompactGameTreeBuilder).
+
+    See generally pgn4people-poc/docs/game-tree-concepts.md
+    """
+
+    def __init__(self):
+        ###############   Initializations  ###############
+        # Initialize empty dictionaries
+        # current_halfmovenumber is indexed by depth
+        self.current_halfmovenumber = {}
+        # current_originatingnode_id is indexed by depth
+        self.current_originatingnode_id = {}
+        # latest_mainline_destination is indexed by depth
+        self.latest_mainline_destination = {}
+     
+        # Initializations to begin the looping through tokens
+        # The first movetext token is necessarily the main line and thus depth=0
+        self.depth = 0
+        # The first movetext token is White's first move, which has halfmovenumber=1, and depth=0
+        self.current_halfmovenumber[self.depth] = 1
+
+        # Create the id=constants.INITIAL_NODE_ID=0 node corresponding to the initial position (and to White's first
+        # move)
+        self.create_tree_with_initial_node()
+
+        self.lastcreated_node_id = INITIAL_NODE_ID
+
+        # The next node at current depth (0) will be spawned from node with id zero.
+        self.current_originatingnode_id[self.depth] = INITIAL_NODE_ID
+        # Node_id for the next node to be created
+        self.current_node_id = 1
+
+        # Initializes boolean variables that are meant to be true only if the current movetext was immediately
+        # preceded by a closed/open parenthesis, respectively
+        self.is_preceded_by_open_paren = False
+        self.is_preceded_by_closed_paren = False
+
+        # Initializes Boolean variation to apply constraints that apply only to the first
+        self.are_awaiting_first_movetext_token = True
+
+        # Most-recent previous token, to apply constraints based on what kinds of tokens can or cannot immediately
+        # follow other kinds of tokens
+        self.most_recently_found_token_type = "root"
+
+        # When a comment is encountered BEFORE the movetext to which it applies, the variable
+        # comment_at_beginning_of_a_variation is set to that comment text to await the next node created, and then that
+        # comment will be attached to that node.
+        # This variable must be reset to None everytime it is transferred to a node, because the way a node knows
+        # whether there is a preceding comment to attach is by checking whether this variable is None.
+        # There are two cases where this scenario can occur: (a) If there is a comment at the beginning of the PGN,
+        # i.e., before the first movetext or (b) if there is a comment at the beginning of a variation (i.e.,
+        # immediately after the “(” that begins the variation (before the first movetext of the variation).
+        self.comment_at_beginning_of_a_variation = None
+
+
+    ###############   Storage  ###############
+
+    def create_tree_with_initial_node(self):
+        """
+        Creates the (empty) tree, self.gamenodes, and adds to it the initial node.
+        """
+        # gamenodes is indexed by a node_id
+        self.gamenodes = GameTree()
+
+        originating_node_id_of_initial_node = UNDEFINED_TREEISH_VALUE
+        self.new_node = GameNode(depth = self.depth,
+                                 halfmovenumber = self.current_halfmovenumber[self.depth],
+                                 fen = FEN_INITIAL,
+                                 originating_node_id = originating_node_id_of_initial_node)
+        # Adds this new node as the first node in the gamenodes dictionary
+        self.gamenodes.add_node(INITIAL_NODE_ID, self.new_node)
+
+        # The edge most recently created, to which any immediately following NAGs are attached
+        self.new_edge = None
+
+
+    def store_header(self, tagname, tagvalue):
+        """
+        Stores one of the PGN game’s headers
+        """
+        self.gamenodes.headers.append((tagname, tagvalue))
+
+
+    def store_comment_of_initial_node(self, comment_text):
+        """
+        Stores a comment that precedes the first movetext
+        """
+        self.gamenodes[INITIAL_NODE_ID].comment = comment_text
+
+
+    def store_comment_of_latest_node(self, comment_text):
+        """
+        Stores a comment that follows a movetext (or its NAGs) as the comment of the node just created
+        """
+        self.new_node.comment = comment_text
+
+
+    def store_nag_of_latest_edge(self, nag_integer):
+        """
+        Attaches a NAG to the edge just created
+        """
+        self.new_edge.nag_list.append(nag_integer)
+
+
+    def store_edge_and_node(self, *, movetext_dict, originating_node_id, node_id, depth, halfmovenumber,
+                            preceding_comment, checked_king_square):
+        """
+        Stores (a) a new edge, from originating_node_id to node_id, for the move described by movetext_dict and (b) the
+        new node, node_id, to which that edge leads.
+        """
+        self.new_edge = Edge(movetext_dict, node_id)
+
+        # Install new edge on originating node; add originating node to set of nonterminal nodes
+        self.gamenodes.install_new_edge(originating_node_id, self.new_edge)
+
+        # Computes index of new_edge at originating node that led to the current new node. This will be stored in
+        # the new node corresponding to the current token.
+        # NOTE: For any list, len(somelist)-1 is the index of most recently appended item
+        index_of_edge_at_originating_node = len(self.gamenodes[originating_node_id].edgeslist) - 1
+
+        # Create new node corresponding to the destination reached if the current token's move is chosen
+        self.new_node = GameNode(depth = depth,
+                                 halfmovenumber = halfmovenumber,
+                                 originating_node_id = originating_node_id,
+                                 preceding_comment = preceding_comment,
+                                 checked_king_square = checked_king_square,
+                                 choice_id_at_originatingnode = index_of_edge_at_originating_node)
+
+        # Add node to gamesnodes dictionary
+        self.gamenodes.add_node(node_id, self.new_node)
+
+
+    def result(self):
+        """
+        Returns the GameTree built so far, with its principal-line index (see principal_lines.py) and, if
+        BUILD_TRANSPOSITION_INDEX, its transposition index (see transpositions.py).
+        """
+        principal_line_index_of(self.gamenodes)
+        if BUILD_TRANSPOSITION_INDEX:
+            transposition_index_of(self.gamenodes)
+        return self.gamenodes
+
+
+    ###############   Processing of PGN elements  ###############
+
+
+    def reject_if_awaiting_first_movetext(self, token_type, token_value=""):
+        """
+        Raises a fatal PGN error if a “(”, “)”, or NAG is encountered before the first movetext.
+        """
+        if self.are_awaiting_first_movetext_token:
+            token = (token_type, token_value)
+            error_string = (f"Token type {token_type} encountered before first movetext token.\n",
+                            f"½#: {self.current_halfmovenumber[self.depth]}, token: {token}")
+            fatal_pgn_error(error_string)
+
+
+    def add_comment(self, comment_text):
+        """
+        Processes a comment token.
+        """
+        if self.are_awaiting_first_movetext_token:
+            # There is a comment before the first move of a game. This comment is assigned to the root node
+            self.store_comment_of_initial_node(comment_text)
+            self.most_recently_found_token_type = COMMENT_INDICATOR
+
+            # Resets comment_at_beginning_of_a_variation
+            self.comment_at_beginning_of_a_variation = None
+            return
+
+        if self.most_recently_found_token_type in (COMMENT_INDICATOR, CLOSE_VARIATION_INDICATOR):
+            token = (COMMENT_INDICATOR, comment_text)
+            error_string = (f"Comment token cannot immediately follow token type {COMMENT_INDICATOR}.\n",
+                            f"½#: {self.current_halfmovenumber[self.depth]}, token: {token}")
+            fatal_pgn_error(error_string)
+
+        if self.most_recently_found_token_type == OPEN_VARIATION_INDICATOR:
+            self.comment_at_beginning_of_a_variation = comment_text
+        else:
+            # By elimination, token_type is either MOVETEXT_INDICATOR or NAG_INDICATOR (which itself immediately
+            # followed a MOVETEXT_INDICATOR).
+            # We attach this comment to the node just created for the recently preceding movetext.
+            self.store_comment_of_latest_node(comment_text)
         
-            comment_text = token[1]
-
-            if most_recently_found_token_type == OPEN_VARIATION_INDICATOR:
-                comment_at_beginning_of_a_variation = comment_text
-            else:
-                # By elimination, token_type is either MOVETEXT_INDICATOR or NAG_INDICATOR (which itself immediately
-                # followed a MOVETEXT_INDICATOR).
-                # We attach this comment to the node just created for the recently preceding movetext.
-                new_node.comment = comment_text
-            
-            most_recently_found_token_type = COMMENT_INDICATOR
-            
-            continue
-
-        if token_type == NAG_INDICATOR:
-            if most_recently_found_token_type not in  (MOVETEXT_INDICATOR, NAG_INDICATOR):
-                error_string = (
-                  f"NAG token encountered immediately after a {token_type} token rather after movetext or another NAG.",
-                  f"\n½#: {current_halfmovenumber[depth]}, token: {token}"
-                               )
-                fatal_pgn_error(error_string)
-            
-            nag_integer = token[1]
-            new_edge.nag_list.append(nag_integer)
-
-            most_recently_found_token_type = NAG_INDICATOR
-
-            continue
+        self.most_recently_found_token_type = COMMENT_INDICATOR
+
+
+    def add_nag(self, nag_integer):
+        """
+        Processes a NAG token, attaching the NAG to the most recently created edge.
+        """
+        self.reject_if_awaiting_first_movetext(NAG_INDICATOR, nag_integer)
+
+        if self.most_recently_found_token_type not in  (MOVETEXT_INDICATOR, NAG_INDICATOR):
+            token = (NAG_INDICATOR, nag_integer)
+            error_string = (
+              f"NAG token encountered immediately after a {NAG_INDICATOR} token rather after movetext or another NAG.",
+              f"\n½#: {self.current_halfmovenumber[self.depth]}, token: {token}"
+                           )
+            fatal_pgn_error(error_string)
         
-        # Branches based on whether current token is (a) movetext, (b) “(”, or (c) “)”.
-        if token_type == MOVETEXT_INDICATOR:
+        self.store_nag_of_latest_edge(nag_integer)
 
-            most_recently_found_token_type = MOVETEXT_INDICATOR
-            are_awaiting_first_movetext_token = False
-
-            # Token is movetext, which defines an edge that connects (a) the node with id
-            # current_originatingnode_id[depth] to a node about to be created with id current_node_id.
-            # Processing now branches based on whether the immediately preceding token was (a) “(’, (b) “)”,
-            # or (c) movetext.
-            # This fact is communicated here from the previous iteration via the two Boolean variables
-            # is_preceded_by_open_paren and is_preceded_by_closed_paren
-            if is_preceded_by_open_paren:
-                # A “(” begins a new variation at a depth one greater than the movetext immediately before the “(”.
-                #   Thus, we increase the depth.
-                #   The first move of this new variation should have the same halfmove number as the immediately
-                #   preceding movetext, because both of these are alternatives of the same node.
-                # The depth and halfmovenumber were already adjusted when the “(” was encountered, so no further
-                #   adjustment is necessary at this point.
-                #   (You may ask: So what’s the purpose of setting is_preceded_by_open_paren=True, if all we do is do
-                #   nothing? That’s precisely the point. If is_preceded_by_open_paren had not been set to True, we would 
-                #   have done something when we shouldn’t have.)
-
-                # Resets flags for beginning of new variation
-                is_preceded_by_open_paren = False
-                is_preceded_by_closed_paren = False
-            elif is_preceded_by_closed_paren:
-                # A “)” ends the current variation and reverts to either (a) a previous line with depth one less or
-                # (b) a new variation of the same depth that begins immediately. (This occurs when a node has two or
-                # more alternatives in addition to the main line.)
-                current_halfmovenumber[depth] += 1
-                current_originatingnode_id[depth] = latest_mainline_destination[depth]
-
-                # Resets flags for beginning of new variation
-                is_preceded_by_open_paren = False
-                is_preceded_by_closed_paren = False
-
-            else:
-                # Current movetext token was immediately preceded by another movetext token (not a parenthesis), or
-                # comment or NAG, or by the initial node, 
-                # The depth is unchanged.
-                # The halfmovenumber for this depth is incremented.
-                current_halfmovenumber[depth] += 1
-
-                # Because the current token is reached directly via the previous movetext, that movetext's node is the 
-                # originating node for the currently constructed new node.
-                current_originatingnode_id[depth] = lastcreated_node_id
-
-            # Define new edge corresponding to this token
-            movetext_dict = token[1]
-            destination_node_id = current_node_id
-            new_edge = Edge(movetext_dict, destination_node_id)
-
-            # Computes chess position achieved after this move is played
-            pre_move_fen = gamenodes[current_originatingnode_id[depth]].fen
-            post_move_fen = update_position_with_move_uci(pre_move_fen, movetext_dict["uci"])
-
-            latest_mainline_destination[depth] = current_node_id
-
-            # Update originating node about the existence of this node
-            originating_node_id = current_originatingnode_id[depth]
-
-            # Install new edge on originating node; add originating node to set of nonterminal nodes
-            gamenodes[originating_node_id].install_new_edge_on_originating_node(new_edge, originating_node_id)
-
-            # Computes index of new_edge at originating node that led to the current new node. This will be stored in
-            # the new node corresponding to the current token.
-            # NOTE: For any list, len(somelist)-1 is the index of most recently appended item
-            index_of_edge_at_originating_node = len(gamenodes[originating_node_id].edgeslist) - 1
-
-            # Create new node corresponding to the destination reached if the current token's move is chosen
-
-            new_node = GameNode(depth = depth,
-                                halfmovenumber = current_halfmovenumber[depth],
-                                originating_node_id = current_originatingnode_id[depth],
-                                preceding_comment = comment_at_beginning_of_a_variation,
-                                fen = post_move_fen,
-                                choice_id_at_originatingnode = index_of_edge_at_originating_node,
-                                node_id = current_node_id)
-            
-            # Resets comment_at_beginning_of_a_variation to await the next time a comment immediately follows an
-            # opening parenthesis.
-            comment_at_beginning_of_a_variation = None
-
-            
-            # Add node to gamesnodes dictionary
-            gamenodes[current_node_id] = new_node
-
-            # Adjusts current_originatingnode_id[depth] and current_node_id for next node to be created
-            lastcreated_node_id = current_node_id
-            current_node_id += 1
-
-            continue
-
-        if token_type == OPEN_VARIATION_INDICATOR:
-            if most_recently_found_token_type == OPEN_VARIATION_INDICATOR:
-                error_string = (f"Two consecutive “(”s encountered.\n ",
-                                f"½#: {current_halfmovenumber[depth]}, token: {token}")
-                fatal_pgn_error(error_string)
-
-            most_recently_found_token_type = OPEN_VARIATION_INDICATOR
+        self.most_recently_found_token_type = NAG_INDICATOR
 
-            # A “(” begins a new variation at a depth one greater than the movetext immediately before the “(”.
-            #   Thus, we increase the depth.
-            depth += 1
 
-            # The first move of this new variation should have the same halfmove number as the immediately
-            # preceding movetext, because both of these are alternatives of the same node.
-            # Thus we retain the halfmove number from the previous mainline move.
-            current_halfmovenumber[depth] = current_halfmovenumber[depth - 1]
+    def add_movetext(self, movetext_dict, checked_king_square=None):
+        """
+        Processes a movetext token, creating a new edge and the new node to which it leads.
 
-            # Retain same originating node as the previous mainline move
-            current_originatingnode_id[depth] = current_originatingnode_id[depth - 1]
+        movetext_dict is a mapping of alternative text representations of the move; see pgn_tokenizer.py.
+        checked_king_square is the square of the king the move puts in check, if any (see
+        python_chess_utilities.checked_king_square_after_move()); it is stored on the new node.
+        """
+        depth = self.depth
+        current_halfmovenumber = self.current_halfmovenumber
+        current_originatingnode_id = self.current_originatingnode_id
 
-            # Sets flag to indicate that next token is immediately preceded by an open parenthesis
-            is_preceded_by_open_paren = True
+        self.most_recently_found_token_type = MOVETEXT_INDICATOR
+        self.are_awaiting_first_movetext_token = False
 
-            continue
-    
-        if token_type == CLOSE_VARIATION_INDICATOR:
+        # Token is movetext, which defines an edge that connects (a) the node with id
+        # current_originatingnode_id[depth] to a node about to be created with id current_node_id.
+        # Processing now branches based on whether the immediately preceding token was (a) “(’, (b) “)”,
+        # or (c) movetext.
+        # This fact is communicated here from the previous iteration via the two Boolean variables
+        # is_preceded_by_open_paren and is_preceded_by_closed_paren
+        if self.is_preceded_by_open_paren:
+            # A “(” begins a new variation at a depth one greater than the movetext immediately before the “(”.
+            #   Thus, we increase the depth.
+            #   The first move of this new variation should have the same halfmove number as the immediately
+            #   preceding movetext, because both of these are alternatives of the same node.
+            # The depth and halfmovenumber were already adjusted when the “(” was encountered, so no further
+            #   adjustment is necessary at this point.
+            #   (You may ask: So what’s the purpose of setting is_preceded_by_open_paren=True, if all we do is do
+            #   nothing? That’s precisely the point. If is_preceded_by_open_paren had not been set to True, we would 
+            #   have done something when we shouldn’t have.)
+
+            # Resets flags for beginning of new variation
+            self.is_preceded_by_open_paren = False
+            self.is_preceded_by_closed_paren = False
+        elif self.is_preceded_by_closed_paren:
             # A “)” ends the current variation and reverts to either (a) a previous line with depth one less or
             # (b) a new variation of the same depth that begins immediately. (This occurs when a node has two or
             # more alternatives in addition to the main line.)
+            current_halfmovenumber[depth] += 1
+            current_originatingnode_id[depth] = self.latest_mainline_destination[depth]
 
-            most_recently_found_token_type == CLOSE_VARIATION_INDICATOR
+            # Resets flags for beginning of new variation
+            self.is_preceded_by_open_paren = False
+            self.is_preceded_by_closed_paren = False
 
-            # We decrement the depth in case we’re continuing a previous line. (However, if it turns out that the “)”
-            # is immediately followed by a “(”, the next time through the loop the if token == "("” branch will
-            # un-do this decrementing by incrementing the depth.)
-            depth -= 1
+        else:
+            # Current movetext token was immediately preceded by another movetext token (not a parenthesis), or
+            # comment or NAG, or by the initial node, 
+            # The depth is unchanged.
+            # The halfmovenumber for this depth is incremented.
+            current_halfmovenumber[depth] += 1
+
+            # Because the current token is reached directly via the previous movetext, that movetext's node is the 
+            # originating node for the currently constructed new node.
+            current_originatingnode_id[depth] = self.lastcreated_node_id
+
+        current_node_id = self.current_node_id
+
+        # Note: The chess position achieved after this move is played is NOT computed here. Parsing a FEN into a
+        # board, pushing the move, and serializing back to a FEN for every move was the dominant cost of building
+        # the tree. Instead, a node’s FEN is computed only when requested; see game_tree.fen_of_node().
+
+        self.latest_mainline_destination[depth] = current_node_id
+
+        # Define new edge corresponding to this token, and the new node to which it leads, and install the edge on the
+        # originating node
+        self.store_edge_and_node(movetext_dict = movetext_dict,
+                                 originating_node_id = current_originatingnode_id[depth],
+                                 node_id = current_node_id,
+                                 depth = depth,
+                                 halfmovenumber = current_halfmovenumber[depth],
+                                 preceding_comment = self.comment_at_beginning_of_a_variation,
+                                 checked_king_square = checked_king_square)
+        
+        # Resets comment_at_beginning_of_a_variation to await the next time a comment immediately follows an
+        # opening parenthesis.
+        self.comment_at_beginning_of_a_variation = None
 
-            # Sets flag to indicate that next token is immediately preceded by an open parenthesis
-            is_preceded_by_closed_paren = True
+        # Adjusts current_originatingnode_id[depth] and current_node_id for next node to be created
+        self.lastcreated_node_id = current_node_id
+        self.current_node_id += 1
 
-            continue
 
-        else:
-            # It’s not that obvious what would trigger this branch, because currently any token not a “(” or “)” *IS*
-            # by definition movetext.
-            error_string = (f"Unexpected token type encountered, “{token_type}”\n",
-                            f"½#: {current_halfmovenumber[depth]}, token: {token}")
+    def open_variation(self):
+        """
+        Processes a “(” token.
+        """
+        self.reject_if_awaiting_first_movetext(OPEN_VARIATION_INDICATOR)
+
+        if self.most_recently_found_token_type == OPEN_VARIATION_INDICATOR:
+            token = (OPEN_VARIATION_INDICATOR, "")
+            error_string = (f"Two consecutive “(”s encountered.\n ",
+                            f"½#: {self.current_halfmovenumber[self.depth]}, token: {token}")
             fatal_pgn_error(error_string)
 
-    return gamenodes
+        self.most_recently_found_token_type = OPEN_VARIATION_INDICATOR
+
+        # A “(” begins a new variation at a depth one greater than the movetext immediately before the “(”.
+        #   Thus, we increase the depth.
+        self.depth += 1
+        depth = self.depth
+
+        # The first move of this new variation should have the same halfmove number as the immediately
+        # preceding movetext, because both of these are alternatives of the same node.
+        # Thus we retain the halfmove number from the previous mainline move.
+        self.current_halfmovenumber[depth] = self.current_halfmovenumber[depth - 1]
+
+        # Retain same originating node as the previous mainline move
+        self.current_originatingnode_id[depth] = self.current_originatingnode_id[depth - 1]
+
+        # Sets flag to indicate that next token is immediately preceded by an open parenthesis
+        self.is_preceded_by_open_paren = True
+
+
+    def close_variation(self):
+        """
+        Processes a “)” token.
+        """
+        self.reject_if_awaiting_first_movetext(CLOSE_VARIATION_INDICATOR)
+
+        # A “)” ends the current variation and reverts to either (a) a previous line with depth one less or
+        # (b) a new variation of the same depth that begins immediately. (This occurs when a node has two or
+        # more alternatives in addition to the main line.)
+
+        # Note: most_recently_found_token_type is (as it always has been) left unchanged by a “)”. Thus a comment or
+        # NAG immediately following a “)” is attached to the last node/edge of the variation just closed.
+
+        # We decrement the depth in case we’re continuing a previous line. (However, if it turns out that the “)”
+        # is immediately followed by a “(”, the next time through the loop the if token == "("” branch will
+        # un-do this decrementing by incrementing the depth.)
+        self.depth -= 1
+
+        # Sets flag to indicate that next token is immediately preceded by an open parenthesis
+        self.is_preceded_by_closed_paren = True
@@ -1,5 +1,5 @@
 """
-Defines the GameNode and Edge classes
+Defines the GameTree, GameNode, Edge, MovetextDict, and GameTreeReport classes
 
 See generally pgn4people-poc/docs/game-tree-concepts.md
 """
@@ -9,6 +9,101 @@ import logging
 
 from . import constants
 
+class GameTree(dict):
+    """
+    The game tree: the “nodedict” of {node_id: node} key:value pairs, where node is an instance of GameNode, together
+    with the bookkeeping that belongs to this particular tree (rather than, as formerly, to class attributes of GameNode
+    that were shared by, and accumulated across, every tree ever built).
+
+    Because GameTree is a dict, every function that takes a nodedict accepts a GameTree unchanged.
+
+    Once buildtree() returns, the structure of a GameTree (its nodes, their edges, and the attributes set by the build)
+    never changes. What is attached afterward, lazily and on first use, is only data derived from that structure: the
+    principal_line_index, the transposition_index, the row_fragment_cache, and the FENs memoized by
+    game_tree.fen_of_node(). Each is idempotent (two requests racing to attach one attach identical values), and the
+    row_fragment_cache is created under a lock and is itself thread-safe, which is why a single instance can be shared
+    by concurrent requests.
+    """
+
+    __slots__ = {
+        "set_of_node_IDs":
+            "Set of the node_id of every node in the tree",
+        "set_of_nonterminal_node_IDs":
+            "Set of the node_id of every node that has at least one edge",
+        "maximum_number_of_edges_per_node":
+            "Maximum, across nodes, of number_of_edges. Allows the Variations Table to be a fixed width.",
+        "headers":
+            "List of (tag_name, tag_value) tuples of the PGN game’s headers",
+        "principal_line_index":
+            "PrincipalLineIndex of the tree, once built; else None. See principal_lines.py.",
+        "transposition_index":
+            "TranspositionIndex of the tree, once built; else None. See transpositions.py.",
+        "row_fragment_cache":
+            "LRUCache of pre-rendered variations-table rows, once created; else None. See variations_table.py.",
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.headers = []
+        self.set_of_node_IDs = set()
+        self.set_of_nonterminal_node_IDs = set()
+        self.maximum_number_of_edges_per_node = 0
+        self.principal_line_index = None
+        self.transposition_index = None
+        self.row_fragment_cache = None
+
+
+    def add_node(self, node_id, node):
+        """
+        Adds node to the tree with key node_id, and records node_id in .set_of_node_IDs.
+
+        Also sets node.nearest_deviation_node_id, which requires that node’s originating node already be in the tree.
+        """
+        if node.choice_id_at_originatingnode in (None, constants.INDEX_MAINLINE):
+            # Node is the initial node or is reached by its originating node’s main-line choice, and so inherits its
+            # originating node’s nearest deviation
+            if node.originatingnode_id in self:
+                node.nearest_deviation_node_id = self[node.originatingnode_id].nearest_deviation_node_id
+            else:
+                node.nearest_deviation_node_id = constants.UNDEFINED_TREEISH_VALUE
+        else:
+            node.nearest_deviation_node_id = node_id
+
+        self[node_id] = node
+        self.set_of_node_IDs.add(node_id)
+
+
+    def install_new_edge(self, originating_node_id, new_edge):
+        """
+        Installs new_edge on the node originating_node_id (see GameNode.install_new_edge_on_originating_node()) and
+        updates the tree’s bookkeeping: (a) adds originating_node_id to the set of nonterminal nodes (since we know it
+        has at least one successor) and (b) updates .maximum_number_of_edges_per_node.
+        """
+        originating_node = self[originating_node_id]
+        originating_node.install_new_edge_on_originating_node(new_edge)
+
+        if originating_node.number_of_edges > self.maximum_number_of_edges_per_node:
+            self.maximum_number_of_edges_per_node = originating_node.number_of_edges
+
+        self.set_of_nonterminal_node_IDs.add(originating_node_id)
+
+
+    def destination_node_ids_of(self, node_id):
+        """
+        Returns a list of the destination node_ids of node node_id’s edges, in order of their reference_index
+        """
+        return [edge.destination_node_id for edge in self[node_id].edgeslist]
+
+
+    @property
+    def set_of_terminal_node_IDs(self):
+        """
+        Set of the node_id of every node with no edges, derived from the set of all nodes and the set of nonterminal
+        nodes.
+        """
+        return self.set_of_node_IDs.difference(self.set_of_nonterminal_node_IDs)
+
+
 class GameNode:
     """
     The class of which each node (position) is an instance.
@@ -16,18 +111,6 @@ class GameNode:
     See pgn4people-poc/docs/game-tree-concepts.md
     """
 
-
-   # Define/initialize class attributes to support reporting statistics on the gametree
-    set_of_node_IDs = set()
-    set_of_nonterminal_node_IDs = set()
-    # set_of_terminal_node_IDs = set()  # Will be computed later, so doesn't need to be initialized
-    # max_variation_depth = 0
-    # max_halfmove_length_of_line = 0
-
-    # Track maximum number of edges across nodes without requiring a full report to be compiled. Reason: To allow
-    # the Variations Table to be a fixed width to avoid jankiness.
-    maximum_number_of_edges_per_node = 0
-
     # Defining the set of valid instance attributes
     __slots__ = {
         "halfmovenumber":
@@ -41,15 +124,20 @@ class GameNode:
         "comment":
             "comment text associated with the node’s position; not a preceding comment",
         "fen":
-            "FEN of chess position that corresponds to this node.",
+            "FEN of chess position that corresponds to this node. None until requested; see game_tree.fen_of_node().",
+        "checked_king_square":
+            "Square (0–63) of the player-to-move’s king if it is in check in this node’s position; else None. Set when "
+            "the tree is built, so that displaying the board requires no chess logic.",
         "choice_id_at_originatingnode":
             "index of edge within the originating node’s .edgeslist that led to this node",
+        "nearest_deviation_node_id":
+            "node_id of the nearest node, among this node and its predecessors, that is reached by a deviation (a "
+            "non-mainline choice at its originating node); UNDEFINED_TREEISH_VALUE if there is none. Set by "
+            "GameTree.add_node(); see game_tree.deviation_history_of_node().",
         "edgeslist":
             "List of edges (of class Edge) attached to this node. (Compiled incrementally as PGN is parsed.)",
         "number_of_edges":
             "Number_of_edges in .edgeslist. (Compiled incrementally as PGN is parsed.)",
-        "display_order_of_edges":
-            "List of indices that point to original index of edges before temporary reordering for display purposes."
     }
 
     
@@ -60,59 +148,84 @@ class GameNode:
                  preceding_comment = None,
                  comment = None,
                  fen = None,
-                 choice_id_at_originatingnode=None,
-                 node_id=None):
-        # Note that node_id is NOT an attribute of the node object; it is passed to the constructor for information so
-        # that the node_id will be added to the class attribute .set_of_node_IDs at the time the node is created.
+                 checked_king_square = None,
+                 choice_id_at_originatingnode=None):
         self.depth = depth
         self.halfmovenumber = halfmovenumber
         self.originatingnode_id = originating_node_id
         self.preceding_comment = preceding_comment
         self.comment = comment
         self.fen = fen
+        self.checked_king_square = checked_king_square
         self.number_of_edges = 0
         self.edgeslist = []
 
         # self.choice_id_at_originatingnode = constants.UNDEFINED_TREEISH_VALUE
         self.choice_id_at_originatingnode = choice_id_at_originatingnode
 
-        # Add node_id, which is NOT an attribute of this instance, to the class attribute .set_of_node_IDs
-        # Checks for valid node_id. If not, skip. This allows for faux node for purposes of the initial invisible row
-        # of the variations table
-        if node_id != constants.UNDEFINED_TREEISH_VALUE:
-            self.__class__.set_of_node_IDs.add(node_id)
+        self.nearest_deviation_node_id = constants.UNDEFINED_TREEISH_VALUE
 
 
-    def install_new_edge_on_originating_node(self, new_edge, originating_node_id):
+    def install_new_edge_on_originating_node(self, new_edge):
         """
-        (a) Adds a newly discovered Edge to its originating node, (b) increments number of edges at originating node,
-        and (c) add this originating node to the set of nonterminal nodes (since we know it has at least one successor).
-
-        USAGE: method is meant to be called on gamenodes[originating_node_id]
-
-        NOTE: originating_node_id is passed as an argument solely to allow originating_node_id to be added to
-        set_of_nonterminal_nodes. (originating_node_id is not needed for the addition of the new edge, because this 
-        method is called on the appropriate node.)
+        (a) Adds a newly discovered Edge to its originating node and (b) increments number of edges at originating node.
 
-        Alternatively, the node could be added to the set of nonterminal nodes only the first time an edge is
-        installed. It's not clear that imposing that condition would save time, because evaluating it could take as
-        much time as redundantly adding the node to the set of nonterminal nodes.
+        USAGE: method is meant to be called on gamenodes[originating_node_id], normally via GameTree.install_new_edge(),
+        which also updates the tree’s set of nonterminal nodes.
         """
         self.number_of_edges += 1
         self.edgeslist.append(new_edge)
 
-        # Updates maximum_number_of_edges_per_node
-        if self.number_of_edges > self.__class__.maximum_number_of_edges_per_node:
-            self.__class__.maximum_number_of_edges_per_node = self.number_of_edges
-
-
         # Determine the index this added edge is assigned at the originating node, and add this as a property to the
         # edge.
         
         new_edge.reference_index = len(self.edgeslist) - 1
 
-        # Add this node to set of nonterminal nodes
-        self.set_of_nonterminal_node_IDs.add(originating_node_id)
+
+class MovetextDict(dict):
+    """
+    Dictionary of alternative text representations of a move, with the same keys as the movetext dictionary of a
+    movetext token (see pgn_tokenizer.TokenizedGame):
+        "san": SAN, e.g., “Nf3”
+        "lan": LAN, e.g., “Ng1-f3”
+        "uci": UCI, e.g., "g1f3"
+
+    Only "san" and "uci" are stored. "lan" is needed only for the single move shown in the text-annotation area, so it
+    is derived on demand (from "san" and "uci", without a chess.Board) and not stored.
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, key):
+        if key == "lan":
+            return lan_from_san_and_uci(self["san"], self["uci"])
+        raise KeyError(key)
+
+
+def lan_from_san_and_uci(move_san, move_uci):
+    """
+    Returns the long algebraic notation (as produced by chess.Board.lan()) of a move, given its SAN and UCI.
+
+    E.g., (“Nxe5+”, “f3e5”) → “Nf3xe5+”; (“e8=Q”, “e7e8q”) → “e7-e8=Q”; (“O-O”, “e1g1”) → “O-O”.
+
+    SAN already records everything LAN adds to the origin and destination squares: the piece letter, whether the move
+    is a capture, any promotion, and the check/checkmate suffix. Castling and the null move are written identically in
+    both notations.
+    """
+    if move_san.startswith("O-O") or move_san == "--":
+        return move_san
+
+    # Separates check/checkmate suffix
+    suffix = ""
+    if move_san[-1] in "+#":
+        suffix = move_san[-1]
+        move_san = move_san[:-1]
+
+    piece_letter = move_san[0] if move_san[0] in "KQRBN" else ""
+    separator = "x" if "x" in move_san else "-"
+    promotion = move_san[move_san.index("="):] if "=" in move_san else ""
+
+    return piece_letter + move_uci[0:2] + separator + move_uci[2:4] + promotion + suffix
 
 
 class Edge:
@@ -160,24 +273,22 @@ class GameTreeReport:
         max_halfmove_length_of_a_line : The halfmove length of the longest line (measured in halfmoves)
         max_depth_of_a_line: The maximum depth associated with a terminal node. (The number of deviations from the
             mainline on the path that is required to reach that terminal node.)
-        halfmove_length_histogram: A collections.Counter dict of {halfmove_length: frequency} key:value pairs, where
-            frequency is the number of terminal nodes with halfmove equal to the given halfmove_length.
-        depth_histogram: A collections.Counter dict of {depth: frequency} key:value pairs, where frequency is the number
-            of terminal nodes with depth equal to the given depth.
-    
-    Used by characterize_gametree() in compile_and_output_report.py.
+        halfmove_length_histogram: A dict of {halfmove_length: frequency} key:value pairs, where frequency is the
+            number of terminal nodes with halfmove equal to the given halfmove_length.
+        depth_histogram: A dict of {depth: frequency} key:value pairs, where frequency is the number of terminal nodes
+            with depth equal to the given depth.
+        number_of_edges_histogram: A dict of {number_of_edges: frequency} key:value pairs, where frequency is the
+            number of nodes with that number of edges.
+
+    An instance is returned by characterize_gametree() in game_tree.py. (Formerly the results were stored in class
+    attributes, which were shared by every request.)
     """
 
-
-    # def __init__(self,
-    #              number_of_nodes,
-    #              number_of_lines,
-    #              max_halfmove_length_of_a_line,
-    #              max_depth_of_a_line,
-    #              halfmove_length_histogram,
-    #              depth_histogram):
-    #     self.number_of_lines = constants.UNDEFINED_TREEISH_VALUE
-    #     self.max_halfmove_length_of_a_line = constants.UNDEFINED_TREEISH_VALUE
-    #     self.max_depth_of_a_line = constants.UNDEFINED_TREEISH_VALUE
-    #     self.halfmove_length_histogram = {}
-    #     self.depth_histogram = {}
\ No newline at end of file
+    def __init__(self):
+        self.number_of_nodes = 0
+        self.number_of_lines = 0
+        self.max_halfmove_length_of_a_line = 0
+        self.max_depth_of_a_line = 0
+        self.halfmove_length_histogram = {}
+        self.depth_histogram = {}
+        self.number_of_edges_histogram = {}
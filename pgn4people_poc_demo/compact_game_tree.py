@@ -0,0 +1,445 @@
+"""
+Defines CompactGameTree, an alternative, array-backed store for the game tree, together with the builder that produces
+it. (The visitor that drives the builder from chess.pgn.read_game(), PGNCompactTreeBuilder, is in pgn_tree_builder.py.)
+
+A GameTree holds, for every node, a GameNode object with its own list of Edge objects, each with its own movetext
+dictionary. That costs several hundred bytes per node, which is too much for repertoires of a million or more nodes.
+
+A CompactGameTree instead keeps one entry per node in each of several parallel typed arrays (module `array`):
+    parent_id           originating node (-1 for the initial node)
+    choice_index        index of the edge at the originating node that leads to this node
+    halfmove            halfmovenumber
+    nearest_deviation   nearest node, among this node and its predecessors, reached by a non-mainline choice (-1 if none)
+    depth               depth
+    first_edge          offset, into the edge arrays, of this node’s first edge
+    edge_count          number of edges
+    move_code           the move leading to this node, packed into 16 bits (see encode_move_uci())
+    san_index           the SAN of that move, as an index into a table of distinct SAN strings
+    checked_king_square square of the player-to-move’s king if it is in check (NO_CHECKED_KING_SQUARE if not)
+and one entry per edge in:
+    edge_destination    destination node of the edge; the edges of each node are contiguous, in choice order
+
+Comments, preceding comments, NAGs, and (memoized) FENs are sparse and live in side tables (dicts keyed by node_id;
+the NAGs of an edge are keyed by the edge’s destination node).
+
+The tree answers the same queries as a GameTree: tree[node_id] returns a CompactNodeView whose attributes have the same
+names and values as those of the corresponding GameNode, and whose .edgeslist holds CompactEdgeViews that mirror Edge.
+Thus deviation_history_of_node(), construct_list_of_rows_for_variations_table(), characterize_gametree(), etc., work
+unchanged on either representation.
+
+Because the tree only ever indexes its arrays and side tables, they may equally be memoryviews over a memory-mapped
+compiled file, and table objects with a .get() method; see compiled_game_tree.py.
+"""
+
+from array import array
+
+import chess
+
+from . build_tree import GameTreeBuilder
+from . classes_arboreal import MovetextDict
+from . constants import (BUILD_TRANSPOSITION_INDEX,
+                         FEN_INITIAL,
+                         INDEX_MAINLINE,
+                         INITIAL_NODE_ID,
+                         NO_CHECKED_KING_SQUARE,
+                         UNDEFINED_TREEISH_VALUE,
+                         )
+from . principal_lines import principal_line_index_of
+from . transpositions import transposition_index_of
+
+
+def encode_move_uci(move_uci):
+    """
+    Packs a move, given as a UCI string, into a 16-bit integer:
+        bits 0–5:   from square (0–63)
+        bits 6–11:  to square (0–63)
+        bits 12–14: promotion piece type (0 for none; else chess.KNIGHT…chess.QUEEN)
+    The null move (“0000”) is packed as 0.
+    """
+    move = chess.Move.from_uci(move_uci)
+    if not move:
+        return 0
+    promotion = move.promotion if move.promotion else 0
+    return move.from_square | (move.to_square << 6) | (promotion << 12)
+
+
+def decode_move_code(move_code):
+    """
+    Inverse of encode_move_uci(): returns the UCI string of a packed move
+    """
+    if move_code == 0:
+        return chess.Move.null().uci()
+    promotion = move_code >> 12
+    move = chess.Move(move_code & 0x3F, (move_code >> 6) & 0x3F, promotion if promotion else None)
+    return move.uci()
+
+
+class CompactGameTree:
+    """
+    Array-backed game tree; see the module docstring.
+
+    Supports the read-only mapping protocol used on a GameTree (tree[node_id], len(tree), iteration over node_ids,
+    node_id in tree) as well as its attributes set_of_node_IDs, set_of_nonterminal_node_IDs, set_of_terminal_node_IDs,
+    maximum_number_of_edges_per_node, and headers.
+    """
+
+    __slots__ = {
+        "parent_id": "array('i'): originating node of each node; -1 for the initial node",
+        "choice_index": "array('H'): index, at the originating node, of the edge leading to each node",
+        "halfmove": "array('H'): halfmovenumber of each node",
+        "nearest_deviation": "array('i'): nearest_deviation_node_id of each node (see GameNode)",
+        "depth": "array('H'): depth of each node",
+        "first_edge": "array('I'): offset into edge_destination of each node’s first edge",
+        "edge_count": "array('H'): number of edges of each node",
+        "move_code": "array('H'): packed move leading to each node (see encode_move_uci())",
+        "san_index": "array('I'): index into san_table of the SAN of the move leading to each node",
+        "checked_king_square": "array('b'): checked_king_square of each node (see GameNode); NO_CHECKED_KING_SQUARE "
+                               "for None",
+        "edge_destination": "array('I'): destination node of each edge, grouped by originating node",
+        "san_table": "List of distinct SAN strings",
+        "comments": "Side table {node_id: comment}",
+        "preceding_comments": "Side table {node_id: preceding comment}",
+        "nags": "Side table {node_id: list of NAGs of the edge leading to node_id}",
+        "fens": "Side table {node_id: FEN}, holding the initial FEN plus any FENs memoized by fen_of_node()",
+        "maximum_number_of_edges_per_node": "Maximum, across nodes, of the number of edges",
+        "headers": "List of (tag_name, tag_value) tuples of the PGN game’s headers",
+        "backing_buffer": "The mmap from which the arrays were loaded (see compiled_game_tree.py); else None",
+        "principal_line_index": "PrincipalLineIndex of the tree, once built; else None. See principal_lines.py.",
+        "transposition_index": "TranspositionIndex of the tree, once built; else None. See transpositions.py.",
+        "row_fragment_cache": "LRUCache of pre-rendered variations-table rows, once created; else None",
+    }
+
+    def __init__(self):
+        self.parent_id = array('i')
+        self.choice_index = array('H')
+        self.halfmove = array('H')
+        self.nearest_deviation = array('i')
+        self.depth = array('H')
+        self.first_edge = array('I')
+        self.edge_count = array('H')
+        self.move_code = array('H')
+        self.san_index = array('I')
+        self.checked_king_square = array('b')
+        self.edge_destination = array('I')
+        self.san_table = []
+        self.comments = {}
+        self.preceding_comments = {}
+        self.nags = {}
+        self.fens = {}
+        self.maximum_number_of_edges_per_node = 0
+        self.headers = []
+        self.backing_buffer = None
+        self.principal_line_index = None
+        self.transposition_index = None
+        self.row_fragment_cache = None
+
+
+    def __getitem__(self, node_id):
+        if not 0 <= node_id < len(self.parent_id):
+            raise KeyError(node_id)
+        return CompactNodeView(self, node_id)
+
+
+    def __len__(self):
+        return len(self.parent_id)
+
+
+    def __iter__(self):
+        return iter(range(len(self.parent_id)))
+
+
+    def __contains__(self, node_id):
+        return isinstance(node_id, int) and 0 <= node_id < len(self.parent_id)
+
+
+    def keys(self):
+        return range(len(self.parent_id))
+
+
+    def destination_node_ids_of(self, node_id):
+        """
+        Returns the destination node_ids of node node_id’s edges, in order of their reference_index
+        """
+        first_edge = self.first_edge[node_id]
+        return self.edge_destination[first_edge:first_edge + self.edge_count[node_id]]
+
+
+    @property
+    def set_of_node_IDs(self):
+        """
+        The node_ids, which are consecutive from INITIAL_NODE_ID. (A range rather than a set, to avoid materializing a
+        million-element set.)
+        """
+        return range(len(self.parent_id))
+
+
+    @property
+    def set_of_nonterminal_node_IDs(self):
+        return {node_id for node_id, edge_count in enumerate(self.edge_count) if edge_count}
+
+
+    @property
+    def set_of_terminal_node_IDs(self):
+        return [node_id for node_id, edge_count in enumerate(self.edge_count) if not edge_count]
+
+
+    def finalize(self):
+        """
+        Lays out the edge arrays once all nodes have been added: computes each node’s first_edge by a running sum of
+        edge_count, and places each non-initial node, as the destination of the edge with its choice_index, into the
+        contiguous run of its originating node’s edges.
+        """
+        number_of_nodes = len(self.parent_id)
+
+        first_edge = array('I', bytes(4 * number_of_nodes))
+        running_offset = 0
+        for node_id, edge_count in enumerate(self.edge_count):
+            first_edge[node_id] = running_offset
+            running_offset += edge_count
+        self.first_edge = first_edge
+
+        edge_destination = array('I', bytes(4 * running_offset))
+        parent_id = self.parent_id
+        choice_index = self.choice_index
+        for node_id in range(INITIAL_NODE_ID + 1, number_of_nodes):
+            edge_destination[first_edge[parent_id[node_id]] + choice_index[node_id]] = node_id
+        self.edge_destination = edge_destination
+
+        self.maximum_number_of_edges_per_node = max(self.edge_count, default=0)
+
+
+def compact_game_tree_from_nodedict(nodedict):
+    """
+    Returns a CompactGameTree equivalent to nodedict, a GameTree as returned by buildtree(). (If nodedict is already a
+    CompactGameTree, it is returned as is.)
+
+    Relies on node_ids being consecutive from INITIAL_NODE_ID in order of creation, so that every node’s originating
+    node precedes it.
+    """
+    if isinstance(nodedict, CompactGameTree):
+        return nodedict
+
+    builder = CompactGameTreeBuilder()
+    for tagname, tagvalue in nodedict.headers:
+        builder.store_header(tagname, tagvalue)
+
+    initial_node = nodedict[INITIAL_NODE_ID]
+    if initial_node.comment is not None:
+        builder.store_comment_of_initial_node(initial_node.comment)
+
+    for node_id in range(INITIAL_NODE_ID + 1, len(nodedict)):
+        node = nodedict[node_id]
+        edge = nodedict[node.originatingnode_id].edgeslist[node.choice_id_at_originatingnode]
+        builder.store_edge_and_node(movetext_dict = edge.movetext_dict,
+                                    originating_node_id = node.originatingnode_id,
+                                    node_id = node_id,
+                                    depth = node.depth,
+                                    halfmovenumber = node.halfmovenumber,
+                                    preceding_comment = node.preceding_comment,
+                                    checked_king_square = node.checked_king_square)
+        if node.comment is not None:
+            builder.store_comment_of_latest_node(node.comment)
+        for nag_integer in edge.nag_list:
+            builder.store_nag_of_latest_edge(nag_integer)
+
+    return builder.result()
+
+
+class CompactNodeView:
+    """
+    Read-only view of one node of a CompactGameTree, with the same attributes as GameNode.
+
+    Views are created on demand by CompactGameTree.__getitem__() and are cheap; nothing is stored in them but the tree
+    and the node_id.
+    """
+
+    __slots__ = ("tree", "node_id")
+
+    def __init__(self, tree, node_id):
+        self.tree = tree
+        self.node_id = node_id
+
+    @property
+    def halfmovenumber(self):
+        return self.tree.halfmove[self.node_id]
+
+    @property
+    def depth(self):
+        return self.tree.depth[self.node_id]
+
+    @property
+    def originatingnode_id(self):
+        return self.tree.parent_id[self.node_id]
+
+    @property
+    def nearest_deviation_node_id(self):
+        return self.tree.nearest_deviation[self.node_id]
+
+    @property
+    def checked_king_square(self):
+        checked_king_square = self.tree.checked_king_square[self.node_id]
+        return None if checked_king_square == NO_CHECKED_KING_SQUARE else checked_king_square
+
+    @property
+    def choice_id_at_originatingnode(self):
+        if self.node_id == INITIAL_NODE_ID:
+            return None
+        return self.tree.choice_index[self.node_id]
+
+    @property
+    def preceding_comment(self):
+        return self.tree.preceding_comments.get(self.node_id)
+
+    @property
+    def comment(self):
+        return self.tree.comments.get(self.node_id)
+
+    @property
+    def fen(self):
+        return self.tree.fens.get(self.node_id)
+
+    @fen.setter
+    def fen(self, fen):
+        # Permits game_tree.fen_of_node() to memoize FENs, as it does on a GameNode
+        self.tree.fens[self.node_id] = fen
+
+    @property
+    def number_of_edges(self):
+        return self.tree.edge_count[self.node_id]
+
+    @property
+    def edgeslist(self):
+        tree = self.tree
+        first_edge = tree.first_edge[self.node_id]
+        return [CompactEdgeView(tree, tree.edge_destination[first_edge + reference_index], reference_index)
+                for reference_index in range(tree.edge_count[self.node_id])]
+
+
+class CompactEdgeView:
+    """
+    Read-only view of one edge of a CompactGameTree, with the same attributes as Edge.
+
+    An edge is identified by its destination node, which records the move leading to it and any NAGs of that move.
+    """
+
+    __slots__ = ("tree", "destination_node_id", "reference_index")
+
+    def __init__(self, tree, destination_node_id, reference_index):
+        self.tree = tree
+        self.destination_node_id = destination_node_id
+        self.reference_index = reference_index
+
+    @property
+    def movetext_dict(self):
+        tree = self.tree
+        return MovetextDict(san = tree.san_table[tree.san_index[self.destination_node_id]],
+                            uci = decode_move_code(tree.move_code[self.destination_node_id]))
+
+    @property
+    def nag_list(self):
+        return self.tree.nags.get(self.destination_node_id, [])
+
+    def __str__(self):
+        movetext_to_print = self.movetext_dict["lan"]
+        return f"({movetext_to_print}, REF:{self.reference_index}, →{self.destination_node_id})"
+
+
+class CompactGameTreeBuilder(GameTreeBuilder):
+    """
+    GameTreeBuilder that stores the tree as a CompactGameTree rather than as a GameTree of GameNode/Edge objects.
+
+    Only the storage methods are overridden; the PGN-processing logic (and its error checks) is inherited unchanged.
+    Each node’s arrays are appended as the node is created; the edge arrays are laid out by CompactGameTree.finalize()
+    when result() is called.
+    """
+
+    def create_tree_with_initial_node(self):
+        self.gamenodes = CompactGameTree()
+        self.san_index_of_san = {}
+        self.append_node(parent_id = UNDEFINED_TREEISH_VALUE,
+                         choice_index = 0,
+                         halfmovenumber = self.current_halfmovenumber[self.depth],
+                         depth = self.depth,
+                         move_code = 0,
+                         san_index = 0,
+                         checked_king_square = None)
+        self.gamenodes.fens[INITIAL_NODE_ID] = FEN_INITIAL
+        self.latest_node_id = INITIAL_NODE_ID
+        self.is_finalized = False
+
+
+    def append_node(self, *, parent_id, choice_index, halfmovenumber, depth, move_code, san_index,
+                    checked_king_square):
+        tree = self.gamenodes
+        tree.parent_id.append(parent_id)
+        tree.choice_index.append(choice_index)
+        tree.halfmove.append(halfmovenumber)
+        # A node reached by a deviation is its own nearest deviation; any other node inherits its originating node’s
+        # (cf. GameTree.add_node())
+        if choice_index != INDEX_MAINLINE:
+            tree.nearest_deviation.append(len(tree.parent_id) - 1)
+        elif parent_id == UNDEFINED_TREEISH_VALUE:
+            tree.nearest_deviation.append(UNDEFINED_TREEISH_VALUE)
+        else:
+            tree.nearest_deviation.append(tree.nearest_deviation[parent_id])
+        tree.depth.append(depth)
+        tree.edge_count.append(0)
+        tree.move_code.append(move_code)
+        tree.san_index.append(san_index)
+        tree.checked_king_square.append(NO_CHECKED_KING_SQUARE if checked_king_square is None else checked_king_square)
+
+
+    def store_header(self, tagname, tagvalue):
+        self.gamenodes.headers.append((tagname, tagvalue))
+
+
+    def store_comment_of_initial_node(self, comment_text):
+        self.gamenodes.comments[INITIAL_NODE_ID] = comment_text
+
+
+    def store_comment_of_latest_node(self, comment_text):
+        self.gamenodes.comments[self.latest_node_id] = comment_text
+
+
+    def store_nag_of_latest_edge(self, nag_integer):
+        self.gamenodes.nags.setdefault(self.latest_node_id, []).append(nag_integer)
+
+
+    def store_edge_and_node(self, *, movetext_dict, originating_node_id, node_id, depth, halfmovenumber,
+                            preceding_comment, checked_king_square):
+        tree = self.gamenodes
+
+        # Interns the SAN
+        move_san = movetext_dict["san"]
+        san_index = self.san_index_of_san.get(move_san)
+        if san_index is None:
+            san_index = len(tree.san_table)
+            tree.san_table.append(move_san)
+            self.san_index_of_san[move_san] = san_index
+
+        # The new edge’s index at the originating node is the number of edges the originating node already has
+        choice_index = tree.edge_count[originating_node_id]
+        tree.edge_count[originating_node_id] = choice_index + 1
+
+        self.append_node(parent_id = originating_node_id,
+                         choice_index = choice_index,
+                         halfmovenumber = halfmovenumber,
+                         depth = depth,
+                         move_code = encode_move_uci(movetext_dict["uci"]),
+                         san_index = san_index,
+                         checked_king_square = checked_king_square)
+
+        if preceding_comment is not None:
+            tree.preceding_comments[node_id] = preceding_comment
+
+        self.latest_node_id = node_id
+
+
+    def result(self):
+        if not self.is_finalized:
+            self.gamenodes.finalize()
+            principal_line_index_of(self.gamenodes)
+            if BUILD_TRANSPOSITION_INDEX:
+                transposition_index_of(self.gamenodes)
+            self.is_finalized = True
+        return self.gamenodes
@@ -0,0 +1,61 @@
+"""
+Command-line tool to compile a PGN file into a compiled game-tree file (see compiled_game_tree.py) ahead of deployment.
+
+Usage:
+    python -m pgn4people_poc_demo.compile_pgn path/to/repertoire.pgn [-o path/to/output.pgn4tree] [--fens]
+
+By default the output is written beside the PGN file, with the same stem and the extension
+COMPILED_GAME_TREE_FILE_EXTENSION, which is where the app looks for it. The SHA-256 of the PGN is recorded in the
+compiled file, so the app ignores the compiled file once the PGN changes.
+"""
+
+import argparse
+import time
+
+from . pgn_tree_builder import PGNCompactTreeBuilder
+from . compiled_game_tree import compiled_filepath_for_pgn_file
+from . compiled_game_tree import load_compiled_game_tree
+from . compiled_game_tree import write_compiled_game_tree
+from . game_tree_cache import hash_of_file_contents
+from . traverse import get_next_parsed_game_from_PGN_file_using_custom_visitor
+
+
+def compile_pgn_file(pgn_filepath, output_filepath=None, include_fens=False):
+    """
+    Builds the game tree of the PGN file at pgn_filepath and writes it in the compiled format to output_filepath
+    (by default, compiled_filepath_for_pgn_file(pgn_filepath)). Returns (output_filepath, number_of_nodes).
+    """
+    if output_filepath is None:
+        output_filepath = compiled_filepath_for_pgn_file(pgn_filepath)
+
+    nodedict = get_next_parsed_game_from_PGN_file_using_custom_visitor(pgn_filepath, Visitor=PGNCompactTreeBuilder)
+    write_compiled_game_tree(nodedict,
+                             output_filepath,
+                             source_sha256 = bytes.fromhex(hash_of_file_contents(pgn_filepath)),
+                             include_fens = include_fens)
+    return output_filepath, len(nodedict)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pgn_filepath", help="PGN file to compile")
+    parser.add_argument("-o", "--output", dest="output_filepath", default=None,
+                        help="path of the compiled file (default: beside the PGN file)")
+    parser.add_argument("--fens", dest="include_fens", action="store_true",
+                        help="also store every node’s FEN, so that none need be computed when serving")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    output_filepath, number_of_nodes = compile_pgn_file(args.pgn_filepath, args.output_filepath, args.include_fens)
+    compile_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    load_compiled_game_tree(output_filepath)
+    load_seconds = time.perf_counter() - start_time
+
+    print(f"Compiled {args.pgn_filepath} ({number_of_nodes:,} nodes) to {output_filepath} in {compile_seconds:.3f} s; "
+          f"loads in {load_seconds * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Command-line tool to compile every game of a multi-game PGN collection into its own compiled game-tree file (see
+compiled_game_tree.py), in parallel across a pool of worker processes.
+
+Usage:
+    python -m pgn4people_poc_demo.compile_pgn_collection path/to/collection.pgn [-o output/directory] [--workers N]
+                                                          [--shard-bytes B] [--fens]
+
+Building a tree is CPU-bound pure Python, so a single process uses a single core. Instead, the collection is indexed
+(see pgn_game_index.py; the index is reused if current), the games are divided into shards of consecutive games of about
+BULK_COMPILE_SHARD_BYTES bytes of PGN each (smaller for a small collection, so that there are at least
+BULK_COMPILE_MINIMUM_SHARDS_PER_WORKER shards per worker), and the shards are compiled by a ProcessPoolExecutor. Each
+worker seeks to each game of its shard, builds it with PGNCompactTreeBuilder, and writes it to
+    <output directory>/<stem of collection>.<game number, from 0, zero-padded to 6 digits>.pgn4tree
+recording the SHA-256 of the game’s PGN text as the compiled file’s source hash. Only shard descriptions (a path and a
+list of offsets) and per-shard counts cross process boundaries.
+
+Progress (games and moves compiled, and games/sec and moves/sec so far) is reported on stderr as shards complete. A
+game that cannot be compiled (e.g., because of a fatal PGN error, or because its indexed range holds more than one game)
+is reported and skipped; the rest are compiled.
+"""
+
+import argparse
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import io
+import os
+import sys
+import time
+
+import chess.pgn
+
+from . pgn_tree_builder import PGNCompactTreeBuilder
+from . compiled_game_tree import write_compiled_game_tree
+from . constants import (BULK_COMPILE_MINIMUM_SHARDS_PER_WORKER,
+                         BULK_COMPILE_SHARD_BYTES,
+                         COMPILED_GAME_TREE_FILE_EXTENSION,
+                         )
+from . pgn_game_index import load_game_index
+
+
+class BulkCompileResult:
+    """
+    Counts and timing of a compile_pgn_collection() run
+    """
+
+    __slots__ = {
+        "number_of_workers": "Number of worker processes",
+        "number_of_games": "Number of games compiled",
+        "number_of_moves": "Total number of moves (i.e., of nodes other than initial nodes) of the compiled trees",
+        "list_of_failures": "List of (game number, error message) of the games that could not be compiled",
+        "seconds": "Wall time of the compilation, excluding the indexing of the collection",
+    }
+
+    def __init__(self, number_of_workers):
+        self.number_of_workers = number_of_workers
+        self.number_of_games = 0
+        self.number_of_moves = 0
+        self.list_of_failures = []
+        self.seconds = 0.0
+
+
+    def games_per_second(self):
+        return self.number_of_games / self.seconds if self.seconds else 0.0
+
+
+    def moves_per_second(self):
+        return self.number_of_moves / self.seconds if self.seconds else 0.0
+
+
+def compiled_filepath_for_game(output_directory, pgn_filepath, game_number):
+    """
+    Returns the path of the compiled file of game game_number of the collection at pgn_filepath
+    """
+    stem = os.path.splitext(os.path.basename(pgn_filepath))[0]
+    return os.path.join(output_directory, f"{stem}.{game_number:06d}{COMPILED_GAME_TREE_FILE_EXTENSION}")
+
+
+def list_of_shards(game_index, shard_bytes):
+    """
+    Returns a list of shards of the games of game_index, each a list of (game number, offset, length) of consecutive
+    games totaling about shard_bytes bytes of PGN (but at least one game)
+    """
+    shards = []
+    shard = []
+    bytes_of_shard = 0
+    for game_number, game in enumerate(game_index.games):
+        shard.append((game_number, game.offset, game.length))
+        bytes_of_shard += game.length
+        if bytes_of_shard >= shard_bytes:
+            shards.append(shard)
+            shard = []
+            bytes_of_shard = 0
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+def compile_shard(pgn_filepath, output_directory, shard, include_fens):
+    """
+    Compiles each game of shard (see list_of_shards()) of the collection at pgn_filepath. Runs in a worker process.
+
+    Returns (number of games compiled, number of moves compiled, list of (game number, error message) of failures).
+    """
+    number_of_games = number_of_moves = 0
+    list_of_failures = []
+    with open(pgn_filepath, "rb") as pgn_file:
+        for game_number, offset, length in shard:
+            pgn_file.seek(offset)
+            game_bytes = pgn_file.read(length)
+            try:
+                game_handle = io.StringIO(game_bytes.decode("utf-8-sig", errors="replace"))
+                nodedict = chess.pgn.read_game(game_handle, Visitor=PGNCompactTreeBuilder)
+                if nodedict is None:
+                    raise ValueError("no game found at the indexed offset")
+                # Were the index to have merged two games into one range, the second would otherwise be lost silently
+                if chess.pgn.skip_game(game_handle):
+                    raise ValueError("more than one game found in the indexed range")
+                write_compiled_game_tree(nodedict,
+                                         compiled_filepath_for_game(output_directory, pgn_filepath, game_number),
+                                         source_sha256 = hashlib.sha256(game_bytes).digest(),
+                                         include_fens = include_fens)
+            except (Exception, SystemExit) as error:
+                # SystemExit: a fatal PGN error exits (see error_processing.fatal_pgn_error())
+                list_of_failures.append((game_number, f"{type(error).__name__}: {error}"))
+                continue
+            number_of_games += 1
+            number_of_moves += len(nodedict) - 1
+    return number_of_games, number_of_moves, list_of_failures
+
+
+def compile_pgn_collection(pgn_filepath, output_directory, number_of_workers, shard_bytes=BULK_COMPILE_SHARD_BYTES,
+                           include_fens=False, report_progress=None):
+    """
+    Compiles every game of the collection at pgn_filepath into output_directory with number_of_workers worker processes
+    (see module docstring), and returns a BulkCompileResult. If report_progress is not None, it is called with the
+    BulkCompileResult so far (its seconds being the time elapsed) each time a shard completes.
+    """
+    game_index = load_game_index(pgn_filepath)
+    os.makedirs(output_directory, exist_ok=True)
+    shard_bytes = min(shard_bytes,
+                      game_index.source_size // (BULK_COMPILE_MINIMUM_SHARDS_PER_WORKER * number_of_workers))
+    shards = list_of_shards(game_index, shard_bytes)
+
+    result = BulkCompileResult(number_of_workers)
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+        futures = [executor.submit(compile_shard, pgn_filepath, output_directory, shard, include_fens)
+                   for shard in shards]
+        for future in as_completed(futures):
+            number_of_games, number_of_moves, list_of_failures = future.result()
+            result.number_of_games += number_of_games
+            result.number_of_moves += number_of_moves
+            result.list_of_failures.extend(list_of_failures)
+            result.seconds = time.perf_counter() - start_time
+            if report_progress is not None:
+                report_progress(result, len(game_index))
+    result.seconds = time.perf_counter() - start_time
+    result.list_of_failures.sort()
+    return result
+
+
+def print_progress(result, total_number_of_games):
+    """
+    Prints, on stderr, a one-line progress report, overwriting the previous one
+    """
+    number_of_games_done = result.number_of_games + len(result.list_of_failures)
+    print(f"\r{number_of_games_done:,}/{total_number_of_games:,} games, {result.number_of_moves:,} moves, "
+          f"{result.games_per_second():,.0f} games/s, {result.moves_per_second():,.0f} moves/s",
+          end="", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pgn_filepath", help="PGN collection to compile")
+    parser.add_argument("-o", "--output", dest="output_directory", default=None,
+                        help="directory of the compiled files (default: beside the PGN file)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--shard-bytes", type=int, default=BULK_COMPILE_SHARD_BYTES,
+                        help="approximate bytes of PGN per shard")
+    parser.add_argument("--fens", dest="include_fens", action="store_true",
+                        help="also store every node’s FEN, so that none need be computed when serving")
+    args = parser.parse_args()
+
+    output_directory = args.output_directory or os.path.dirname(os.path.abspath(args.pgn_filepath))
+    result = compile_pgn_collection(args.pgn_filepath, output_directory, args.workers, args.shard_bytes,
+                                    args.include_fens, report_progress=print_progress)
+    print(file=sys.stderr)
+
+    for game_number, error_message in result.list_of_failures:
+        print(f"Game {game_number} not compiled: {error_message}", file=sys.stderr)
+    print(f"Compiled {result.number_of_games:,} games ({result.number_of_moves:,} moves) of {args.pgn_filepath} to "
+          f"{output_directory} in {result.seconds:.2f} s with {args.workers} workers: "
+          f"{result.games_per_second():,.0f} games/s, {result.moves_per_second():,.0f} moves/s")
+
+
+if __name__ == "__main__":
+    main()
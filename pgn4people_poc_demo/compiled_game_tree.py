@@ -0,0 +1,461 @@
+"""
+Versioned binary on-disk format for a compiled game tree, and its memory-mapped loader.
+
+A compiled file holds everything in a CompactGameTree (see compact_game_tree.py) in fixed-width sections, so that a
+worker can serve a tree by mmap-ing the file, rather than by parsing the PGN with chess.pgn. Loading costs a stat, an
+mmap, and a few dozen memoryview casts; nodes are decoded only when, and to the extent that, they are visited.
+
+Layout (all integers little-endian):
+
+    Header (HEADER_STRUCT)
+        magic               8 bytes     COMPILED_GAME_TREE_MAGIC
+        format version      uint16      COMPILED_GAME_TREE_FORMAT_VERSION
+        flags               uint16      bit 0 (FLAG_HAS_FENS): the "fens" section is present
+        number of nodes     uint32
+        number of edges     uint32
+        number of sections  uint32
+        max edges per node  uint32
+        source SHA-256      32 bytes    digest of the PGN file from which the tree was compiled (zeros if unknown)
+
+    Section directory: for each section, (name: 8 bytes, NUL-padded; offset: uint64; length in bytes: uint64)
+
+    Sections, each aligned to SECTION_ALIGNMENT bytes:
+        Node arrays, one fixed-width entry per node (typecodes as in CompactGameTree):
+            parent, choice, halfmove, nrstdev, depth, firstedg, edgecnt, movecode, sanindex, chkking
+        Edge array, one entry per edge:
+            edgedest
+        String table of distinct SANs (sanindex indexes into it):
+            san_offs (uint32 × count+1), san_text (UTF-8)
+        Sparse string tables of comments and preceding comments, sorted by node_id:
+            cmt_node (uint32), cmt_offs (uint32 × count+1), cmt_text (UTF-8)
+            pcm_node, pcm_offs, pcm_text
+        Sparse table of NAGs, sorted by destination node_id:
+            nag_node (uint32), nag_offs (uint32 × count+1), nag_vals (uint16)
+        String table of headers, alternating tag name and tag value:
+            hdr_offs, hdr_text
+        Optionally, every node’s FEN, as fixed-width, NUL-padded ASCII records of FEN_RECORD_WIDTH bytes:
+            fens
+        Optionally, the principal-line index (see principal_lines.py), as uint32 arrays (if absent, it is built on
+        first use):
+            pl_order, pl_pos, pl_end
+
+Readers must reject a file whose magic or format version they do not recognize; sections they do not recognize are
+ignored, so sections may be added without a change of version.
+"""
+
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import struct
+import sys
+
+import chess
+
+from . compact_game_tree import CompactGameTree
+from . compact_game_tree import compact_game_tree_from_nodedict
+from . constants import (COMPILED_GAME_TREE_FILE_EXTENSION,
+                         FEN_INITIAL,
+                         INITIAL_NODE_ID,
+                         )
+from . error_processing import fatal_developer_error
+from . principal_lines import PrincipalLineIndex
+from . principal_lines import principal_line_index_of
+
+
+COMPILED_GAME_TREE_MAGIC = b"PGN4TREE"
+COMPILED_GAME_TREE_FORMAT_VERSION = 3
+
+FLAG_HAS_FENS = 0x0001
+
+HEADER_STRUCT = struct.Struct("<8sHHIIII32s")
+SECTION_DIRECTORY_ENTRY_STRUCT = struct.Struct("<8sQQ")
+SECTION_ALIGNMENT = 8
+
+# Maximum length of a FEN is well under this: 71 for the placement field, plus side to move, castling rights, en-passant
+# square, and move counters.
+FEN_RECORD_WIDTH = 96
+
+# Sections holding CompactGameTree node and edge arrays: (section name, CompactGameTree attribute, typecode)
+ARRAY_SECTIONS = (
+    (b"parent", "parent_id", "i"),
+    (b"choice", "choice_index", "H"),
+    (b"halfmove", "halfmove", "H"),
+    (b"nrstdev", "nearest_deviation", "i"),
+    (b"depth", "depth", "H"),
+    (b"firstedg", "first_edge", "I"),
+    (b"edgecnt", "edge_count", "H"),
+    (b"movecode", "move_code", "H"),
+    (b"sanindex", "san_index", "I"),
+    (b"chkking", "checked_king_square", "b"),
+    (b"edgedest", "edge_destination", "I"),
+)
+
+
+class CompiledGameTreeFormatError(ValueError):
+    """
+    Raised when a file is not a compiled game tree that this version of the loader can read
+    """
+    pass
+
+
+########################################################################################################################
+#   Tables that serve the side tables of a CompactGameTree directly from the mapped file
+
+
+class StringTable:
+    """
+    Sequence of strings stored as offsets into a UTF-8 blob: string i is text[offsets[i]:offsets[i+1]].
+    """
+
+    __slots__ = ("offsets", "text")
+
+    def __init__(self, offsets, text):
+        self.offsets = offsets
+        self.text = text
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return str(self.text[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+
+class SparseStringTable:
+    """
+    Read-only mapping {node_id: string} for the node_ids in the sorted array node_ids, with the strings stored as in
+    StringTable. Supports the .get() used by CompactNodeView.
+    """
+
+    __slots__ = ("node_ids", "strings")
+
+    def __init__(self, node_ids, offsets, text):
+        self.node_ids = node_ids
+        self.strings = StringTable(offsets, text)
+
+    def position_of(self, node_id):
+        position = bisect_left(self.node_ids, node_id)
+        if position < len(self.node_ids) and self.node_ids[position] == node_id:
+            return position
+        return None
+
+    def get(self, node_id, default=None):
+        position = self.position_of(node_id)
+        return default if position is None else self.strings[position]
+
+    def __contains__(self, node_id):
+        return self.position_of(node_id) is not None
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def items(self):
+        return ((self.node_ids[position], self.strings[position]) for position in range(len(self.node_ids)))
+
+
+class SparseNAGTable:
+    """
+    Read-only mapping {node_id: list of NAGs of the edge leading to node_id}, with the NAGs of the position-th entry in
+    values[offsets[position]:offsets[position+1]].
+    """
+
+    __slots__ = ("node_ids", "offsets", "values")
+
+    def __init__(self, node_ids, offsets, values):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.values = values
+
+    def nags_at(self, position):
+        return list(self.values[self.offsets[position]:self.offsets[position + 1]])
+
+    def get(self, node_id, default=None):
+        position = bisect_left(self.node_ids, node_id)
+        if position < len(self.node_ids) and self.node_ids[position] == node_id:
+            return self.nags_at(position)
+        return default
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def items(self):
+        return ((self.node_ids[position], self.nags_at(position)) for position in range(len(self.node_ids)))
+
+
+class FixedWidthFENTable:
+    """
+    Mapping {node_id: FEN} served from fixed-width records. Assignments (e.g., memoization by game_tree.fen_of_node())
+    go to an in-memory overlay, because the mapped file is read-only.
+    """
+
+    __slots__ = ("records", "overlay")
+
+    def __init__(self, records):
+        self.records = records
+        self.overlay = {}
+
+    def get(self, node_id, default=None):
+        fen = self.overlay.get(node_id)
+        if fen is not None:
+            return fen
+        if 0 <= node_id < len(self.records) // FEN_RECORD_WIDTH:
+            start = node_id * FEN_RECORD_WIDTH
+            return str(self.records[start:start + FEN_RECORD_WIDTH], "ascii").rstrip("\0")
+        return default
+
+    def __setitem__(self, node_id, fen):
+        self.overlay[node_id] = fen
+
+
+########################################################################################################################
+#   Writing
+
+
+def compiled_filepath_for_pgn_file(pgn_filepath):
+    """
+    Returns the conventional path of the compiled file for the PGN file at pgn_filepath: the same path with its extension
+    replaced by COMPILED_GAME_TREE_FILE_EXTENSION.
+    """
+    return os.path.splitext(pgn_filepath)[0] + COMPILED_GAME_TREE_FILE_EXTENSION
+
+
+def fens_of_all_nodes(tree):
+    """
+    Returns a list of the FEN of every node of tree, in node_id order, computed by a single depth-first traversal with
+    one board (one push per edge) rather than by replaying each node’s line.
+    """
+    list_of_fens = [None] * len(tree)
+    board = chess.Board(tree[INITIAL_NODE_ID].fen)
+    list_of_fens[INITIAL_NODE_ID] = board.fen()
+
+    # Each stack entry is (node_id, uci of move leading to it), or None to mark that a move is to be popped
+    stack = [(edge.destination_node_id, edge.movetext_dict["uci"])
+             for edge in reversed(tree[INITIAL_NODE_ID].edgeslist)]
+    while stack:
+        entry = stack.pop()
+        if entry is None:
+            board.pop()
+            continue
+        node_id, move_uci = entry
+        board.push_uci(move_uci)
+        list_of_fens[node_id] = board.fen()
+        stack.append(None)
+        stack.extend((edge.destination_node_id, edge.movetext_dict["uci"])
+                     for edge in reversed(tree[node_id].edgeslist))
+    return list_of_fens
+
+
+def encode_string_table(list_of_strings):
+    """
+    Returns (offsets as bytes, text as bytes) for a StringTable
+    """
+    offsets = array("I", [0])
+    encoded_strings = []
+    for string in list_of_strings:
+        encoded_string = string.encode("utf-8")
+        encoded_strings.append(encoded_string)
+        offsets.append(offsets[-1] + len(encoded_string))
+    return offsets.tobytes(), b"".join(encoded_strings)
+
+
+def encode_sparse_table(mapping, encode_value, bytes_per_item=1):
+    """
+    Returns (node_ids as bytes, offsets as bytes, values as bytes) for a sparse table, where encode_value(value) returns
+    the bytes of one value. Offsets count items of bytes_per_item bytes (e.g., 2 for a table of uint16 NAGs).
+    """
+    node_ids = array("I")
+    offsets = array("I", [0])
+    encoded_values = []
+    for node_id, value in sorted(mapping.items()):
+        encoded_value = encode_value(value)
+        node_ids.append(node_id)
+        encoded_values.append(encoded_value)
+        offsets.append(offsets[-1] + len(encoded_value) // bytes_per_item)
+    return node_ids.tobytes(), offsets.tobytes(), b"".join(encoded_values)
+
+
+def write_compiled_game_tree(nodedict, output_filepath, *, source_sha256=None, include_fens=False):
+    """
+    Writes nodedict (a GameTree as returned by buildtree(), or a CompactGameTree) to output_filepath in the compiled
+    format.
+
+    source_sha256:  SHA-256 digest (bytes) of the PGN file from which nodedict was built, recorded so that a stale
+                    compiled file can be detected.
+    include_fens:   If True, every node’s FEN is computed and stored, so that no FEN need ever be computed when serving.
+
+    The file is written to a temporary path and then renamed, so that a reader never sees a partially written file.
+    """
+    if sys.byteorder != "little":
+        fatal_developer_error("The compiled game-tree format is supported only on little-endian platforms.")
+
+    tree = compact_game_tree_from_nodedict(nodedict)
+
+    sections = []
+    for section_name, attribute_name, typecode in ARRAY_SECTIONS:
+        sections.append((section_name, getattr(tree, attribute_name).tobytes()))
+
+    sections.extend(zip((b"san_offs", b"san_text"), encode_string_table(tree.san_table)))
+    sections.extend(zip((b"cmt_node", b"cmt_offs", b"cmt_text"),
+                        encode_sparse_table(tree.comments, lambda comment: comment.encode("utf-8"))))
+    sections.extend(zip((b"pcm_node", b"pcm_offs", b"pcm_text"),
+                        encode_sparse_table(tree.preceding_comments, lambda comment: comment.encode("utf-8"))))
+    sections.extend(zip((b"nag_node", b"nag_offs", b"nag_vals"),
+                        encode_sparse_table(tree.nags,
+                                            lambda list_of_nags: array("H", list_of_nags).tobytes(),
+                                            bytes_per_item = array("H").itemsize)))
+    sections.extend(zip((b"hdr_offs", b"hdr_text"),
+                        encode_string_table([string for header in tree.headers for string in header])))
+
+    principal_line_index = principal_line_index_of(tree)
+    sections.extend(((b"pl_order", principal_line_index.order.tobytes()),
+                     (b"pl_pos", principal_line_index.position.tobytes()),
+                     (b"pl_end", principal_line_index.run_end.tobytes())))
+
+    flags = 0
+    if include_fens:
+        flags |= FLAG_HAS_FENS
+        records = []
+        for fen in fens_of_all_nodes(tree):
+            encoded_fen = fen.encode("ascii")
+            if len(encoded_fen) > FEN_RECORD_WIDTH:
+                fatal_developer_error(f"FEN longer than {FEN_RECORD_WIDTH} bytes: {fen}")
+            records.append(encoded_fen.ljust(FEN_RECORD_WIDTH, b"\0"))
+        sections.append((b"fens", b"".join(records)))
+
+    # Lays out the sections after the header and directory, each aligned to SECTION_ALIGNMENT
+    def aligned(offset):
+        return -(-offset // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+    offset = aligned(HEADER_STRUCT.size + len(sections) * SECTION_DIRECTORY_ENTRY_STRUCT.size)
+    directory = []
+    for section_name, section_bytes in sections:
+        directory.append(SECTION_DIRECTORY_ENTRY_STRUCT.pack(section_name, offset, len(section_bytes)))
+        offset = aligned(offset + len(section_bytes))
+
+    header = HEADER_STRUCT.pack(COMPILED_GAME_TREE_MAGIC,
+                                COMPILED_GAME_TREE_FORMAT_VERSION,
+                                flags,
+                                len(tree),
+                                len(tree.edge_destination),
+                                len(sections),
+                                tree.maximum_number_of_edges_per_node,
+                                source_sha256 or bytes(32))
+
+    temporary_filepath = output_filepath + ".tmp"
+    with open(temporary_filepath, "wb") as file:
+        file.write(header)
+        file.write(b"".join(directory))
+        for section_name, section_bytes in sections:
+            file.write(bytes(aligned(file.tell()) - file.tell()))
+            file.write(section_bytes)
+    os.replace(temporary_filepath, output_filepath)
+
+
+########################################################################################################################
+#   Loading
+
+
+def read_compiled_header(buffer):
+    """
+    Returns (flags, number_of_nodes, number_of_edges, maximum_number_of_edges_per_node, source_sha256,
+    {section name: memoryview of section}) for the compiled file in buffer. Raises CompiledGameTreeFormatError if buffer
+    is not a readable compiled file.
+    """
+    if len(buffer) < HEADER_STRUCT.size:
+        raise CompiledGameTreeFormatError("File is too short to be a compiled game tree.")
+
+    (magic, version, flags, number_of_nodes, number_of_edges, number_of_sections, maximum_number_of_edges_per_node,
+     source_sha256) = HEADER_STRUCT.unpack_from(buffer, 0)
+    if magic != COMPILED_GAME_TREE_MAGIC:
+        raise CompiledGameTreeFormatError("File is not a compiled game tree (bad magic number).")
+    if version != COMPILED_GAME_TREE_FORMAT_VERSION:
+        raise CompiledGameTreeFormatError(f"Unsupported compiled game-tree format version {version} "
+                                          f"(expected {COMPILED_GAME_TREE_FORMAT_VERSION}).")
+
+    if HEADER_STRUCT.size + number_of_sections * SECTION_DIRECTORY_ENTRY_STRUCT.size > len(buffer):
+        raise CompiledGameTreeFormatError("Section directory extends past the end of the file.")
+
+    sections = {}
+    view = memoryview(buffer)
+    for index in range(number_of_sections):
+        section_name, offset, length = SECTION_DIRECTORY_ENTRY_STRUCT.unpack_from(
+            buffer, HEADER_STRUCT.size + index * SECTION_DIRECTORY_ENTRY_STRUCT.size)
+        if offset % SECTION_ALIGNMENT:
+            raise CompiledGameTreeFormatError(f"Section {section_name!r} is not aligned to {SECTION_ALIGNMENT} bytes.")
+        if offset + length > len(buffer):
+            raise CompiledGameTreeFormatError(f"Section {section_name!r} extends past the end of the file.")
+        sections[section_name.rstrip(b"\0")] = view[offset:offset + length]
+    return flags, number_of_nodes, number_of_edges, maximum_number_of_edges_per_node, source_sha256, sections
+
+
+def read_source_sha256_of_compiled_file(compiled_filepath):
+    """
+    Returns the source SHA-256 digest recorded in the compiled file, reading only its header
+    """
+    with open(compiled_filepath, "rb") as file:
+        header_bytes = file.read(HEADER_STRUCT.size)
+    if len(header_bytes) < HEADER_STRUCT.size or header_bytes[:8] != COMPILED_GAME_TREE_MAGIC:
+        raise CompiledGameTreeFormatError("File is not a compiled game tree.")
+    return HEADER_STRUCT.unpack(header_bytes)[-1]
+
+
+def load_compiled_game_tree(compiled_filepath):
+    """
+    Memory-maps the compiled file at compiled_filepath and returns a CompactGameTree whose arrays and side tables are
+    views onto the mapping. Nothing is decoded up front except the (few) PGN headers.
+
+    Raises CompiledGameTreeFormatError if the file is not a readable compiled game tree.
+    """
+    if sys.byteorder != "little":
+        raise CompiledGameTreeFormatError("Compiled game trees can be loaded only on little-endian platforms.")
+
+    with open(compiled_filepath, "rb") as file:
+        try:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Raised by mmap for an empty file
+            raise CompiledGameTreeFormatError("File is empty.") from None
+
+    (flags, number_of_nodes, number_of_edges, maximum_number_of_edges_per_node, source_sha256,
+     sections) = read_compiled_header(mapping)
+
+    def section(name, typecode=None):
+        try:
+            section_view = sections[name]
+        except KeyError:
+            raise CompiledGameTreeFormatError(f"Missing section {name!r}.") from None
+        if not typecode:
+            return section_view
+        if len(section_view) % struct.calcsize(typecode):
+            raise CompiledGameTreeFormatError(f"Length of section {name!r} is not a multiple of its item size.")
+        return section_view.cast(typecode)
+
+    tree = CompactGameTree()
+    tree.backing_buffer = mapping
+    for section_name, attribute_name, typecode in ARRAY_SECTIONS:
+        setattr(tree, attribute_name, section(section_name, typecode))
+    if len(tree.parent_id) != number_of_nodes or len(tree.edge_destination) != number_of_edges:
+        raise CompiledGameTreeFormatError("Section sizes disagree with the header.")
+
+    tree.san_table = StringTable(section(b"san_offs", "I"), section(b"san_text"))
+    tree.comments = SparseStringTable(section(b"cmt_node", "I"), section(b"cmt_offs", "I"), section(b"cmt_text"))
+    tree.preceding_comments = SparseStringTable(section(b"pcm_node", "I"),
+                                                section(b"pcm_offs", "I"),
+                                                section(b"pcm_text"))
+    tree.nags = SparseNAGTable(section(b"nag_node", "I"), section(b"nag_offs", "I"), section(b"nag_vals", "H"))
+
+    header_strings = StringTable(section(b"hdr_offs", "I"), section(b"hdr_text"))
+    tree.headers = [(header_strings[index], header_strings[index + 1]) for index in range(0, len(header_strings), 2)]
+
+    if b"pl_order" in sections:
+        tree.principal_line_index = PrincipalLineIndex(section(b"pl_order", "I"),
+                                                       section(b"pl_pos", "I"),
+                                                       section(b"pl_end", "I"))
+
+    if flags & FLAG_HAS_FENS:
+        tree.fens = FixedWidthFENTable(section(b"fens"))
+    else:
+        tree.fens = {INITIAL_NODE_ID: FEN_INITIAL}
+
+    tree.maximum_number_of_edges_per_node = maximum_number_of_edges_per_node
+    return tree
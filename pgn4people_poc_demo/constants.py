@@ -29,6 +29,25 @@ CHOSEN_SAMPLE_PGN_FILE = PGNFILE1
 # Path of sample PGN file
 PATH_OF_PGN_FILE = DIRNAME_SAMPLE_PGNS + CHOSEN_SAMPLE_PGN_FILE
 
+# Directory, relative to the package, of the PGN library: each PGN file in it is served at /<pgn_id>/node/<t>/<b>, where
+# pgn_id is the file’s name without its .pgn extension (see pgn_library.py)
+DIRNAME_PGN_LIBRARY = DIRNAME_SAMPLE_PGNS
+
+# Maximum estimated memory, in bytes, of the trees of the PGN library held at once; least-recently-used trees beyond it
+# are evicted and rebuilt on next use. A tree’s estimate is the most it can grow to while it is served (see
+# pgn_library.estimated_bytes_of_nodedict()): the tree itself, about 800 bytes per node for a GameTree and 60 for a
+# CompactGameTree, whether built or memory-mapped from a compiled file (see benchmarks/bench_compact_game_tree.py);
+# plus what is attached to it lazily: a memoized FEN for every node (about 120 bytes per node for a GameTree, 190 for a
+# CompactGameTree), a transposition index (about 650 bytes per node), and a full row-fragment cache (about 1,700 bytes
+# per cached row; see VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY_PER_NODE).
+PGN_LIBRARY_MAXIMUM_TREE_BYTES = 512_000_000
+ESTIMATED_BYTES_PER_NODE_OF_GAME_TREE = 800
+ESTIMATED_BYTES_PER_NODE_OF_COMPACT_GAME_TREE = 60
+ESTIMATED_BYTES_PER_MEMOIZED_FEN_OF_GAME_TREE = 120
+ESTIMATED_BYTES_PER_MEMOIZED_FEN_OF_COMPACT_GAME_TREE = 200
+ESTIMATED_BYTES_PER_NODE_OF_TRANSPOSITION_INDEX = 700
+ESTIMATED_BYTES_PER_ROW_FRAGMENT = 1_800
+
 # Descriptor presented when sample PGN is chosen
 # PUBLIC_BASENAME_SAMPLE_PGN = f"Built-in sample PGN: {CHOSEN_SAMPLE_PGN_FILE}"
 # VERSION_SAMPLE_PGN = "1.0.0"
@@ -47,11 +66,91 @@ CLOSE_VARIATION_INDICATOR = "<)>"
 UNDEFINED_TREEISH_VALUE = -1
 NODE_IS_TERMINAL_NODE = -1
 
+# Entry of CompactGameTree.checked_king_square for a node whose player to move is not in check (a GameNode has None)
+NO_CHECKED_KING_SQUARE = -1
+
 INITIAL_NODE_ID = 0
 
 # The choice_id at a node that corresponds to the main line.
 INDEX_MAINLINE = 0
 
+# If True, the game tree is stored as an array-backed CompactGameTree (see compact_game_tree.py), which uses a fraction
+# of the memory of a GameTree of GameNode/Edge objects, at the cost of somewhat slower access to individual nodes.
+USE_COMPACT_GAME_TREE = False
+
+# If True, the transposition index of a tree (its positions, keyed by polyglot Zobrist hash, with transpositions merged;
+# see transpositions.py) is built when the tree is built from PGN, rather than on first use. Building it takes a
+# chess.Board push and a Zobrist hash per node, comparable to the cost of building the tree itself.
+BUILD_TRANSPOSITION_INDEX = False
+
+# Extension of a compiled game-tree file (see compiled_game_tree.py). When a file with this extension and the same stem
+# as the PGN file exists, and was compiled from the PGN file’s current content, the tree is loaded from it rather than
+# built from the PGN.
+COMPILED_GAME_TREE_FILE_EXTENSION = ".pgn4tree"
+
+# Approximate bytes of PGN per shard when a collection is compiled in parallel (see compile_pgn_collection.py): large
+# enough that per-shard overhead (a task submitted to a worker process and its result returned) is negligible, small
+# enough that shards balance across workers and progress is reported often
+BULK_COMPILE_SHARD_BYTES = 256_000
+# Minimum number of shards per worker process, so that the shards of a small collection still balance across workers
+BULK_COMPILE_MINIMUM_SHARDS_PER_WORKER = 4
+
+# Extension of the game index of a multi-game PGN file (see pgn_game_index.py), kept beside the PGN file with the same
+# stem
+GAME_INDEX_FILE_EXTENSION = ".pgn4index"
+
+# Maximum number of rendered /node/<target>/<board> pages held in the response cache (see traverse.py)
+PAGE_CACHE_CAPACITY = 2_000
+
+# max-age, in seconds, of the Cache-Control header of a /node/<target>/<board> page. Browsers and CDNs may serve a page
+# without revalidating for this long; thereafter they revalidate with If-None-Match and typically receive a 304. A change
+# to the PGN thus reaches such a client within at most this many seconds.
+PAGE_CACHE_MAX_AGE_SECONDS = 300
+
+# If True, page requests are timed stage by stage, and the timings sent in a Server-Timing response header, logged, and
+# aggregated in-process (see request_timing.py). If False, the instrumentation is bypassed.
+SERVER_TIMING_ENABLED = False
+
+# Number of timed requests between INFO-level log summaries of the aggregated stage timings
+SERVER_TIMING_SUMMARY_INTERVAL = 1_000
+
+# If True, requests are counted and timed, and the metrics served at /metrics in the Prometheus text format (see
+# metrics.py)
+METRICS_ENABLED = True
+
+# Directory in which each worker process writes a snapshot of its metrics, so that /metrics, whichever worker serves it,
+# reports the totals of all workers. None: report only the serving process’s own metrics (enough for a single process).
+# Empty the directory when the server is (re)deployed.
+METRICS_DIRECTORY = None
+
+# Minimum interval, in seconds, between writes of a worker’s snapshot to METRICS_DIRECTORY
+METRICS_FLUSH_INTERVAL_SECONDS = 5
+
+# Upper bounds, in seconds, of the buckets of the request-latency histograms
+METRICS_LATENCY_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Subtree slices returned by /api/subtree/<node_id> (see api.py): the number of plies below the node included when the
+# request doesn’t specify one, the maximum number of plies a request may specify, and the maximum number of nodes in a
+# slice (nodes nearest the root of the slice are kept).
+API_SUBTREE_DEFAULT_PLIES = 8
+API_SUBTREE_MAXIMUM_PLIES = 40
+API_SUBTREE_MAXIMUM_NODES = 2_000
+
+# Maximum bytes (of compact UTF-8 JSON) of the lines in a prefetch bundle returned by /api/prefetch/<target>/<board>
+# (see prefetch_bundle.py). Lines nearest the board’s row are kept; at typically 1–3 KB per line, the default holds
+# every line of most views.
+PREFETCH_BUNDLE_BYTE_BUDGET = 64_000
+
+# Maximum number of pre-rendered variations-table rows cached per game tree (see variations_table.RowFragment): at most
+# VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY_PER_NODE per node of the tree, and never more than
+# VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY. Browsing every node of a tree renders about 1.2 distinct rows per node, so the
+# per-node cap rarely evicts; it bounds the memory of a small tree’s cache in proportion to the tree.
+VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY = 50_000
+VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY_PER_NODE = 2
+
+# Maximum number of rendered SVG chess boards held in the board cache (see display_chess_board.py). Each is about 30 KB.
+SVG_BOARD_CACHE_CAPACITY = 1_000
+
 # Options for formatting of variations table
 
 # Whether to preface Black alternative halfmoves with ellipses (“…”)
@@ -118,10 +217,24 @@ VARTABLE_CSS_NAME_ALTERNATIVE_BLACK = f'{VARTABLE_CSS_NAME_ALTERNATIVE_BASE} {VA
 
 VARTABLE_BASE_URL = "/node/"
 VARTABLE_ANCHOR_CLASS = f"{VARTABLE_CSS_NAME_ALTERNATIVE_BASE}-anchor"
-VARTABLE_ANCHOR_PREFIX_OPEN = f'<a class="{VARTABLE_ANCHOR_CLASS}" href="{VARTABLE_BASE_URL}'
+VARTABLE_ANCHOR_PREFIX_OPEN_BEFORE_URL = f'<a class="{VARTABLE_ANCHOR_CLASS}" href="'
+VARTABLE_ANCHOR_PREFIX_OPEN = VARTABLE_ANCHOR_PREFIX_OPEN_BEFORE_URL + VARTABLE_BASE_URL
 VARTABLE_ANCHOR_PREFIX_CLOSE = '">'
 VARTABLE_ANCHOR_SUFFIX = '</a>'
 
+# How the chess board on the variations-table page is drawn:
+#   BOARD_RENDERING_MODE_SPRITE:        The page carries only the board’s FEN, last move, and checked-king square, and
+#                                       the browser composes the board from the (cacheable) piece sprite; see
+#                                       static/js/sprite_board.js.
+#   BOARD_RENDERING_MODE_INLINE_SVG:    The page embeds the complete board, as rendered by chess.svg.board(); see
+#                                       display_chess_board.py.
+BOARD_RENDERING_MODE_SPRITE = "sprite"
+BOARD_RENDERING_MODE_INLINE_SVG = "inline_svg"
+BOARD_RENDERING_MODE = BOARD_RENDERING_MODE_SPRITE
+
+# Piece sprite (relative to the static folder) from which the board is composed in BOARD_RENDERING_MODE_SPRITE
+BOARD_SPRITE_FILENAME = "assets/images/chessboard-sprite.svg"
+
 # Parameters for display of SVG chess board
 SVG_BOARD_USE_WEB_SERVICE = True
 SVG_BOARD_BASE_URL = "https://backscattering.de/web-boardimage/board.svg?"
@@ -1,12 +1,17 @@
 """
 Module to display a chess board alongside the variations table.
+
+Rendering a board with chess.svg.board() costs far more than anything else on the board path, yet a repertoire has few
+distinct boards that are displayed often, so rendered boards are memoized in svg_board_cache. Nor is any chess logic
+done per request to find whether the king is in check: that is recorded on each node when the tree is built (see
+GameNode.checked_king_square).
+
+python-chess is imported by the functions that need it, on first use, so that importing this module (and thus
+create_app()) does not load it.
 """
 
 import logging
 
-import chess
-import chess.svg
-
 from pgn4people_poc_demo.error_processing import fatal_error_exit_without_traceback
 
 from . constants import (SVG_BOARD_BASE_URL,
@@ -21,9 +26,16 @@ from . constants import (SVG_BOARD_BASE_URL,
                          SVG_BOARD_SIZE_VALUE,
                          SVG_BOARD_COORDINATES_BOOLEAN_VALUE,
                          SVG_BOARD_ORIENTATION_VALUE,
-                         SVG_BOARD_USE_WEB_SERVICE
+                         SVG_BOARD_USE_WEB_SERVICE,
+                         SVG_BOARD_CACHE_CAPACITY,
                         )
-from . utilities import is_white_move
+from . game_tree import fen_of_node
+from . lru_cache import LRUCache
+
+
+# Rendered SVG boards, keyed by the parameters that determine the rendering; see construct_svg_chessboard()
+svg_board_cache = LRUCache(SVG_BOARD_CACHE_CAPACITY)
+
 
 def compile_parameters_for_chessboard_svg(nodedict, node_id_for_board):
     """
@@ -37,8 +49,8 @@ def compile_parameters_for_chessboard_svg(nodedict, node_id_for_board):
 
     node_to_display = nodedict[node_id_for_board]
 
-    # Get fen for position
-    fen_value = node_to_display.fen
+    # Get fen for position (computed lazily; see game_tree.fen_of_node())
+    fen_value = fen_of_node(nodedict, node_id_for_board)
     parameters_for_svg_chess_board.fen_value = fen_value
 
     # Find last move
@@ -61,21 +73,15 @@ def compile_parameters_for_chessboard_svg(nodedict, node_id_for_board):
     
     parameters_for_svg_chess_board.do_highlight_last_move = do_highlight_last_move
 
-    # Get square of king in check
-    board = chess.Board(fen_value)
-    if board.is_check():
+    # Get square of king in check, which was found when the tree was built
+    checked_king_square_index = node_to_display.checked_king_square
+    if checked_king_square_index is not None:
         king_is_in_check = True
 
-        # Finds square of player-to-move’s King
-        halfmovenumber = node_to_display.halfmovenumber
-        if is_white_move(halfmovenumber):
-            player_to_move = chess.WHITE
-        else:
-            player_to_move = chess.BLACK
-
-        checked_king_square_index = board.king(player_to_move)
+        import chess
         checked_king_square_name = chess.square_name(checked_king_square_index)
 
+        parameters_for_svg_chess_board.checked_king_square = checked_king_square_index
         parameters_for_svg_chess_board.checked_king_square_name = checked_king_square_name
 
     else:
@@ -86,10 +92,51 @@ def compile_parameters_for_chessboard_svg(nodedict, node_id_for_board):
     return parameters_for_svg_chess_board
 
 
+def board_of_node(nodedict, node_id):
+    """
+    Returns, as a JSON-compatible dict, what the board shows for node node_id:
+        "fen":          FEN of the position
+        "last_move":    UCI of the move that led to the position; None for the initial node
+        "check":        name of the square of the king in check, if any; else None
+    """
+    parameters = compile_parameters_for_chessboard_svg(nodedict, node_id)
+    return {
+            "fen": parameters.fen_value,
+            "last_move": parameters.last_move_as_uci if parameters.do_highlight_last_move else None,
+            "check": parameters.checked_king_square_name,
+           }
+
+
 def construct_svg_chessboard(parameters):
+    """
+    Returns SVG of chessboard, from svg_board_cache if the same board has been rendered before, else as rendered by
+    render_svg_chessboard().
+
+    The cache key comprises every parameter that affects the rendering. (board_theme does not: it applies only to the
+    web service.)
+    """
+    last_move_as_uci = parameters.last_move_as_uci if parameters.do_highlight_last_move else None
+    cache_key = (parameters.fen_value,
+                 last_move_as_uci,
+                 parameters.checked_king_square,
+                 parameters.board_orientation,
+                 parameters.board_size,
+                 parameters.use_coordinates)
+
+    board_as_svg_string = svg_board_cache.get(cache_key)
+    if board_as_svg_string is None:
+        board_as_svg_string = render_svg_chessboard(parameters)
+        svg_board_cache.put(cache_key, board_as_svg_string)
+    return board_as_svg_string
+
+
+def render_svg_chessboard(parameters):
     """
     Construct SVG of chessboard using chess.svg.board method
     """
+    import chess
+    import chess.svg
+
     board_from_fen = chess.Board(parameters.fen_value)
 
     def orientation_for_chess_svg_board_from_player_color_string(player_color_string):
@@ -121,7 +168,7 @@ def construct_svg_chessboard(parameters):
                                           orientation = orientation_value,
                                           coordinates = parameters.use_coordinates,
                                           lastmove = last_move_to_highlight,
-                                          check = parameters.checked_king_square_name
+                                          check = parameters.checked_king_square
                                           )
     
     return board_as_svg_string
@@ -208,6 +255,8 @@ class SVGChessBoardParameters():
             "String of last move as UCI for highlighting the last move",
         "king_is_in_check":
             "Boolean: True => The king of player to move is in check",
+        "checked_king_square":
+            "Square (0–63) on which the checked King resides (chess.svg.board() requires the square, not its name)",
         "checked_king_square_name":
             "Name of square on which the checked King resides",
     }
@@ -220,6 +269,7 @@ class SVGChessBoardParameters():
                  do_highlight_last_move = False,
                  last_move_as_uci = None,
                  king_is_in_check = False ,
+                 checked_king_square = None,
                  checked_king_square_name = None,
                  ):
                  self.board_orientation = board_orientation
@@ -229,6 +279,7 @@ class SVGChessBoardParameters():
                  self.do_highlight_last_move = do_highlight_last_move
                  self.last_move_as_uci = last_move_as_uci
                  self.king_is_in_check = king_is_in_check
+                 self.checked_king_square = checked_king_square
                  self.checked_king_square_name = checked_king_square_name
     
 
@@ -62,3 +62,12 @@ def extract_text_comments_for_current_node(nodedict, node_id_for_board):
         postcomment = crickets
 
     return (movetext_string, precomment, postcomment)
+
+
+def comments_of_node(nodedict, node_id):
+    """
+    Returns, as a JSON-compatible dict, what the text-annotation area shows for node node_id (see
+    extract_text_comments_for_current_node()): "movetext", "precomment", and "postcomment".
+    """
+    movetext_string, precomment, postcomment = extract_text_comments_for_current_node(nodedict, node_id)
+    return {"movetext": movetext_string, "precomment": precomment, "postcomment": postcomment}
@@ -4,11 +4,11 @@ Methods to traverse the game tree birectionally with output.
 See generally pgn4people-poc/docs/game-tree-concepts.md
 """
 
-from . classes_arboreal import (GameNode,
-                                GameTreeReport)
+from . classes_arboreal import GameTreeReport
 from . error_processing import fatal_developer_error
 # from . construct_output import print_single_node_to_console
 from . import constants
+from . python_chess_utilities import fen_after_uci_moves
 from . utilities import (fullmovenumber_from_halfmove,
                              is_white_move)
 
@@ -37,26 +37,83 @@ def deviation_history_of_node(nodedict, target_node_id):
     To any target node there corresponds a unique deviation history (modulo recognition that a dictionary is unordered)
     that brings the play to that node.
 
+    Method:
+    Rather than walking back to the initial node one halfmove at a time, the walk hops from deviation to deviation
+    using each node’s precomputed .nearest_deviation_node_id (the nearest node, among the node and its predecessors,
+    that is reached by a non-mainline choice). Thus the cost is proportional to the number of deviations, not to the
+    number of halfmoves, on the path to target_node_id. Deviations are recorded in the same order as by a
+    halfmove-by-halfmove walk, i.e., from target_node_id back toward the initial node.
     """
     deviation_history = {}
 
-    # Start at the target node and traverse the tree backward to the origin, recording the
-    # (node_id, choice_id) at every immediate-predecessor node at which a non-mainline choice was made.
-    # By "record," means add (node_id, choice_id) as a key/value pair to the history dictionary.
+    deviating_node_id = nodedict[target_node_id].nearest_deviation_node_id
+    while deviating_node_id != constants.UNDEFINED_TREEISH_VALUE:
+        # deviating_node_id was reached by a non-mainline choice at its originating node: record that deviation, then
+        # hop to the nearest deviation on the path to the originating node
+        deviating_node = nodedict[deviating_node_id]
+        immediate_predecessor_node_id = deviating_node.originatingnode_id
+        deviation_history[immediate_predecessor_node_id] = deviating_node.choice_id_at_originatingnode
+        deviating_node_id = nodedict[immediate_predecessor_node_id].nearest_deviation_node_id
 
-    current_node_id = target_node_id
-    while current_node_id != constants.INITIAL_NODE_ID:
-        # This loop stops when it reaches the original node (id=0), which has no predecessor.
+    return deviation_history
 
-        immediate_predecessor_node_id = nodedict[current_node_id].originatingnode_id
-        choice_at_predecessor = nodedict[current_node_id].choice_id_at_originatingnode
 
-        if choice_at_predecessor != constants.INDEX_MAINLINE:
-            # Action other than zero implies deviation from the mainline at the predecessor.
-            deviation_history[immediate_predecessor_node_id] = choice_at_predecessor
-        current_node_id = immediate_predecessor_node_id
+def fen_of_node(nodedict, node_id):
+    """
+    Returns the FEN of the position corresponding to node node_id.
 
-    return deviation_history
+    buildtree() does not compute the FEN of every node (doing so was the dominant cost of building the tree); only the
+    initial node’s FEN is known at build time. The FEN of any other node is instead computed the first time it is
+    requested, by replaying from the nearest ancestor whose FEN is already known the moves that lead to node_id.
+    The result is memoized in the node’s .fen attribute.
+
+    (The memoization is one of the lazily attached derived caches described in classes_arboreal.GameTree. It is benign
+    under concurrency: two requests racing on the same node compute, and store, the identical string.)
+    """
+    node = nodedict[node_id]
+    if node.fen is not None:
+        return node.fen
+
+    # Walks back toward the initial node, collecting (in reverse order) the moves that lead to node_id, until reaching
+    # a node whose FEN is known
+    list_of_moves_uci_reversed = []
+    current_node = node
+    while current_node.fen is None:
+        originating_node = nodedict[current_node.originatingnode_id]
+        edge = originating_node.edgeslist[current_node.choice_id_at_originatingnode]
+        list_of_moves_uci_reversed.append(edge.movetext_dict["uci"])
+        current_node = originating_node
+
+    node.fen = fen_after_uci_moves(current_node.fen, reversed(list_of_moves_uci_reversed))
+    return node.fen
+
+
+def memoize_fens_of_subtree(nodedict, root_node_id, set_of_node_ids):
+    """
+    Computes, and memoizes as fen_of_node() does, the FEN of every node of set_of_node_ids, which must, together with
+    root_node_id, form a subtree rooted at root_node_id (i.e., every node’s originating node is either root_node_id or
+    in set_of_node_ids).
+
+    The subtree is walked depth first on a single chess.Board, pushing each move on the way down and popping it on the
+    way back, so each FEN costs one move and one serialization rather than a FEN round trip as in fen_of_node().
+    """
+    import chess
+
+    board = chess.Board(fen_of_node(nodedict, root_node_id))
+
+    def visit(node_id):
+        for edge in nodedict[node_id].edgeslist:
+            destination_node_id = edge.destination_node_id
+            if destination_node_id not in set_of_node_ids:
+                continue
+            board.push(chess.Move.from_uci(edge.movetext_dict["uci"]))
+            destination_node = nodedict[destination_node_id]
+            if destination_node.fen is None:
+                destination_node.fen = board.fen()
+            visit(destination_node_id)
+            board.pop()
+
+    visit(root_node_id)
 
 
 def compile_movetext_elements_for_output_for_single_node(node,
@@ -116,11 +173,9 @@ def compile_movetext_elements_for_output_for_single_node(node,
     # Case: NOT a terminal node. Thus we proceed to print a line
     is_terminal_node = False
 
-    # Constructs lists of indices reflecting a reordered list of edges to display
-    construct_display_order_of_node_edges(node, choice_id_as_mainline)
-
-    # The following is a list of indices
-    display_order_of_edges = node.display_order_of_edges
+    # Constructs list of indices reflecting a reordered list of edges to display.
+    # This is local to the current request; nothing is written to the (shared) node.
+    display_order_of_edges = construct_display_order_of_node_edges(node, choice_id_as_mainline)
 
     # Gets mainline edge for the player with non-mainline alternatives
     mainline_edge = node.edgeslist[display_order_of_edges[0]]
@@ -175,45 +230,49 @@ def compile_movetext_elements_for_output_for_single_node(node,
 
 def construct_display_order_of_node_edges(node, choice_id_as_mainline):
     """
-    For (a) a node (an instance of class GameNode) and (b) choice_id_as_mainline, an integer, constructs
-        node.display_order_of_edges
+    For (a) a node (an instance of class GameNode) and (b) choice_id_as_mainline, an integer, constructs and returns
+        display_order_of_edges
 
-        where node.display_order_of_edges is a list of INDICES (not edges)
+        where display_order_of_edges is a list of INDICES (not edges)
 
         such that
-            len(node.display_order_of_edges) = node.number_of_edges
-            node.display_order_of_edges[0] = choice_id_as_mainline
+            len(display_order_of_edges) = node.number_of_edges
+            display_order_of_edges[0] = choice_id_as_mainline
             if choice_id_as_mainline != 0,
-                node.display_order_of_edges[1] = 0
-            and the remaining slots in node.display_order_of_edges are filled with remaining edges in node.edgeslist and
-            in that order. I.e., the sequence: for j=2,…,len-1, node.display_order_of_edges[j] is the same as
+                display_order_of_edges[1] = 0
+            and the remaining slots in display_order_of_edges are filled with remaining edges in node.edgeslist and
+            in that order. I.e., the sequence: for j=2,…,len-1, display_order_of_edges[j] is the same as
             for k = 1,…,len-1 (k≠choice_id_as_mainline)
             In other words, (a) choice_id_as_mainline becomes the 0th element, (b) the previously mainline move
             edgeslist[0] becomes the first alternative,  and (c) the original indices of all the other elements of
             edgeslist are imported into display_order_of_edges in numerical order.
     
-    This function does NOT return anything. It adds a property to an existing instance of class Edge.
+    The display order is a property of a particular request (i.e., of which edge that request treats as the main line),
+    not of the node. It is therefore returned to the caller rather than stored on the node, which may be shared by
+    concurrent requests.
     """
 
-    node.display_order_of_edges = []
+    display_order_of_edges = []
 
-    # Assigns index of designated non-mainline edge to zero-th element of .display_order_of_edges
-    node.display_order_of_edges.append(choice_id_as_mainline)
+    # Assigns index of designated non-mainline edge to zero-th element of display_order_of_edges
+    display_order_of_edges.append(choice_id_as_mainline)
 
     for jindex in range(0, node.number_of_edges):
         if jindex != choice_id_as_mainline:
-            node.display_order_of_edges.append(jindex)
+            display_order_of_edges.append(jindex)
         else:
             # When jindex == choice_id_as_mainline, that element should not be copied to display_order_of_edges
             # because it was already copied in the first step.
             pass
     # end for
     
-    if len(node.display_order_of_edges) != node.number_of_edges:
+    if len(display_order_of_edges) != node.number_of_edges:
         fatal_developer_error(
-          f".display_order_of_edges had {len(node.display_order_of_edges)} elements rather than {node.number_of_edges}."
+          f"display_order_of_edges had {len(display_order_of_edges)} elements rather than {node.number_of_edges}."
         )
 
+    return display_order_of_edges
+
 
 class Variations_Table_Line():
     def __init__(self,
@@ -267,53 +326,44 @@ class Variations_Table_Line():
 
 def characterize_gametree(nodedict):
     """
-    Takes nodedict as representation of the tree as {node_id: node} key:value pairs, where node is an instance of the
-    GameNode class.
+    Takes nodedict, an instance of GameTree, as representation of the tree as {node_id: node} key:value pairs, where
+    node is an instance of the GameNode class.
 
-    Statistically analyzes the game tree and returns the result  in class attributes of the GameTreeReport class.
+    Statistically analyzes the game tree and returns the result as an instance of the GameTreeReport class.
 
     There is a one-to-one relationship between (a) a “line” and (b) a terminal node.
 
-    The set of terminal nodes (set_of_terminal_nodes) is a class attribute of the GameNode class and can be accessed
-    (read) via any node: node.set_of_terminal_nodes.
-        However, .set_of_terminal_nodes shouldn't be changed when referenced as node.set_of_terminal_nodes, because
-        then .set_of_terminal_nodes would become an instance attribute. (That said, I apparently was getting away with
-        it. But since I didn't understand why, I changed it to self.__class__.set_of_terminal_nodes,)
-
-    However, while set_of_nodes and set_of_nonterminal_nodes are both compiled during the buildtree() process, 
-    set_of_terminal_nodes is not and must be derived from set_of_nodes and set_of_nonterminal_nodes.
+    The sets of all nodes and of nonterminal nodes are compiled during the buildtree() process and held by the GameTree
+    itself; the set of terminal nodes is derived from them (GameTree.set_of_terminal_node_IDs).
     """
 
-    #Derive set_of_terminal_nodes
+    game_tree_report = GameTreeReport()
 
     # Compute number of nodes (i.e., number of positions)
-    GameTreeReport.number_of_nodes = len(nodedict)
+    game_tree_report.number_of_nodes = len(nodedict)
 
-    # Calculates set of terminal nodes from previously calculated set of all nodes and set of all nonterminal nodes
-    GameNode.set_of_terminal_node_IDs = GameNode.set_of_node_IDs.difference(GameNode.set_of_nonterminal_node_IDs)
-    GameTreeReport.number_of_lines = len(GameNode.set_of_terminal_node_IDs)
+    # Derives set of terminal nodes from previously calculated set of all nodes and set of all nonterminal nodes
+    set_of_terminal_node_IDs = nodedict.set_of_terminal_node_IDs
+    game_tree_report.number_of_lines = len(set_of_terminal_node_IDs)
+
+    depth_histogram = game_tree_report.depth_histogram
+    halfmove_length_histogram = game_tree_report.halfmove_length_histogram
 
-    # Initialized counters and histograms
-    GameTreeReport.max_halfmove_length_of_a_line = 0
-    GameTreeReport.max_depth_of_a_line = 0
-    GameTreeReport.depth_histogram = {}
-    GameTreeReport.halfmove_length_histogram = {}
-    
     # Loops througn terminal nodes
-    for terminal_node_ID in GameNode.set_of_terminal_node_IDs:
+    for terminal_node_ID in set_of_terminal_node_IDs:
 
         terminal_node = nodedict[terminal_node_ID]
 
         # Process depth
         depth = terminal_node.depth
 
-        if depth > GameTreeReport.max_depth_of_a_line:
-            GameTreeReport.max_depth_of_a_line = depth
+        if depth > game_tree_report.max_depth_of_a_line:
+            game_tree_report.max_depth_of_a_line = depth
         
-        if depth in GameTreeReport.depth_histogram.keys():
-            GameTreeReport.depth_histogram[depth] += 1
+        if depth in depth_histogram.keys():
+            depth_histogram[depth] += 1
         else:
-            GameTreeReport.depth_histogram[depth] = 1
+            depth_histogram[depth] = 1
     
         # Process halfmove_length
         # The length of a line is the halfmove number associated with the line’s terminal node MINUS 1, because the
@@ -321,25 +371,24 @@ def characterize_gametree(nodedict):
         # mode).
         halfmove_length = terminal_node.halfmovenumber - 1
 
-        if halfmove_length > GameTreeReport.max_halfmove_length_of_a_line:
-            GameTreeReport.max_halfmove_length_of_a_line = halfmove_length
+        if halfmove_length > game_tree_report.max_halfmove_length_of_a_line:
+            game_tree_report.max_halfmove_length_of_a_line = halfmove_length
         
-        if halfmove_length in GameTreeReport.halfmove_length_histogram.keys():
-            GameTreeReport.halfmove_length_histogram[halfmove_length] += 1
+        if halfmove_length in halfmove_length_histogram.keys():
+            halfmove_length_histogram[halfmove_length] += 1
         else:
-            GameTreeReport.halfmove_length_histogram[halfmove_length] = 1
+            halfmove_length_histogram[halfmove_length] = 1
 
     # Loops through ALL nodes
-    GameTreeReport.number_of_edges_histogram = {}
-    max_number_of_edges_on_a_node = 0
+    number_of_edges_histogram = game_tree_report.number_of_edges_histogram
 
-    for node_id in GameNode.set_of_node_IDs:
+    for node_id in nodedict.set_of_node_IDs:
         node = nodedict[node_id]
         number_of_edges = node.number_of_edges
-        if number_of_edges > max_number_of_edges_on_a_node:
-            max_number_of_edges_on_a_node = number_of_edges
         
-        if number_of_edges in GameTreeReport.number_of_edges_histogram.keys():
-            GameTreeReport.number_of_edges_histogram[number_of_edges] += 1
+        if number_of_edges in number_of_edges_histogram.keys():
+            number_of_edges_histogram[number_of_edges] += 1
         else:
-            GameTreeReport.number_of_edges_histogram[number_of_edges] = 1
+            number_of_edges_histogram[number_of_edges] = 1
+
+    return game_tree_report
@@ -0,0 +1,234 @@
+"""
+Process-wide cache of game trees, so that the PGN file is parsed and the tree built only once per process rather than
+on every request.
+
+A cached tree is keyed on the path of its PGN file. Each time the tree is requested, the file is stat-ed:
+    • If its (mtime, size) is unchanged since the tree was built, the cached tree is returned (a “hit”).
+    • Otherwise the file is re-read and its content hashed. If the content hash is unchanged (e.g., the file was merely
+      touched), the cached tree is still returned (also a “hit”); only if the content itself changed is the tree
+      rebuilt (a “miss”).
+
+A cache may be bounded by the memory its trees occupy (see maximum_bytes): it then evicts least-recently-used trees
+until their estimated total size is within the bound, so that a library of many PGN files (see pgn_library.py) holds
+only the trees in use.
+
+The nodedict held in the cache is shared by every request and must be treated as read-only.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import time
+
+
+class CachedGameTree:
+    """
+    A single entry of GameTreeCache: a built nodedict together with the identity of the PGN source it was built from.
+    """
+
+    __slots__ = {
+        "pgn_filepath":
+            "Path of the PGN file from which the tree was built",
+        "nodedict":
+            "The dictionary {node_id: GameNode} returned by buildtree(). Shared; must not be mutated.",
+        "content_hash":
+            "SHA-256 hex digest of the bytes of the PGN file from which nodedict was built",
+        "mtime_ns":
+            "st_mtime_ns of the PGN file when last verified",
+        "size":
+            "st_size of the PGN file when last verified",
+        "build_seconds":
+            "Wall time, in seconds, taken to build nodedict",
+        "estimated_bytes":
+            "Estimated memory, in bytes, occupied by nodedict (see GameTreeCache); 0 if the cache is unbounded",
+    }
+
+    def __init__(self, *, pgn_filepath, nodedict, content_hash, mtime_ns, size, build_seconds, estimated_bytes=0):
+        self.pgn_filepath = pgn_filepath
+        self.nodedict = nodedict
+        self.content_hash = content_hash
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.build_seconds = build_seconds
+        self.estimated_bytes = estimated_bytes
+
+
+class GameTreeCache:
+    """
+    Cache of built game trees, keyed on PGN file path and validated against the file’s mtime/size and content hash.
+
+    build_function is called as build_function(pgn_filepath) on a miss and must return the nodedict.
+
+    If maximum_bytes is not None, the cache is bounded: size_function(nodedict) estimates each built tree’s memory, and
+    after each build the least-recently-used trees are evicted until the estimated total is at most maximum_bytes. (The
+    tree just built is never evicted, even if it alone exceeds maximum_bytes.)
+
+    Counters (read via statistics()):
+        hits:                 number of requests served from an existing entry
+        misses:               number of requests that required a build
+        builds:               number of completed builds
+        evictions:            number of trees evicted to respect maximum_bytes
+        total_build_seconds:  cumulative wall time spent building
+        last_build_seconds:   wall time of the most recent build
+    """
+
+    def __init__(self, build_function, maximum_bytes=None, size_function=None):
+        self.build_function = build_function
+        self.maximum_bytes = maximum_bytes
+        self.size_function = size_function
+        # Ordered from least to most recently used
+        self.entries = OrderedDict()
+        self.estimated_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+        self.total_build_seconds = 0.0
+        self.last_build_seconds = 0.0
+
+        # The lock serializes only the (rare) verification-after-change and rebuild paths, so that concurrent requests
+        # arriving while a file changes trigger a single build rather than one per thread.
+        self._lock = threading.Lock()
+        # Guards hits, which the lock-free fast path of get_entry() also increments. (Taking _lock there instead would
+        # make every hit wait for any build in progress.) Never held while acquiring _lock.
+        self._hits_lock = threading.Lock()
+
+
+    def get_entry(self, pgn_filepath):
+        """
+        Returns the CachedGameTree for pgn_filepath, building (or rebuilding) it if necessary.
+        """
+        file_stat = os.stat(pgn_filepath)
+
+        entry = self.entries.get(pgn_filepath)
+        if entry is not None and entry.mtime_ns == file_stat.st_mtime_ns and entry.size == file_stat.st_size:
+            self.count_hit()
+            if self.maximum_bytes is not None:
+                self.mark_as_recently_used(pgn_filepath)
+            return entry
+
+        with self._lock:
+            # Re-checks under the lock, because another thread may have refreshed the entry in the meantime
+            entry = self.entries.get(pgn_filepath)
+            file_stat = os.stat(pgn_filepath)
+            if entry is not None and entry.mtime_ns == file_stat.st_mtime_ns and entry.size == file_stat.st_size:
+                self.count_hit()
+                return entry
+
+            content_hash = hash_of_file_contents(pgn_filepath)
+
+            if entry is not None and entry.content_hash == content_hash:
+                # File was touched but its content is unchanged; the existing tree remains valid.
+                entry.mtime_ns = file_stat.st_mtime_ns
+                entry.size = file_stat.st_size
+                self.count_hit()
+                return entry
+
+            self.misses += 1
+
+            start_time = time.perf_counter()
+            nodedict = self.build_function(pgn_filepath)
+            build_seconds = time.perf_counter() - start_time
+
+            self.builds += 1
+            self.total_build_seconds += build_seconds
+            self.last_build_seconds = build_seconds
+
+            logging.info(f"Built game tree for {pgn_filepath} ({len(nodedict)} nodes) in {build_seconds:.3f} s")
+
+            if self.maximum_bytes is None:
+                estimated_bytes = 0
+            else:
+                estimated_bytes = self.size_function(nodedict)
+
+            entry = CachedGameTree(pgn_filepath = pgn_filepath,
+                                   nodedict = nodedict,
+                                   content_hash = content_hash,
+                                   mtime_ns = file_stat.st_mtime_ns,
+                                   size = file_stat.st_size,
+                                   build_seconds = build_seconds,
+                                   estimated_bytes = estimated_bytes)
+            superseded_entry = self.entries.pop(pgn_filepath, None)
+            if superseded_entry is not None:
+                self.estimated_bytes -= superseded_entry.estimated_bytes
+            self.entries[pgn_filepath] = entry
+            self.estimated_bytes += estimated_bytes
+
+            if self.maximum_bytes is not None:
+                self.evict_least_recently_used_trees()
+            return entry
+
+
+    def count_hit(self):
+        """
+        Increments hits under _hits_lock, since += on an attribute is not atomic across threads
+        """
+        with self._hits_lock:
+            self.hits += 1
+
+
+    def mark_as_recently_used(self, pgn_filepath):
+        """
+        Moves pgn_filepath’s entry to the most-recently-used end of entries
+        """
+        try:
+            self.entries.move_to_end(pgn_filepath)
+        except KeyError:
+            # Evicted by another thread in the meantime; the caller still holds the entry
+            pass
+
+
+    def evict_least_recently_used_trees(self):
+        """
+        Evicts least-recently-used entries, but never the most recently used one, until the estimated total size of
+        the cached trees is at most maximum_bytes. Called with the lock held.
+        """
+        while self.estimated_bytes > self.maximum_bytes and len(self.entries) > 1:
+            pgn_filepath, evicted_entry = self.entries.popitem(last=False)
+            self.estimated_bytes -= evicted_entry.estimated_bytes
+            self.evictions += 1
+            logging.info(f"Evicted game tree for {pgn_filepath} ({evicted_entry.estimated_bytes:,} bytes, est.)")
+
+
+    def get_nodedict(self, pgn_filepath):
+        """
+        Returns the (shared, read-only) nodedict for pgn_filepath.
+        """
+        return self.get_entry(pgn_filepath).nodedict
+
+
+    def clear(self):
+        """
+        Discards all cached trees. Counters are retained.
+        """
+        with self._lock:
+            self.entries = OrderedDict()
+            self.estimated_bytes = 0
+
+
+    def statistics(self):
+        """
+        Returns a dictionary of the cache’s counters.
+        """
+        with self._hits_lock:
+            hits = self.hits
+        return {
+                "entries": len(self.entries),
+                "hits": hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "evictions": self.evictions,
+                "estimated_bytes": self.estimated_bytes,
+                "total_build_seconds": self.total_build_seconds,
+                "last_build_seconds": self.last_build_seconds,
+               }
+
+
+def hash_of_file_contents(filepath):
+    """
+    Returns the SHA-256 hex digest of the bytes of the file at filepath.
+    """
+    with open(filepath, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
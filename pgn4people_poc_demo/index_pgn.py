@@ -0,0 +1,58 @@
+"""
+Command-line tool to index the games of a multi-game PGN file (see pgn_game_index.py) ahead of deployment.
+
+Usage:
+    python -m pgn4people_poc_demo.index_pgn path/to/database.pgn [-o path/to/output.pgn4index] [--list] [--verify]
+
+By default the index is written beside the PGN file, with the same stem and the extension GAME_INDEX_FILE_EXTENSION,
+which is where load_game_index() looks for it.
+
+--verify also reads the file game by game with chess.pgn and checks that the index agrees (see
+pgn_game_index.list_of_discrepancies_with_sequential_reading()), exiting with status 1 if it does not.
+"""
+
+import argparse
+import sys
+import time
+
+from . pgn_game_index import list_of_discrepancies_with_sequential_reading
+from . pgn_game_index import scan_pgn_file
+from . pgn_game_index import write_game_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pgn_filepath", help="PGN file to index")
+    parser.add_argument("-o", "--output", dest="index_filepath", default=None,
+                        help="path of the index (default: beside the PGN file)")
+    parser.add_argument("--list", dest="do_list", action="store_true",
+                        help="also list each game’s offset, length, and White, Black, and Event tags")
+    parser.add_argument("--verify", dest="do_verify", action="store_true",
+                        help="also check the index against reading the file game by game with chess.pgn")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    game_index = scan_pgn_file(args.pgn_filepath)
+    scan_seconds = time.perf_counter() - start_time
+    index_filepath = write_game_index(game_index, args.index_filepath)
+
+    if args.do_list:
+        for game_number, game in enumerate(game_index.games):
+            print(f"{game_number:>7} {game.offset:>12} {game.length:>9}  {game.header('White', '?')} – "
+                  f"{game.header('Black', '?')}, {game.header('Event', '?')}")
+
+    megabytes = game_index.source_size / 1e6
+    print(f"Indexed {len(game_index):,} games of {args.pgn_filepath} ({megabytes:,.1f} MB) in {scan_seconds:.3f} s "
+          f"({megabytes / max(scan_seconds, 1e-9):,.0f} MB/s) to {index_filepath}")
+
+    if args.do_verify:
+        list_of_messages = list_of_discrepancies_with_sequential_reading(game_index)
+        for message in list_of_messages:
+            print(message)
+        if list_of_messages:
+            sys.exit(f"The index disagrees with chess.pgn in {len(list_of_messages):,} respect(s)")
+        print("The index agrees with reading the file game by game with chess.pgn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Bounded, thread-safe least-recently-used cache with hit/miss/eviction counters.
+"""
+
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    """
+    Mapping of at most `capacity` entries; when full, adding an entry evicts the least recently used one.
+
+    get() returns None on a miss, so None cannot itself be cached.
+
+    Counters (read via statistics()):
+        hits:       number of get() calls that found their key
+        misses:     number of get() calls that did not
+        evictions:  number of entries evicted to make room
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        """
+        Returns the entry for key, marking it most recently used, or None if there is none
+        """
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+
+    def put(self, key, value):
+        """
+        Adds (or replaces) the entry for key, evicting least recently used entries as needed
+        """
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        """
+        Discards all entries. Counters are retained.
+        """
+        with self._lock:
+            self.entries.clear()
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def statistics(self):
+        """
+        Returns a dictionary of the cache’s size, capacity, and counters
+        """
+        lookups = self.hits + self.misses
+        return {
+                "entries": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+               }
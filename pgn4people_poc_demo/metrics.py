@@ -0,0 +1,437 @@
+"""
+Metrics registry of the app, exposed at /metrics in the Prometheus text exposition format.
+
+Metrics:
+    pgn4people_requests_total{endpoint, method, status}         counter of requests handled, per route
+    pgn4people_request_duration_seconds{endpoint}               histogram of request latency, per route (buckets:
+                                                                METRICS_LATENCY_BUCKETS_SECONDS)
+    pgn4people_tree_build_duration_seconds{cache}               summary (_count: number of builds; _sum: seconds) of
+                                                                the trees built by each GameTreeCache
+    pgn4people_cache_hits_total{cache}, …_misses_total{cache},  counters of each cache: the game-tree caches, the page
+    …_evictions_total{cache}                                    cache, the SVG-board cache, and the row-fragment caches
+                                                                of every tree (see below)
+    pgn4people_cache_entries{cache}                             gauge of the entries held by each cache (for the
+                                                                row-fragment caches, by those of the trees cached)
+    pgn4people_tree_nodes{pgn}, pgn4people_tree_edges{pgn},     gauges of each cached tree, from its GameTreeReport
+    pgn4people_tree_lines{pgn}, pgn4people_tree_max_depth{pgn}
+
+Request counts and latencies are recorded by hooks that run before and after every request of the app (installed by
+registering blueprint). Cache and tree metrics are read from the caches themselves when a snapshot is taken, so they
+cost nothing per request; a tree’s GameTreeReport is computed once per tree (per content hash) and remembered while the
+tree is cached.
+
+Each tree has a row-fragment cache of its own, which goes when the tree is rebuilt or evicted. So that the row-fragment
+counters never decrease, as a Prometheus counter must not, the counts of a tree’s cache as last read are added to
+running totals when the tree leaves the game-tree caches (see RowFragmentCounters); what it counted after it was last
+read is not counted.
+
+Every update is made under a lock, so the registry is safe under a threaded server. Under a server with several worker
+processes, each process has its own registry; if METRICS_DIRECTORY is set, each process writes a snapshot of its
+registry to a file of its own in that directory (at most every METRICS_FLUSH_INTERVAL_SECONDS, on each request, and on
+exit), and /metrics, whichever process serves it, writes its own snapshot and then merges every process’s file: counters
+and histograms are summed, and each gauge is taken from the newest snapshot that has it, the gauges of exited processes
+being ignored. So /metrics may lag other processes by up to METRICS_FLUSH_INTERVAL_SECONDS. Files of exited processes
+are kept, so that counters never go backward; empty the directory when the server is (re)deployed. A process forked
+from one with a registry (e.g., a preloading server’s workers) starts with an empty registry and a file of its own.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from flask import Blueprint
+from flask import g
+from flask import make_response
+from flask import request
+
+from . import constants
+from . import display_chess_board
+from . import traverse
+from . game_tree import characterize_gametree
+
+blueprint = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS_FILENAME_PREFIX = "pgn4people_metrics."
+METRICS_FILENAME_SUFFIX = ".json"
+
+# {metric name: (Prometheus type, help text)}
+DESCRIPTIONS_OF_METRICS = {
+    "pgn4people_requests_total": ("counter", "Requests handled, by route, method, and status"),
+    "pgn4people_request_duration_seconds": ("histogram", "Request latency in seconds, by route"),
+    "pgn4people_tree_build_duration_seconds": ("summary", "Game-tree builds and their duration in seconds, by cache"),
+    "pgn4people_cache_hits_total": ("counter", "Cache hits, by cache"),
+    "pgn4people_cache_misses_total": ("counter", "Cache misses, by cache"),
+    "pgn4people_cache_evictions_total": ("counter", "Cache evictions, by cache"),
+    "pgn4people_cache_entries": ("gauge", "Entries held by a cache, by cache"),
+    "pgn4people_tree_nodes": ("gauge", "Nodes of a cached game tree"),
+    "pgn4people_tree_edges": ("gauge", "Edges of a cached game tree"),
+    "pgn4people_tree_lines": ("gauge", "Lines (terminal nodes) of a cached game tree"),
+    "pgn4people_tree_max_depth": ("gauge", "Maximum depth of a line of a cached game tree"),
+}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms recorded by this process; see module docstring.
+
+    Metrics are keyed by (name, labels), labels being a tuple of (label name, value) pairs.
+    """
+
+    __slots__ = {
+        "counters": "Dictionary {(name, labels): value}",
+        "histograms": "Dictionary {(name, labels): [count per bucket (not cumulative), …, count above last bucket, "
+                      "sum of observations, number of observations]}",
+        "lock": "Guards counters and histograms",
+        "snapshot_filepath": "Path of this process’s snapshot file in METRICS_DIRECTORY; None if not set",
+        "time_of_last_flush": "time.monotonic() when this process last wrote its snapshot file",
+    }
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        if constants.METRICS_DIRECTORY is None:
+            self.snapshot_filepath = None
+        else:
+            self.snapshot_filepath = os.path.join(constants.METRICS_DIRECTORY,
+                                                  f"{METRICS_FILENAME_PREFIX}{os.getpid()}.{time.time_ns()}"
+                                                  f"{METRICS_FILENAME_SUFFIX}")
+        self.time_of_last_flush = time.monotonic()
+
+
+    def record_request(self, endpoint, method, status_code, seconds):
+        """
+        Counts a request and adds its latency to its route’s histogram
+        """
+        buckets = constants.METRICS_LATENCY_BUCKETS_SECONDS
+        index_of_bucket = len(buckets)
+        for index, upper_bound in enumerate(buckets):
+            if seconds <= upper_bound:
+                index_of_bucket = index
+                break
+
+        counter_key = ("pgn4people_requests_total",
+                       (("endpoint", endpoint), ("method", method), ("status", str(status_code))))
+        histogram_key = ("pgn4people_request_duration_seconds", (("endpoint", endpoint),))
+        with self.lock:
+            self.counters[counter_key] = self.counters.get(counter_key, 0) + 1
+            histogram = self.histograms.get(histogram_key)
+            if histogram is None:
+                histogram = self.histograms[histogram_key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            histogram[index_of_bucket] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+
+    def snapshot(self):
+        """
+        Returns this process’s metrics—those recorded plus those read from the caches (see collected_metrics())—as a
+        JSON-serializable dictionary {"pid": …, "time": time.time() of the snapshot, "counters": [[name, labels, value],
+        …], "histograms": […], "summaries": […], "gauges": […]}
+        """
+        with self.lock:
+            counters = [[name, labels, value] for (name, labels), value in self.counters.items()]
+            histograms = [[name, labels, list(histogram)] for (name, labels), histogram in self.histograms.items()]
+        collected_counters, summaries, gauges = collected_metrics()
+        return {"pid": os.getpid(),
+                "time": time.time(),
+                "counters": counters + collected_counters,
+                "histograms": histograms,
+                "summaries": summaries,
+                "gauges": gauges}
+
+
+    def flush_if_due(self):
+        """
+        Writes this process’s snapshot file if METRICS_FLUSH_INTERVAL_SECONDS have passed since it was last written
+        """
+        if (self.snapshot_filepath is not None
+                and time.monotonic() - self.time_of_last_flush >= constants.METRICS_FLUSH_INTERVAL_SECONDS):
+            self.flush()
+
+
+    def flush(self):
+        """
+        Writes this process’s snapshot file (atomically, so that a concurrent reader never sees a partial file)
+        """
+        if self.snapshot_filepath is None:
+            return
+        self.time_of_last_flush = time.monotonic()
+        os.makedirs(constants.METRICS_DIRECTORY, exist_ok=True)
+        # Per thread, because two threads of the process may flush at once
+        temporary_filepath = f"{self.snapshot_filepath}.{threading.get_ident()}.tmp"
+        with open(temporary_filepath, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary_filepath, self.snapshot_filepath)
+
+
+class RowFragmentCounters:
+    """
+    Process-lifetime hits, misses, and evictions of the row-fragment caches of every tree, including trees since
+    rebuilt or evicted (see module docstring)
+    """
+
+    __slots__ = {
+        "retired_counts": "Dictionary {counter: total of the caches of the trees that have left the game-tree caches}",
+        "last_counts_by_tree": "Dictionary {(game-tree cache name, PGN path, content hash, id of row-fragment cache): "
+                               "{counter: count when last read}} of the trees cached when last read",
+    }
+
+    COUNTERS = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.retired_counts = dict.fromkeys(self.COUNTERS, 0)
+        self.last_counts_by_tree = {}
+
+
+    def totals(self, counts_by_tree):
+        """
+        Given {tree key (as in last_counts_by_tree): {counter: count}} of the trees now cached, returns the
+        process-lifetime {counter: total}
+        """
+        for tree_key, last_counts in self.last_counts_by_tree.items():
+            counts = counts_by_tree.get(tree_key)
+            # A cache that is gone, or whose counts went down (a new cache whose id is that of a discarded one)
+            if counts is None or any(counts[name] < last_counts[name] for name in self.COUNTERS):
+                for name in self.COUNTERS:
+                    self.retired_counts[name] += last_counts[name]
+        self.last_counts_by_tree = counts_by_tree
+        return {name: self.retired_counts[name] + sum(counts[name] for counts in counts_by_tree.values())
+                for name in self.COUNTERS}
+
+
+registry = MetricsRegistry()
+row_fragment_counters = RowFragmentCounters()
+
+# {content hash of PGN: (nodes, edges, lines, maximum depth)} of the trees cached, so that a tree is characterized only
+# once
+tree_statistics_by_content_hash = {}
+
+# Serializes collected_metrics(), which updates row_fragment_counters and tree_statistics_by_content_hash
+collection_lock = threading.Lock()
+
+
+def reset_registry_after_fork():
+    global registry, row_fragment_counters
+    registry = MetricsRegistry()
+    row_fragment_counters = RowFragmentCounters()
+
+
+os.register_at_fork(after_in_child=reset_registry_after_fork)
+atexit.register(lambda: registry.flush())
+
+
+def collected_metrics():
+    """
+    Returns (counters, summaries, gauges), in the form of MetricsRegistry.snapshot(), read from the caches of this
+    process
+    """
+    with collection_lock:
+        return collected_metrics_with_lock_held()
+
+
+def collected_metrics_with_lock_held():
+    counters = []
+    summaries = []
+    gauges = []
+
+    game_tree_caches = (("game_trees", traverse.game_tree_cache),
+                        ("library_game_trees", traverse.pgn_library.game_tree_cache))
+    row_fragment_counts_by_tree = {}
+    number_of_row_fragments = 0
+    content_hashes_of_cached_trees = set()
+    for cache_name, game_tree_cache in game_tree_caches:
+        statistics = game_tree_cache.statistics()
+        add_cache_metrics(counters, gauges, cache_name, statistics)
+        summaries.append(["pgn4people_tree_build_duration_seconds", [["cache", cache_name]],
+                          [statistics["total_build_seconds"], statistics["builds"]]])
+
+        for entry in list(game_tree_cache.entries.values()):
+            nodedict = entry.nodedict
+            row_fragment_cache = nodedict.row_fragment_cache
+            if row_fragment_cache is not None:
+                row_fragment_statistics = row_fragment_cache.statistics()
+                tree_key = (cache_name, entry.pgn_filepath, entry.content_hash, id(row_fragment_cache))
+                row_fragment_counts_by_tree[tree_key] = {name: row_fragment_statistics[name]
+                                                         for name in RowFragmentCounters.COUNTERS}
+                number_of_row_fragments += row_fragment_statistics["entries"]
+
+            content_hashes_of_cached_trees.add(entry.content_hash)
+            tree_statistics = tree_statistics_by_content_hash.get(entry.content_hash)
+            if tree_statistics is None:
+                game_tree_report = characterize_gametree(nodedict)
+                tree_statistics = (game_tree_report.number_of_nodes,
+                                   game_tree_report.number_of_nodes - 1,
+                                   game_tree_report.number_of_lines,
+                                   game_tree_report.max_depth_of_a_line)
+                tree_statistics_by_content_hash[entry.content_hash] = tree_statistics
+            labels = [["pgn", os.path.basename(entry.pgn_filepath)]]
+            for name, value in zip(("pgn4people_tree_nodes", "pgn4people_tree_edges", "pgn4people_tree_lines",
+                                    "pgn4people_tree_max_depth"), tree_statistics):
+                gauges.append([name, labels, value])
+
+    # Forgets the statistics of trees no longer cached
+    for content_hash in tree_statistics_by_content_hash.keys() - content_hashes_of_cached_trees:
+        del tree_statistics_by_content_hash[content_hash]
+
+    add_cache_metrics(counters, gauges, "pages", traverse.page_cache.statistics())
+    add_cache_metrics(counters, gauges, "svg_boards", display_chess_board.svg_board_cache.statistics())
+    row_fragment_statistics = row_fragment_counters.totals(row_fragment_counts_by_tree)
+    row_fragment_statistics["entries"] = number_of_row_fragments
+    add_cache_metrics(counters, gauges, "row_fragments", row_fragment_statistics)
+    return counters, summaries, gauges
+
+
+def add_cache_metrics(counters, gauges, cache_name, statistics):
+    labels = [["cache", cache_name]]
+    for key in ("hits", "misses", "evictions"):
+        counters.append([f"pgn4people_cache_{key}_total", labels, statistics[key]])
+    gauges.append(["pgn4people_cache_entries", labels, statistics["entries"]])
+
+
+def merged_snapshots(list_of_snapshots):
+    """
+    Returns the merge of several processes’ snapshots: counters, histograms, and summaries summed, and each gauge taken
+    from the newest snapshot that has it
+    """
+    merged = {"counters": {}, "histograms": {}, "summaries": {}, "gauges": {}}
+    # Oldest first, so that a newer snapshot’s gauge replaces an older one’s
+    for snapshot in sorted(list_of_snapshots, key=lambda snapshot: snapshot.get("time", 0)):
+        for kind in ("counters", "histograms", "summaries", "gauges"):
+            merged_of_kind = merged[kind]
+            for name, labels, value in snapshot.get(kind, ()):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                previous_value = merged_of_kind.get(key)
+                if previous_value is None:
+                    merged_of_kind[key] = value
+                elif kind == "gauges":
+                    merged_of_kind[key] = value
+                elif kind == "counters":
+                    merged_of_kind[key] = previous_value + value
+                elif len(previous_value) == len(value):
+                    # A histogram or summary; one recorded with different buckets (e.g., before a change of
+                    # METRICS_LATENCY_BUCKETS_SECONDS) cannot be merged and is skipped
+                    merged_of_kind[key] = [a + b for a, b in zip(previous_value, value)]
+    return merged
+
+
+def snapshots_of_all_processes():
+    """
+    Returns the list of snapshots of every process: this process’s own, and, if METRICS_DIRECTORY is set, those of the
+    other processes’ files, less the gauges of processes that have exited
+    """
+    if registry.snapshot_filepath is None:
+        return [registry.snapshot()]
+
+    registry.flush()
+    list_of_snapshots = []
+    for filename in os.listdir(constants.METRICS_DIRECTORY):
+        if filename.startswith(METRICS_FILENAME_PREFIX) and filename.endswith(METRICS_FILENAME_SUFFIX):
+            try:
+                with open(os.path.join(constants.METRICS_DIRECTORY, filename), "r") as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                # Removed, or being replaced, since the directory was listed
+                continue
+            if not is_process_running(snapshot.get("pid")):
+                # An exited process’s counters still count, but its gauges describe what it held when it exited
+                snapshot["gauges"] = []
+            list_of_snapshots.append(snapshot)
+    return list_of_snapshots
+
+
+def is_process_running(pid):
+    """
+    Returns whether a process with the given pid exists (on this host)
+    """
+    if pid is None:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def prometheus_text(merged):
+    """
+    Returns merged (see merged_snapshots()) in the Prometheus text exposition format
+    """
+    samples_by_name = {}
+    for kind, samples in merged.items():
+        for (name, labels), value in samples.items():
+            samples_by_name.setdefault(name, []).append((kind, labels, value))
+
+    lines = []
+    for name in sorted(samples_by_name):
+        metric_type, help_text = DESCRIPTIONS_OF_METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for kind, labels, value in sorted(samples_by_name[name], key=lambda sample: sample[1]):
+            if kind == "histograms":
+                cumulative_count = 0
+                for upper_bound, count in zip((*constants.METRICS_LATENCY_BUCKETS_SECONDS, "+Inf"), value[:-2]):
+                    cumulative_count += count
+                    lines.append(f"{name}_bucket{text_of_labels(labels + (('le', str(upper_bound)),))} "
+                                 f"{cumulative_count}")
+                lines.append(f"{name}_sum{text_of_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{text_of_labels(labels)} {value[-1]}")
+            elif kind == "summaries":
+                lines.append(f"{name}_sum{text_of_labels(labels)} {value[0]}")
+                lines.append(f"{name}_count{text_of_labels(labels)} {value[1]}")
+            else:
+                lines.append(f"{name}{text_of_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def text_of_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{label_name}="{escaped_label_value(label_value)}"'
+                          for label_name, label_value in labels) + "}"
+
+
+def escaped_label_value(label_value):
+    return str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@blueprint.before_app_request
+def note_start_of_request():
+    if constants.METRICS_ENABLED:
+        g.metrics_start_of_request = time.perf_counter()
+
+
+@blueprint.after_app_request
+def record_request(response):
+    start_of_request = g.pop("metrics_start_of_request", None)
+    if start_of_request is not None:
+        registry.record_request(request.endpoint or "unmatched",
+                                request.method,
+                                response.status_code,
+                                time.perf_counter() - start_of_request)
+        registry.flush_if_due()
+    return response
+
+
+@blueprint.route('/metrics')
+def metrics():
+    """
+    Returns the metrics of every process (see module docstring) in the Prometheus text format
+    """
+    if not constants.METRICS_ENABLED:
+        return make_response("Metrics are disabled\n", 404)
+    response = make_response(prometheus_text(merged_snapshots(snapshots_of_all_processes())))
+    response.headers["Content-Type"] = PROMETHEUS_CONTENT_TYPE
+    response.headers["Cache-Control"] = "no-store"
+    return response
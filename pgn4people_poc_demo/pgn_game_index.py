@@ -0,0 +1,379 @@
+"""
+Index of the games of a multi-game PGN file, so that any one game can be read (and its tree built) by seeking to it,
+rather than by reading every game before it.
+
+A PGN database holds thousands of games; chess.pgn.read_game() reads them one after another, and the rest of the app
+reads only the first (see traverse.get_next_parsed_game_from_PGN_file_using_custom_visitor()). scan_pgn_file() instead
+scans the memory-mapped file once, with regular expressions over its bytes and without parsing any moves, and records
+for each game its byte offset, its length in bytes, and its headers (parsed as by chess.pgn.read_headers()). A game
+starts at a tag line (“[Tag "value"]”) that follows movetext, or, for a game without headers, at the first text of the
+file, or of what follows a game-termination marker (“1-0”, “0-1”, “1/2-1/2”, or “*”), that is neither blank nor a
+rest-of-line (“;”) or escape (“%”) comment, which chess.pgn.read_game() skips between games. (A braced comment there
+does start a game, as it does for chess.pgn.read_game(), which reads it as the game’s opening comment.) Tag lines and
+termination markers within a comment are ignored.
+
+The index is persisted beside the PGN file (see game_index_filepath_for_pgn_file()) as a JSON document:
+
+    {
+        "format":           GAME_INDEX_FORMAT_NAME,
+        "version":          GAME_INDEX_FORMAT_VERSION,
+        "source_sha256":    hex SHA-256 of the PGN file’s content,
+        "source_size":      size of the PGN file, in bytes,
+        "source_mtime_ns":  st_mtime_ns of the PGN file when indexed,
+        "games":            [[offset, length, [[tag_name, tag_value], ...]], ...],
+    }
+
+load_game_index() reuses a persisted index whose source size and mtime match the PGN file’s (or, failing the mtime,
+whose SHA-256 matches the file’s content) and otherwise scans the file again and rewrites the index. Then
+PGNGameIndex.read_game() reads game n with one seek and one read.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import re
+
+import chess.pgn
+
+from . constants import GAME_INDEX_FILE_EXTENSION
+from . error_processing import log_nonfatal_error
+from . pgn_tokenizer import PGNTokenizer
+
+
+GAME_INDEX_FORMAT_NAME = "pgn4people-game-index"
+GAME_INDEX_FORMAT_VERSION = 2
+
+UTF8_BYTE_ORDER_MARK = b"\xef\xbb\xbf"
+
+# The tokens of a PGN file that bound its games, scanned in order so that a token within a comment is consumed by the
+# comment:
+#     tag_line            a line that begins (after any indentation, and for the first line, any byte-order mark) with
+#                         “[”; group tag_text is the line without the byte-order mark
+#     braced_comment      a braced comment, closed or not
+#     line_comment        a rest-of-line comment, or an escape line (a line that begins with “%”)
+#     termination         a game-termination marker
+# The leading lookahead, on the first byte that any token can begin with, lets the scan skip other bytes cheaply.
+REGEX_OF_GAME_BOUNDARY_TOKEN = re.compile(rb"""
+    (?=[\[\xef{;%*01]|^[ \t])
+    (?: (?P<tag_line>^(?:\xef\xbb\xbf)?(?P<tag_text>[ \t]*\[[^\r\n]*))
+      | (?P<braced_comment>\{[^}]*\}?)
+      | (?P<line_comment>;[^\n]*|^%[^\n]*)
+      | (?P<termination>(?<![\w/-])(?:1-0|0-1|1/2-1/2)(?![\w/-])|\*)
+    )
+    """, re.MULTILINE | re.VERBOSE)
+
+# A tag pair, as matched by chess.pgn (see chess.pgn.TAG_REGEX)
+REGEX_OF_TAG_PAIR = re.compile(rb'^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+"([^\r]*)"\]\s*$')
+
+REGEX_OF_NONBLANK_TEXT = re.compile(rb"\S")
+
+
+class GameIndexFormatError(ValueError):
+    """
+    Raised when a file is not a game index that this version of the loader can read
+    """
+    pass
+
+
+class IndexedGame:
+    """
+    One game of an indexed PGN file
+    """
+
+    __slots__ = {
+        "offset":
+            "Byte offset of the game (its first tag line) in the PGN file",
+        "length":
+            "Length of the game in bytes, through the end of its movetext and any blank lines that follow it",
+        "headers":
+            "List of (tag_name, tag_value) tuples of the game’s headers, in the order in which they appear",
+    }
+
+    def __init__(self, offset, length, headers):
+        self.offset = offset
+        self.length = length
+        self.headers = headers
+
+
+    def header(self, tag_name, default=None):
+        """
+        Returns the value of the game’s tag tag_name, or default if the game has no such tag
+        """
+        for name, value in self.headers:
+            if name == tag_name:
+                return value
+        return default
+
+
+class PGNGameIndex:
+    """
+    Index of the games of the PGN file at pgn_filepath; see module docstring.
+    """
+
+    __slots__ = {
+        "pgn_filepath":
+            "Path of the indexed PGN file",
+        "source_sha256":
+            "Hex SHA-256 of the PGN file’s content when indexed",
+        "source_size":
+            "Size of the PGN file, in bytes, when indexed",
+        "source_mtime_ns":
+            "st_mtime_ns of the PGN file when indexed (or when the index was last found to match the file’s content)",
+        "games":
+            "List of IndexedGame, in the order in which the games appear in the file",
+    }
+
+    def __init__(self, *, pgn_filepath, source_sha256, source_size, source_mtime_ns, games):
+        self.pgn_filepath = pgn_filepath
+        self.source_sha256 = source_sha256
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self.games = games
+
+
+    def __len__(self):
+        return len(self.games)
+
+
+    def read_game_text(self, game_number):
+        """
+        Returns the PGN text of game game_number (counting from 0), read with a single seek and read
+        """
+        indexed_game = self.games[game_number]
+        with open(self.pgn_filepath, "rb") as pgn_file:
+            pgn_file.seek(indexed_game.offset)
+            game_bytes = pgn_file.read(indexed_game.length)
+        return game_bytes.decode("utf-8-sig", errors="replace")
+
+
+    def read_game(self, game_number, Visitor=PGNTokenizer):
+        """
+        Reads game game_number (counting from 0) with chess.pgn.read_game(), using the custom visitor class Visitor, and
+        returns the visitor’s result (e.g., a GameTree for PGNTreeBuilder; cf.
+        traverse.get_next_parsed_game_from_PGN_file_using_custom_visitor(), which reads the file’s first game)
+        """
+        return chess.pgn.read_game(io.StringIO(self.read_game_text(game_number)), Visitor=Visitor)
+
+
+    def to_document(self):
+        """
+        Returns the index as a JSON-compatible document (see module docstring)
+        """
+        return {
+                "format": GAME_INDEX_FORMAT_NAME,
+                "version": GAME_INDEX_FORMAT_VERSION,
+                "source_sha256": self.source_sha256,
+                "source_size": self.source_size,
+                "source_mtime_ns": self.source_mtime_ns,
+                "games": [[game.offset, game.length, [list(tag_pair) for tag_pair in game.headers]]
+                          for game in self.games],
+               }
+
+
+def game_index_filepath_for_pgn_file(pgn_filepath):
+    """
+    Returns the conventional path of the game index of the PGN file at pgn_filepath: the same path with its extension
+    replaced by GAME_INDEX_FILE_EXTENSION.
+    """
+    return os.path.splitext(pgn_filepath)[0] + GAME_INDEX_FILE_EXTENSION
+
+
+def scan_pgn_file(pgn_filepath):
+    """
+    Scans the PGN file at pgn_filepath once and returns its PGNGameIndex (see module docstring)
+    """
+    file_stat = os.stat(pgn_filepath)
+    with open(pgn_filepath, "rb") as pgn_file:
+        if file_stat.st_size == 0:
+            content = b""
+        else:
+            content = mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            source_sha256 = hashlib.sha256(content).hexdigest()
+            games = list_of_games_of_pgn_bytes(content)
+        finally:
+            if isinstance(content, mmap.mmap):
+                content.close()
+
+    return PGNGameIndex(pgn_filepath = pgn_filepath,
+                        source_sha256 = source_sha256,
+                        source_size = file_stat.st_size,
+                        source_mtime_ns = file_stat.st_mtime_ns,
+                        games = games)
+
+
+def list_of_games_of_pgn_bytes(content):
+    """
+    Returns the list of IndexedGame of the PGN text content (bytes or a bytes-like mmap); see module docstring
+    """
+    start_of_text = len(UTF8_BYTE_ORDER_MARK) if content[:len(UTF8_BYTE_ORDER_MARK)] == UTF8_BYTE_ORDER_MARK else 0
+
+    list_of_offsets = []
+    list_of_headers = []
+
+    # End of the last tag line of the current tag section; None while there is no current tag section
+    end_of_tag_section = None
+    # True at the start of the file and after a game-termination marker, until the next game starts
+    is_between_games = True
+    # End of the last token scanned, from which any text before the next token is searched for a game without headers
+    end_of_last_token = start_of_text
+
+    for token in REGEX_OF_GAME_BOUNDARY_TOKEN.finditer(content):
+        start_of_token, end_of_token = token.span()
+
+        if is_between_games:
+            nonblank_text = REGEX_OF_NONBLANK_TEXT.search(content, end_of_last_token, start_of_token)
+            if nonblank_text is not None or token.lastgroup == "braced_comment":
+                # Starts a game without headers
+                list_of_offsets.append(start_of_token if nonblank_text is None else nonblank_text.start())
+                list_of_headers.append([])
+                is_between_games = False
+        end_of_last_token = end_of_token
+
+        if token.lastgroup == "termination":
+            is_between_games = True
+        elif token.lastgroup == "tag_line":
+            if end_of_tag_section is None or content[end_of_tag_section:start_of_token].strip():
+                # Starts a game
+                list_of_offsets.append(start_of_token)
+                list_of_headers.append([])
+                is_between_games = False
+            # Otherwise continues the current tag section
+
+            tag_pair = REGEX_OF_TAG_PAIR.match(token.group("tag_text").strip())
+            if tag_pair:
+                list_of_headers[-1].append((tag_pair.group(1).decode("ascii"),
+                                            tag_pair.group(2).decode("utf-8", errors="replace")))
+            end_of_tag_section = end_of_token
+
+    nonblank_text = REGEX_OF_NONBLANK_TEXT.search(content, end_of_last_token) if is_between_games else None
+    if nonblank_text is not None:
+        # Starts a game without headers, after the last token (e.g., a final game without a termination marker)
+        list_of_offsets.append(nonblank_text.start())
+        list_of_headers.append([])
+
+    list_of_offsets.append(len(content))
+    return [IndexedGame(list_of_offsets[index], list_of_offsets[index + 1] - list_of_offsets[index], headers)
+            for index, headers in enumerate(list_of_headers)]
+
+
+def write_game_index(game_index, index_filepath=None):
+    """
+    Writes game_index to index_filepath (by default, game_index_filepath_for_pgn_file() of its PGN file), replacing any
+    existing file only once the new one is complete. Returns index_filepath.
+    """
+    if index_filepath is None:
+        index_filepath = game_index_filepath_for_pgn_file(game_index.pgn_filepath)
+    temporary_filepath = index_filepath + ".tmp"
+    with open(temporary_filepath, "w", encoding="utf-8") as index_file:
+        json.dump(game_index.to_document(), index_file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary_filepath, index_filepath)
+    return index_filepath
+
+
+def read_game_index(pgn_filepath, index_filepath=None):
+    """
+    Reads and returns the PGNGameIndex of the PGN file at pgn_filepath from index_filepath (by default,
+    game_index_filepath_for_pgn_file(pgn_filepath)). Raises GameIndexFormatError if the file is not a game index of a
+    recognized version.
+    """
+    if index_filepath is None:
+        index_filepath = game_index_filepath_for_pgn_file(pgn_filepath)
+    try:
+        with open(index_filepath, "r", encoding="utf-8") as index_file:
+            document = json.load(index_file)
+    except ValueError as error:
+        raise GameIndexFormatError(f"Not JSON: {error}") from error
+
+    if not isinstance(document, dict) or document.get("format") != GAME_INDEX_FORMAT_NAME:
+        raise GameIndexFormatError("Not a game index")
+    if document.get("version") != GAME_INDEX_FORMAT_VERSION:
+        raise GameIndexFormatError(f"Unsupported version {document.get('version')}")
+
+    try:
+        games = [IndexedGame(offset, length, [tuple(tag_pair) for tag_pair in headers])
+                 for offset, length, headers in document["games"]]
+        return PGNGameIndex(pgn_filepath = pgn_filepath,
+                            source_sha256 = document["source_sha256"],
+                            source_size = document["source_size"],
+                            source_mtime_ns = document["source_mtime_ns"],
+                            games = games)
+    except (KeyError, TypeError, ValueError) as error:
+        raise GameIndexFormatError(f"Malformed game index: {error}") from error
+
+
+def load_game_index(pgn_filepath):
+    """
+    Returns the PGNGameIndex of the PGN file at pgn_filepath: the persisted index, if there is one and it matches the
+    file’s current content; otherwise a fresh scan of the file, which is then persisted (if the directory is writable).
+    """
+    index_filepath = game_index_filepath_for_pgn_file(pgn_filepath)
+    file_stat = os.stat(pgn_filepath)
+
+    if os.path.exists(index_filepath):
+        try:
+            game_index = read_game_index(pgn_filepath, index_filepath)
+        except (GameIndexFormatError, OSError) as error:
+            log_nonfatal_error(f"Ignoring unreadable game index {index_filepath}: {error}")
+        else:
+            if game_index.source_size == file_stat.st_size:
+                if game_index.source_mtime_ns == file_stat.st_mtime_ns:
+                    return game_index
+                # Touched but perhaps unchanged: compares content, which costs one read of the file, but no scan
+                with open(pgn_filepath, "rb") as pgn_file:
+                    if hashlib.sha256(pgn_file.read()).hexdigest() == game_index.source_sha256:
+                        game_index.source_mtime_ns = file_stat.st_mtime_ns
+                        try_to_write_game_index(game_index, index_filepath)
+                        return game_index
+            logging.info(f"Game index {index_filepath} is stale; rescanning {pgn_filepath}")
+
+    game_index = scan_pgn_file(pgn_filepath)
+    try_to_write_game_index(game_index, index_filepath)
+    return game_index
+
+
+def try_to_write_game_index(game_index, index_filepath):
+    """
+    Writes game_index to index_filepath, logging rather than raising if that is impossible
+    """
+    try:
+        write_game_index(game_index, index_filepath)
+    except OSError as error:
+        log_nonfatal_error(f"Could not write game index {index_filepath}: {error}")
+
+
+def list_of_discrepancies_with_sequential_reading(game_index):
+    """
+    Returns a list of messages describing each way in which game_index disagrees with reading its PGN file game by game
+    with chess.pgn (empty if they agree): a different number of games, or an indexed range that holds other than exactly
+    one game. Reads the whole file, so is meant for checking an index (see index_pgn.py --verify), not for serving.
+    """
+    with open(game_index.pgn_filepath, "rb") as pgn_file:
+        content = pgn_file.read()
+
+    list_of_messages = []
+    number_of_games_read = number_of_games_in_pgn_text(content.decode("utf-8-sig", errors="replace"))
+    if number_of_games_read != len(game_index):
+        list_of_messages.append(f"The index has {len(game_index):,} games, "
+                                f"but chess.pgn reads {number_of_games_read:,}")
+    for game_number, game in enumerate(game_index.games):
+        game_text = content[game.offset:game.offset + game.length].decode("utf-8-sig", errors="replace")
+        number_of_games_in_range = number_of_games_in_pgn_text(game_text)
+        if number_of_games_in_range != 1:
+            list_of_messages.append(f"Game {game_number} (offset {game.offset:,}, length {game.length:,}) holds "
+                                    f"{number_of_games_in_range} games")
+    return list_of_messages
+
+
+def number_of_games_in_pgn_text(pgn_text):
+    """
+    Returns the number of games that chess.pgn reads, one after another, from pgn_text
+    """
+    handle = io.StringIO(pgn_text)
+    number_of_games = 0
+    while chess.pgn.skip_game(handle):
+        number_of_games += 1
+    return number_of_games
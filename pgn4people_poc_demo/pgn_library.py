@@ -0,0 +1,131 @@
+"""
+Library of PGN files: every PGN file in a directory, each served at /<pgn_id>/node/<target>/<board> (see traverse.py),
+where pgn_id is the file’s name without its .pgn extension.
+
+Nothing is loaded at startup. The directory is listed on first use and listed again whenever its mtime changes (i.e.,
+a file is added, removed, or renamed), and a file’s tree is built (or memory-mapped from its compiled file; see
+compiled_game_tree.py) only when one of its pages is first requested. Built trees are held in a GameTreeCache bounded by
+PGN_LIBRARY_MAXIMUM_TREE_BYTES, which evicts least-recently-used trees by their estimated size, including the caches
+attached to each tree as it is served (see estimated_bytes_of_nodedict()), so hundreds of repertoires can be hosted
+while only those in use occupy memory.
+"""
+
+import os
+import re
+import threading
+
+from . constants import (ESTIMATED_BYTES_PER_MEMOIZED_FEN_OF_COMPACT_GAME_TREE,
+                         ESTIMATED_BYTES_PER_MEMOIZED_FEN_OF_GAME_TREE,
+                         ESTIMATED_BYTES_PER_NODE_OF_COMPACT_GAME_TREE,
+                         ESTIMATED_BYTES_PER_NODE_OF_GAME_TREE,
+                         ESTIMATED_BYTES_PER_NODE_OF_TRANSPOSITION_INDEX,
+                         ESTIMATED_BYTES_PER_ROW_FRAGMENT,
+                         )
+from . variations_table import row_fragment_cache_capacity_of_tree
+
+PGN_FILE_EXTENSION = ".pgn"
+
+# A pgn_id must be usable as a URL path segment as is
+REGEX_OF_PGN_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+class PGNLibrary:
+    """
+    The PGN files of directory, and (via game_tree_cache) their lazily-built trees; see module docstring.
+    """
+
+    __slots__ = {
+        "directory":
+            "Absolute path of the directory of PGN files",
+        "game_tree_cache":
+            "GameTreeCache (typically bounded; see GameTreeCache.maximum_bytes) holding the trees built so far",
+        "pgn_filepaths_by_id":
+            "Dictionary {pgn_id: path of PGN file} as of the last listing of directory",
+        "directory_mtime_ns":
+            "st_mtime_ns of directory when last listed; None if never listed",
+        "lock":
+            "Serializes listings of directory",
+    }
+
+    def __init__(self, directory, game_tree_cache):
+        self.directory = directory
+        self.game_tree_cache = game_tree_cache
+        self.pgn_filepaths_by_id = {}
+        self.directory_mtime_ns = None
+        self.lock = threading.Lock()
+
+
+    def refresh_if_directory_changed(self):
+        """
+        Lists directory again if its mtime has changed since it was last listed
+        """
+        directory_mtime_ns = os.stat(self.directory).st_mtime_ns
+        if directory_mtime_ns == self.directory_mtime_ns:
+            return
+
+        with self.lock:
+            if directory_mtime_ns == self.directory_mtime_ns:
+                return
+            pgn_filepaths_by_id = {}
+            for filename in os.listdir(self.directory):
+                pgn_id, extension = os.path.splitext(filename)
+                if extension.lower() == PGN_FILE_EXTENSION and REGEX_OF_PGN_ID.fullmatch(pgn_id):
+                    pgn_filepaths_by_id[pgn_id] = os.path.join(self.directory, filename)
+            self.pgn_filepaths_by_id = pgn_filepaths_by_id
+            self.directory_mtime_ns = directory_mtime_ns
+
+
+    def list_of_pgn_ids(self):
+        """
+        Returns the sorted list of the pgn_ids of the library
+        """
+        self.refresh_if_directory_changed()
+        return sorted(self.pgn_filepaths_by_id)
+
+
+    def filepath_of_pgn(self, pgn_id):
+        """
+        Returns the path of the PGN file of pgn_id, or None if the library has no such PGN
+        """
+        self.refresh_if_directory_changed()
+        return self.pgn_filepaths_by_id.get(pgn_id)
+
+
+    def get_entry(self, pgn_id):
+        """
+        Returns the CachedGameTree of pgn_id, building the tree if necessary, or None if the library has no such PGN
+        """
+        pgn_filepath = self.filepath_of_pgn(pgn_id)
+        if pgn_filepath is None:
+            return None
+        try:
+            return self.game_tree_cache.get_entry(pgn_filepath)
+        except FileNotFoundError:
+            # Removed since the directory was listed
+            return None
+
+
+def estimated_bytes_of_nodedict(nodedict):
+    """
+    Returns an estimate of the memory, in bytes, that nodedict (a GameTree or a CompactGameTree) can come to occupy, for
+    the eviction decisions of a bounded GameTreeCache.
+
+    The estimate is made once, when the tree is built, so it covers not only the tree but also the most that is attached
+    to it lazily as it is served: a memoized FEN for every node, a transposition index, and a full row-fragment cache
+    (whose capacity is proportional to the tree; see row_fragment_cache_capacity_of_tree()). See
+    PGN_LIBRARY_MAXIMUM_TREE_BYTES.
+    """
+    # Imported here because compact_game_tree imports python-chess, which is loaded on first use (see traverse.py)
+    from . compact_game_tree import CompactGameTree
+
+    number_of_nodes = len(nodedict)
+    if isinstance(nodedict, CompactGameTree):
+        bytes_per_node = (ESTIMATED_BYTES_PER_NODE_OF_COMPACT_GAME_TREE
+                          + ESTIMATED_BYTES_PER_MEMOIZED_FEN_OF_COMPACT_GAME_TREE
+                          + ESTIMATED_BYTES_PER_NODE_OF_TRANSPOSITION_INDEX)
+    else:
+        bytes_per_node = (ESTIMATED_BYTES_PER_NODE_OF_GAME_TREE
+                          + ESTIMATED_BYTES_PER_MEMOIZED_FEN_OF_GAME_TREE
+                          + ESTIMATED_BYTES_PER_NODE_OF_TRANSPOSITION_INDEX)
+    return (number_of_nodes * bytes_per_node
+            + row_fragment_cache_capacity_of_tree(number_of_nodes) * ESTIMATED_BYTES_PER_ROW_FRAGMENT)
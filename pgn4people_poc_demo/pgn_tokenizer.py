@@ -14,6 +14,7 @@ from . constants import (
                          OPEN_VARIATION_INDICATOR,
                          CLOSE_VARIATION_INDICATOR,
                          )
+from . python_chess_utilities import checked_king_square_after_move
 
 
 class TokenizedGame():
@@ -38,11 +39,12 @@ class TokenizedGame():
         “)”: end a variation
             A 1-tuple
             #1: CLOSE_VARIATION_INDICATOR
-        Movetext: A movetext token; a 2-tuple, including a dictionary of alternative text representations of the move.
+        Movetext: A movetext token; a 3-tuple, including a dictionary of alternative text representations of the move.
             #1: MOVETEXT_INDICATOR
             #2: A dictionary
                 "san": SAN, e.g., “Nf3”
                 "lan": LAN, e.g., “Ng1-f3”
+            #3: Square of the king that the move puts in check, or None
 
         Comment: A textual annotation string (not to be confused with a PGN comment that is NOT part of the 
             PGN, i.e., lines which start with “%” or anything after a “;”)
@@ -116,12 +118,13 @@ class PGNTokenizer(BaseVisitor):
         I use the board_stack_last_item only for converting the move into SAN and LAN representations.
         I pass along only these two representations of the move.
 
-        Returns a token that is a 2-tuple:
+        Returns a token that is a 3-tuple:
             #1: MOVETEXT_INDICATOR, e.g., “<M>”, signalling that this token is a movetext token
             #2: a dictionary of alternative text representations of the move.
                 "san": SAN, e.g., “Nf3”
                 "lan": LAN, e.g., “Ng1-f3”
                 "uci": UCI, e.g., "g1f3"
+            #3: the square of the king that the move puts in check, or None
 
         """
         # print(board_stack_last_item)
@@ -133,7 +136,9 @@ class PGNTokenizer(BaseVisitor):
         # move_san = san_from_board_and_move(board_stack_last_item, move)
 
         # token_to_append = (MOVETEXT_INDICATOR, move_san, move_lan)
-        token_to_append = (MOVETEXT_INDICATOR, {"san": move_san, "lan": move_lan, "uci": move_uci})
+        token_to_append = (MOVETEXT_INDICATOR,
+                           {"san": move_san, "lan": move_lan, "uci": move_uci},
+                           checked_king_square_after_move(board_stack_last_item, move_san))
         self.tokenized_game.tokenlist.append(token_to_append)
     
 
@@ -0,0 +1,88 @@
+"""
+Defines
+• the custom visitor class PGNTreeBuilder, which builds the game tree directly while chess.pgn.read_game() scans the
+PGN, without first materializing a TokenizedGame (see pgn_tokenizer.py).
+• its subclass PGNCompactTreeBuilder, which builds a CompactGameTree (see compact_game_tree.py) instead.
+
+The movetext dictionary attached to each Edge built this way is a MovetextDict (see classes_arboreal.py), which derives
+its LAN representation only when asked for it.
+
+The visitors live here, rather than beside the trees they build, because they subclass chess.pgn.BaseVisitor: a module
+that only holds or loads trees (e.g., compact_game_tree.py, for a compiled tree) thus does not import chess.pgn.
+"""
+from chess.pgn import BaseVisitor
+
+from . build_tree import GameTreeBuilder
+from . classes_arboreal import MovetextDict
+from . compact_game_tree import CompactGameTreeBuilder
+from . python_chess_utilities import checked_king_square_after_move
+
+
+class PGNTreeBuilder(BaseVisitor):
+    """
+    Custom visitor to be used in conjunction with chess.pgn.read_game(), replacing the default visitor (viz., 
+    chess.pgn.GameBuilder).
+
+    Each element of the PGN is passed, as read_game() encounters it, to an instance of GameTreeBuilder, so the game
+    tree is built in a single pass: no token list is accumulated, and nothing but the finished tree outlives the parse.
+
+    result() returns the GameTree, exactly as buildtree() would have returned it for the TokenizedGame produced by
+    PGNTokenizer from the same PGN.
+
+    Subclasses may substitute a different builder class via the class attribute Builder (see PGNCompactTreeBuilder).
+    """
+
+    Builder = GameTreeBuilder
+
+    def begin_game(self):
+        self.builder = self.Builder()
+
+
+    def visit_header(self, tagname, tagvalue):
+        """
+        Receives each header from read_game() and stores it in the list `headers` of the GameTree.
+        """
+        self.builder.store_header(tagname, tagvalue)
+
+
+    def begin_variation(self):
+        self.builder.open_variation()
+
+
+    def end_variation(self):
+        self.builder.close_variation()
+
+
+    def visit_move(self, board_stack_last_item, move):
+        """
+        Visitor to receive board/move combinations from chess.pgn.read_game()
+
+        Only the SAN, which is displayed for every move in the variations table, requires the board; the UCI is taken
+        from the move itself, and the LAN is derived only on demand (see MovetextDict). The board also locates the king
+        that the move puts in check, if any, which is recorded on the new node for displaying the board.
+        """
+        move_san = board_stack_last_item.san(move)
+        movetext_dict = MovetextDict(san=move_san, uci=move.uci())
+        self.builder.add_movetext(movetext_dict,
+                                  checked_king_square = checked_king_square_after_move(board_stack_last_item, move_san))
+    
+
+    def visit_nag(self, nag):
+        self.builder.add_nag(nag)
+
+
+    def visit_comment(self, comment):
+        self.builder.add_comment(comment)
+
+
+    def result(self):
+        # This is the only @abc.abstractmethod in BaseVisitor
+        return self.builder.result()
+
+
+class PGNCompactTreeBuilder(PGNTreeBuilder):
+    """
+    Custom visitor, for use with chess.pgn.read_game(), that builds a CompactGameTree in a single pass.
+    """
+
+    Builder = CompactGameTreeBuilder
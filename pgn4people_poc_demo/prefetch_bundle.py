@@ -0,0 +1,110 @@
+"""
+Prefetch bundle of a /node/<target>/<board> view: the lines reachable from the view with one click, i.e., the tables
+displayed by clicking each alternative shown in the view’s variations table, sent as deltas from the view’s own table so
+that a client can prefetch them and display any of them without a round trip to the server.
+
+Clicking the alternative leading to node A displays /node/A/A, whose table is the table of A’s deviation history. That
+table agrees with the view’s table in its leading rows—those before the row in which the alternative is shown, and
+often more—and differs from there on. So the bundle is
+    {
+        "target_node_id":       target_node_id,
+        "node_id_for_board":    node_id_for_board,
+        "rows":                 rows of the view’s table (the shared prefix of every line),
+        "lines":                [line, ...],
+        "number_of_lines_omitted":  number of reachable lines left out to respect the byte budget,
+    }
+where each line is
+    {
+        "target_node_id":   A,
+        "prefix_length":    number of leading rows of "rows" that the line’s table shares,
+        "suffix_rows":      the line’s remaining rows,
+        "board":            board of A (see display_chess_board.board_of_node()),
+        "comments":         comments of A (see display_text_comments.comments_of_node()),
+    }
+and rows are as returned by variations_table.structured_row_of_variations_line(). Thus A’s table is
+rows[:prefix_length] + suffix_rows.
+
+Lines are added in order of the distance (in rows) of their alternative from the row of the view whose mainline move is
+shown on the board—where the user is looking, and so where the next click is likeliest—until the next line would push
+the bundle’s lines past the byte budget (PREFETCH_BUNDLE_BYTE_BUDGET, measured as compact UTF-8 JSON).
+"""
+
+import json
+
+from . display_chess_board import board_of_node
+from . display_text_comments import comments_of_node
+from . game_tree import deviation_history_of_node
+from . variations_table import list_of_row_fragments_for_variations_table
+
+
+def structured_rows_of_table_of_node(nodedict, target_node_id):
+    """
+    Returns the list of structured rows (without the faux first row) of the variations table that displays
+    target_node_id’s line
+    """
+    deviation_history = deviation_history_of_node(nodedict, target_node_id)
+    return [row_fragment.structured_row()
+            for row_fragment in list_of_row_fragments_for_variations_table(nodedict, deviation_history)
+            if not row_fragment.is_first_row]
+
+
+def prefetch_bundle_of_view(nodedict, target_node_id, node_id_for_board, byte_budget):
+    """
+    Returns the prefetch bundle (see module docstring) of the view /node/<target_node_id>/<node_id_for_board>, with no
+    more than byte_budget bytes of lines.
+    """
+    rows = structured_rows_of_table_of_node(nodedict, target_node_id)
+
+    index_of_row_of_board = 0
+    for index_of_row, row in enumerate(rows):
+        if any(cell and cell["node_id"] == node_id_for_board for cell in (row["white"], row["black"])):
+            index_of_row_of_board = index_of_row
+            break
+
+    # (distance from the board’s row, index of row, node_id of alternative), sorted so that lines nearest the board’s
+    # row come first and, among equally near lines, in the order in which they appear in the table
+    list_of_alternatives = sorted((abs(index_of_row - index_of_row_of_board), index_of_row, cell["node_id"])
+                                  for index_of_row, row in enumerate(rows)
+                                  for cell in row["alternatives"])
+
+    lines = []
+    number_of_bytes = 0
+    for number_of_lines_added, (_, index_of_row, alternative_node_id) in enumerate(list_of_alternatives):
+        rows_of_line = structured_rows_of_table_of_node(nodedict, alternative_node_id)
+        prefix_length = length_of_shared_prefix(rows, rows_of_line, index_of_row)
+        line = {
+                "target_node_id": alternative_node_id,
+                "prefix_length": prefix_length,
+                "suffix_rows": rows_of_line[prefix_length:],
+                "board": board_of_node(nodedict, alternative_node_id),
+                "comments": comments_of_node(nodedict, alternative_node_id),
+               }
+
+        number_of_bytes_of_line = len(json.dumps(line, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        if number_of_bytes + number_of_bytes_of_line > byte_budget:
+            number_of_lines_omitted = len(list_of_alternatives) - number_of_lines_added
+            break
+        number_of_bytes += number_of_bytes_of_line
+        lines.append(line)
+    else:
+        number_of_lines_omitted = 0
+
+    return {
+            "target_node_id": target_node_id,
+            "node_id_for_board": node_id_for_board,
+            "rows": rows,
+            "lines": lines,
+            "number_of_lines_omitted": number_of_lines_omitted,
+           }
+
+
+def length_of_shared_prefix(rows, rows_of_line, minimum_length):
+    """
+    Returns the number of leading rows that rows and rows_of_line have in common, given that they have at least the
+    first minimum_length rows in common
+    """
+    length = minimum_length
+    maximum_length = min(len(rows), len(rows_of_line))
+    while length < maximum_length and rows[length] == rows_of_line[length]:
+        length += 1
+    return length
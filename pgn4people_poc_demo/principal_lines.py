@@ -0,0 +1,127 @@
+"""
+Index of principal lines: for every node, its locally-mainline continuation (the node, its mainline successor, that
+node’s mainline successor, …, through to a terminal node) stored as one contiguous run.
+
+The nodes are laid out in `order` such that (a) following a node come its mainline successor, and so on to the end of
+its principal line and (b) every node comes after all of its predecessors. (This is a preorder traversal that always
+descends the mainline edge first, with the alternatives at each node deferred until the principal line being laid out
+has reached its terminal node.) Then, for any node X:
+    order[position[X] : run_end[X]]
+is X’s principal line, and the line displayed for a deviation history is the concatenation of one such slice per
+deviation, plus one to the terminal node (see displayed_line_of_deviation_history()), rather than the result of a
+halfmove-by-halfmove walk from the initial node that checks the deviation history at every node.
+
+The index is built when the tree is built (see GameTreeBuilder.result()), or otherwise on first use.
+"""
+
+from array import array
+
+from . constants import (INDEX_MAINLINE,
+                         INITIAL_NODE_ID,
+                         )
+from . error_processing import fatal_developer_error
+
+
+class PrincipalLineIndex:
+    """
+    The principal-line index of a game tree; see module docstring.
+    """
+
+    __slots__ = {
+        "order":
+            "array('I') of node_ids such that each node’s principal line is a contiguous run",
+        "position":
+            "array('I') indexed by node_id: index of the node in order",
+        "run_end":
+            "array('I') indexed by node_id: index in order just past the terminal node of the node’s principal line",
+    }
+
+    def __init__(self, order, position, run_end):
+        self.order = order
+        self.position = position
+        self.run_end = run_end
+
+
+    def principal_line(self, node_id):
+        """
+        Returns a sequence of the node_ids of node_id’s principal line, from node_id through its terminal node
+        """
+        return self.order[self.position[node_id]:self.run_end[node_id]]
+
+
+def build_principal_line_index(nodedict):
+    """
+    Builds and returns the PrincipalLineIndex of nodedict (a GameTree or a CompactGameTree), whose node_ids are
+    consecutive from INITIAL_NODE_ID.
+    """
+    number_of_nodes = len(nodedict)
+    order = array("I")
+    position = array("I", bytes(4 * number_of_nodes))
+    run_end = array("I", bytes(4 * number_of_nodes))
+
+    # Stack of node_ids, each the first node of a principal line yet to be laid out
+    stack_of_run_starts = [INITIAL_NODE_ID]
+    while stack_of_run_starts:
+        run_start = len(order)
+
+        # Lays out the principal line beginning at the popped node, deferring the alternatives at each of its nodes
+        node_id = stack_of_run_starts.pop()
+        while True:
+            position[node_id] = len(order)
+            order.append(node_id)
+            destination_node_ids = nodedict.destination_node_ids_of(node_id)
+            if not destination_node_ids:
+                break
+            stack_of_run_starts.extend(reversed(destination_node_ids[INDEX_MAINLINE + 1:]))
+            node_id = destination_node_ids[INDEX_MAINLINE]
+
+        end_of_this_run = len(order)
+        for index in range(run_start, end_of_this_run):
+            run_end[order[index]] = end_of_this_run
+
+    return PrincipalLineIndex(order, position, run_end)
+
+
+def principal_line_index_of(nodedict):
+    """
+    Returns nodedict’s PrincipalLineIndex, building and storing it on nodedict if it has not yet been built.
+
+    (Storing it is one of the lazily attached derived caches described in classes_arboreal.GameTree; it is benign under
+    concurrency, because two requests racing to build it build identical indices.)
+    """
+    if nodedict.principal_line_index is None:
+        nodedict.principal_line_index = build_principal_line_index(nodedict)
+    return nodedict.principal_line_index
+
+
+def displayed_line_of_deviation_history(nodedict, deviation_history):
+    """
+    Returns a sequence of the node_ids of the line to be displayed for deviation_history, from the initial node through
+    the line’s terminal node. (At each node_id of the line, the edge followed is deviation_history[node_id] if node_id
+    is a key of deviation_history, else INDEX_MAINLINE.)
+
+    The line is assembled from slices of the principal-line index: starting at the initial node, follow the principal
+    line through the first deviation’s node, then take the deviation’s edge and follow that node’s principal line
+    through the next deviation’s node, and so on.
+    """
+    index = principal_line_index_of(nodedict)
+    order = index.order
+    position = index.position
+
+    # Every deviation’s node lies on the displayed line; since predecessors precede successors in order, sorting the
+    # deviation nodes by position puts them in the order in which the line reaches them.
+    list_of_deviating_node_ids = sorted(deviation_history, key=position.__getitem__)
+
+    displayed_line = array("I")
+    current_node_id = INITIAL_NODE_ID
+    for deviating_node_id in list_of_deviating_node_ids:
+        start = position[current_node_id]
+        end = position[deviating_node_id] + 1
+        if not start < end <= index.run_end[current_node_id]:
+            fatal_developer_error(f"Deviation at node {deviating_node_id} is not on the principal line of node "
+                                  f"{current_node_id}; deviation history: {deviation_history}")
+        displayed_line.extend(order[start:end])
+        current_node_id = nodedict.destination_node_ids_of(deviating_node_id)[deviation_history[deviating_node_id]]
+
+    displayed_line.extend(index.principal_line(current_node_id))
+    return displayed_line
@@ -1,12 +1,12 @@
 """
 Utilities specific to python-chess
+
+python-chess is imported by the functions that need it, on first use, so that importing this module (and thus
+create_app()) does not load it.
 """
 
 import logging
 
-# import chess
-import chess.pgn
-
 # from . process_pgn_file import pgn_file_not_found_fatal_error
 # from . pgn_tokenizer import PGNTokenizer
 from . constants import (
@@ -23,6 +23,7 @@ def update_position_with_move_uci(pre_move_fen, move_uci):
     position, expressed as the FEN string pre_move_fen, and applying the chess move, expressed
     as the SAN string move_sans.
     """
+    import chess
 
     board = chess.Board(pre_move_fen)
     move = chess.Move.from_uci(move_uci)
@@ -31,6 +32,35 @@ def update_position_with_move_uci(pre_move_fen, move_uci):
 
     return post_move_fen
 
+def fen_after_uci_moves(initial_fen, list_of_moves_uci):
+    """
+    Returns the position, as a FEN string, resulting from (a) starting at the position expressed by the FEN string
+    initial_fen and (b) applying, in order, each chess move in list_of_moves_uci, each expressed as a UCI string.
+
+    Only one chess.Board is constructed and only one FEN is serialized, regardless of the number of moves.
+    """
+    import chess
+
+    board = chess.Board(initial_fen)
+    for move_uci in list_of_moves_uci:
+        board.push(chess.Move.from_uci(move_uci))
+
+    return board.fen()
+
+
+def checked_king_square_after_move(board, move_san):
+    """
+    Returns the square (0–63) of the king that is in check after the move whose SAN is move_san is played on board (the
+    position before the move), or None if the move does not give check.
+
+    The SAN of a move already records whether it gives check (a “+” or “#” suffix), so no move need be pushed; and the
+    king in check is the one belonging to the player not on move in board, which the move itself cannot displace.
+    """
+    if move_san[-1] not in "+#":
+        return None
+    return board.king(not board.turn)
+
+
 def san_from_board_and_move(board, move):
     move_san = board.san(move)
     return move_san
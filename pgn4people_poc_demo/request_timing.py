@@ -0,0 +1,178 @@
+"""
+Per-stage timing of page requests, reported in a Server-Timing response header and aggregated in-process.
+
+A view decorated with @timed_request is timed as a whole (“total”), and each stage of its work wrapped in
+    with timed_stage("rows"):
+        ...
+is timed separately. The response then carries, e.g.,
+    Server-Timing: tree;dur=0.02, deviation;dur=0.05, rows;dur=1.31, board;dur=0.04, svg;dur=0.01, comments;dur=0.01,
+                   render;dur=2.2, total;dur=3.9
+(durations in milliseconds), which browser devtools display in the request’s Timing tab. A stage that does not run
+(e.g., every rendering stage, when the page is served from the page cache) is simply absent.
+
+Every request’s timings are also added to per-(endpoint, stage) totals (see timing_statistics()), logged at DEBUG level,
+and every SERVER_TIMING_SUMMARY_INTERVAL requests the mean and maximum of each stage are logged at INFO level.
+
+When constants.SERVER_TIMING_ENABLED is False, @timed_request returns the view undecorated, and timed_stage() returns
+a shared no-op context manager after a single test of that constant, so the instrumentation costs well under a
+microsecond per stage.
+"""
+
+from contextlib import nullcontext
+import functools
+import logging
+import threading
+import time
+
+from flask import g
+from flask import make_response
+from flask import request
+
+from . import constants
+
+# Returned by timed_stage() when timing is disabled or no request is being timed. (A nullcontext is reusable.)
+NO_OP_STAGE = nullcontext()
+
+
+class RequestTiming:
+    """
+    The stage timings of the request being handled, held on flask.g
+    """
+
+    __slots__ = {
+        "start": "time.perf_counter() at the start of the view",
+        "list_of_stage_durations": "List of (stage name, seconds), in the order in which the stages completed",
+    }
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.list_of_stage_durations = []
+
+
+    def server_timing_header(self, total_seconds):
+        """
+        Returns the value of the Server-Timing header: each stage’s duration, and the total, in milliseconds
+        """
+        return ", ".join(f"{stage};dur={1000 * seconds:.2f}"
+                         for stage, seconds in (*self.list_of_stage_durations, ("total", total_seconds)))
+
+
+class TimedStage:
+    """
+    Context manager that appends the duration of its block to a RequestTiming
+    """
+
+    __slots__ = ("request_timing", "stage", "start")
+
+    def __init__(self, request_timing, stage):
+        self.request_timing = request_timing
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception_info):
+        self.request_timing.list_of_stage_durations.append((self.stage, time.perf_counter() - self.start))
+        return False
+
+
+class StageStatistics:
+    """
+    Aggregate of the durations of one stage of one endpoint
+    """
+
+    __slots__ = {
+        "count": "Number of requests in which the stage ran",
+        "total_seconds": "Sum of its durations",
+        "maximum_seconds": "Greatest of its durations",
+    }
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.maximum_seconds = 0.0
+
+
+    def add(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.maximum_seconds:
+            self.maximum_seconds = seconds
+
+
+# {(endpoint, stage): StageStatistics}, guarded by statistics_lock
+statistics_by_endpoint_and_stage = {}
+statistics_lock = threading.Lock()
+number_of_timed_requests = 0
+
+
+def timed_stage(stage):
+    """
+    Returns a context manager that times its block as stage of the request being timed (see module docstring)
+    """
+    if not constants.SERVER_TIMING_ENABLED:
+        return NO_OP_STAGE
+    request_timing = g.get("request_timing")
+    if request_timing is None:
+        # Called outside a @timed_request view (e.g., from the JSON API)
+        return NO_OP_STAGE
+    return TimedStage(request_timing, stage)
+
+
+def timed_request(view):
+    """
+    Decorator of a view whose stages are to be timed (see module docstring)
+    """
+    if not constants.SERVER_TIMING_ENABLED:
+        return view
+
+    @functools.wraps(view)
+    def timed_view(*args, **kwargs):
+        if g.get("request_timing") is not None:
+            # Called from another timed view (as the home page calls promote_node_to_main_line())
+            return view(*args, **kwargs)
+
+        request_timing = g.request_timing = RequestTiming()
+        response = make_response(view(*args, **kwargs))
+        total_seconds = time.perf_counter() - request_timing.start
+        g.request_timing = None
+
+        header = request_timing.server_timing_header(total_seconds)
+        response.headers["Server-Timing"] = header
+        logging.debug(f"Server-Timing of {request.path}: {header}")
+        record_timing(request.endpoint, request_timing, total_seconds)
+        return response
+
+    return timed_view
+
+
+def record_timing(endpoint, request_timing, total_seconds):
+    """
+    Adds a request’s timings to the in-process aggregates, logging a summary every SERVER_TIMING_SUMMARY_INTERVAL
+    requests
+    """
+    global number_of_timed_requests
+    with statistics_lock:
+        for stage, seconds in (*request_timing.list_of_stage_durations, ("total", total_seconds)):
+            statistics = statistics_by_endpoint_and_stage.get((endpoint, stage))
+            if statistics is None:
+                statistics = statistics_by_endpoint_and_stage[(endpoint, stage)] = StageStatistics()
+            statistics.add(seconds)
+        number_of_timed_requests += 1
+        is_time_for_summary = number_of_timed_requests % constants.SERVER_TIMING_SUMMARY_INTERVAL == 0
+
+    if is_time_for_summary:
+        summary = "; ".join(f"{endpoint} {stage}: mean {1000 * mean_seconds:.2f} ms, max {1000 * maximum_seconds:.2f} ms"
+                            for (endpoint, stage), (_, mean_seconds, maximum_seconds)
+                            in timing_statistics().items())
+        logging.info(f"Server-Timing summary after {number_of_timed_requests} requests: {summary}")
+
+
+def timing_statistics():
+    """
+    Returns {(endpoint, stage): (count, mean seconds, maximum seconds)} over the requests timed so far
+    """
+    with statistics_lock:
+        return {key: (statistics.count, statistics.total_seconds / statistics.count, statistics.maximum_seconds)
+                for key, statistics in statistics_by_endpoint_and_stage.items()}
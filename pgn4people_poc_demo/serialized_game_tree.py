@@ -0,0 +1,173 @@
+"""
+JSON and msgpack serialization of the game tree, for preloading worker processes and for shipping a precompiled tree to
+the browser.
+
+Both encodings serialize the same document, a JSON-compatible dict:
+
+    {
+        "format":       SERIALIZATION_FORMAT_NAME,
+        "version":      SERIALIZATION_FORMAT_VERSION,
+        "node_fields":  NODE_FIELDS,
+        "edge_fields":  EDGE_FIELDS,
+        "headers":      [[tag_name, tag_value], ...],
+        "nodes":        [node, ...],
+    }
+
+"nodes" is indexed by node_id (node_ids are consecutive from INITIAL_NODE_ID). To keep the document small, each node and
+each edge is a list of field values, in the order named by NODE_FIELDS and EDGE_FIELDS, rather than an object:
+
+    node:   [depth, halfmovenumber, originatingnode_id, choice_id_at_originatingnode, comment, preceding_comment, fen,
+             checked_king_square, edges]
+    edge:   [san, uci, nags, destination_node_id]
+
+where comment, preceding_comment, fen, checked_king_square, and choice_id_at_originatingnode may be null, nags is a
+list of integers, and an edge’s reference_index is its position in its node’s edges. The LAN of a move is not stored,
+because it is derived from the SAN and UCI (see classes_arboreal.MovetextDict).
+
+Only the initial node’s FEN is stored; every other node’s fen is null. The FEN of any other node is memoized lazily by
+game_tree.fen_of_node() as pages are served, so storing whatever FENs happened to be memoized would make the
+serialization of the same tree depend on which pages had been viewed. The deserialized tree recomputes them on demand,
+exactly as a freshly built tree does.
+
+A tree round-trips exactly: game_tree_from_document(game_tree_to_document(nodedict)) has, for every node and edge, the
+same value of every GameNode and Edge attribute (other than a FEN memoized after the build), and of every movetext_dict
+key, as nodedict. The document of a tree does not change as pages of it are served.
+
+msgpack is an optional dependency, imported only when a msgpack function is called.
+"""
+
+import json
+
+from . classes_arboreal import Edge
+from . classes_arboreal import GameNode
+from . classes_arboreal import GameTree
+from . constants import INITIAL_NODE_ID
+from . error_processing import fatal_developer_error
+from . classes_arboreal import MovetextDict
+
+
+SERIALIZATION_FORMAT_NAME = "pgn4people-game-tree"
+SERIALIZATION_FORMAT_VERSION = 2
+
+NODE_FIELDS = ("depth", "halfmovenumber", "originatingnode_id", "choice_id_at_originatingnode", "comment",
+               "preceding_comment", "fen", "checked_king_square", "edges")
+EDGE_FIELDS = ("san", "uci", "nags", "destination_node_id")
+
+
+class SerializedGameTreeFormatError(ValueError):
+    """
+    Raised when a document is not a serialized game tree that this version of the deserializer can read
+    """
+    pass
+
+
+def game_tree_to_document(nodedict):
+    """
+    Returns the serialization document (see module docstring) of nodedict, which may be a GameTree or a
+    CompactGameTree.
+    """
+    nodes = []
+    for node_id in range(INITIAL_NODE_ID, len(nodedict)):
+        if node_id not in nodedict:
+            fatal_developer_error(f"node_ids of the game tree are not consecutive: {node_id} is missing.")
+        node = nodedict[node_id]
+        edges = [[edge.movetext_dict["san"], edge.movetext_dict["uci"], list(edge.nag_list), edge.destination_node_id]
+                 for edge in node.edgeslist]
+        nodes.append([node.depth,
+                      node.halfmovenumber,
+                      node.originatingnode_id,
+                      node.choice_id_at_originatingnode,
+                      node.comment,
+                      node.preceding_comment,
+                      node.fen if node_id == INITIAL_NODE_ID else None,
+                      node.checked_king_square,
+                      edges])
+
+    return {
+            "format": SERIALIZATION_FORMAT_NAME,
+            "version": SERIALIZATION_FORMAT_VERSION,
+            "node_fields": list(NODE_FIELDS),
+            "edge_fields": list(EDGE_FIELDS),
+            "headers": [list(header) for header in nodedict.headers],
+            "nodes": nodes,
+           }
+
+
+def game_tree_from_document(document):
+    """
+    Returns the GameTree described by document (see module docstring).
+
+    Raises SerializedGameTreeFormatError if document is not of a recognized format and version.
+    """
+    if not isinstance(document, dict) or document.get("format") != SERIALIZATION_FORMAT_NAME:
+        raise SerializedGameTreeFormatError("Document is not a serialized game tree.")
+    if document.get("version") != SERIALIZATION_FORMAT_VERSION:
+        raise SerializedGameTreeFormatError(f"Unsupported serialized game-tree version {document.get('version')} "
+                                            f"(expected {SERIALIZATION_FORMAT_VERSION}).")
+
+    gametree = GameTree()
+    gametree.headers = [tuple(header) for header in document["headers"]]
+
+    # Adds every node before any edge, because GameTree.install_new_edge() looks up the originating node
+    list_of_edges_by_node = []
+    for node_id, (depth, halfmovenumber, originatingnode_id, choice_id_at_originatingnode, comment, preceding_comment,
+                  fen, checked_king_square, edges) in enumerate(document["nodes"], start=INITIAL_NODE_ID):
+        gametree.add_node(node_id, GameNode(depth = depth,
+                                            halfmovenumber = halfmovenumber,
+                                            originating_node_id = originatingnode_id,
+                                            preceding_comment = preceding_comment,
+                                            comment = comment,
+                                            fen = fen,
+                                            checked_king_square = checked_king_square,
+                                            choice_id_at_originatingnode = choice_id_at_originatingnode))
+        list_of_edges_by_node.append((node_id, edges))
+
+    for node_id, edges in list_of_edges_by_node:
+        for san, uci, nags, destination_node_id in edges:
+            edge = Edge(MovetextDict(san=san, uci=uci), destination_node_id)
+            edge.nag_list = list(nags)
+            gametree.install_new_edge(node_id, edge)
+
+    return gametree
+
+
+def game_tree_to_json(nodedict):
+    """
+    Returns the serialization of nodedict as a (compact, UTF-8-ready) JSON string
+    """
+    return json.dumps(game_tree_to_document(nodedict), ensure_ascii=False, separators=(",", ":"))
+
+
+def game_tree_from_json(json_string):
+    """
+    Returns the GameTree serialized in json_string (str or bytes)
+    """
+    return game_tree_from_document(json.loads(json_string))
+
+
+def game_tree_to_msgpack(nodedict):
+    """
+    Returns the serialization of nodedict as msgpack bytes
+    """
+    msgpack = import_msgpack()
+    return msgpack.packb(game_tree_to_document(nodedict), use_bin_type=True)
+
+
+def game_tree_from_msgpack(msgpack_bytes):
+    """
+    Returns the GameTree serialized in msgpack_bytes
+    """
+    msgpack = import_msgpack()
+    return game_tree_from_document(msgpack.unpackb(msgpack_bytes, raw=False))
+
+
+def import_msgpack():
+    """
+    Imports and returns the optional msgpack package, raising an ImportError that explains how to install it if absent
+    """
+    try:
+        import msgpack
+    except ImportError as error:
+        raise ImportError("msgpack serialization of the game tree requires the msgpack package "
+                          "(pip install msgpack).") from error
+    return msgpack
@@ -0,0 +1,148 @@
+/*
+Draws the chess board of the variations-table page from the piece sprite, chessboard-sprite.svg.
+
+The server sends only the position to be drawn, as data- attributes of the board’s container element:
+    data-fen            FEN of the position (only its piece-placement field is used)
+    data-last-move      last move as UCI, e.g., “g1f3”; empty if there is none
+    data-check          name of the square of the king in check, e.g., “e8”; empty if there is none
+    data-orientation    “white” or “black”: whose first rank is at the bottom of the board
+    data-coordinates    “true” to label files and ranks
+    data-sprite-url     URL of the piece sprite
+
+The sprite is fetched once (and thereafter served from the browser’s cache) and inlined into the page, and each
+piece is a <use> reference to the sprite’s symbol for that piece (“wk”, “bq”, …), so the page carries a few hundred
+bytes for the board rather than a complete SVG of it.
+
+Class names are those of cm-chessboard, so that the board is styled by cm-chessboard.css.
+*/
+
+const SPRITE_BOARD_SQUARE_SIZE = 40;    // The sprite’s pieces and markers are drawn in a 40×40 box
+const SPRITE_BOARD_BORDER_WIDTH = 10;
+const SPRITE_BOARD_FILES = "abcdefgh";
+const SVG_NAMESPACE = "http://www.w3.org/2000/svg";
+
+// One fetch of the sprite per page, shared by every board on it
+let spriteIsLoaded = null;
+
+function loadSprite(spriteUrl) {
+    if (spriteIsLoaded === null) {
+        spriteIsLoaded = fetch(spriteUrl)
+            .then(response => response.text())
+            .then(spriteText => {
+                const spriteContainer = document.createElement("div");
+                spriteContainer.style.display = "none";
+                spriteContainer.innerHTML = spriteText;
+                document.body.prepend(spriteContainer);
+            });
+    }
+    return spriteIsLoaded;
+}
+
+function svgElement(tagName, attributes) {
+    const element = document.createElementNS(SVG_NAMESPACE, tagName);
+    for (const [name, value] of Object.entries(attributes)) {
+        element.setAttribute(name, value);
+    }
+    return element;
+}
+
+// Returns a map from square name (e.g., “e4”) to sprite symbol (e.g., “wp”) for the placement field of fen
+function piecesOfFen(fen) {
+    const pieces = new Map();
+    const ranks = fen.split(" ")[0].split("/");
+    ranks.forEach((rankText, index) => {
+        const rank = 8 - index;
+        let file = 0;
+        for (const character of rankText) {
+            if (character >= "1" && character <= "8") {
+                file += Number(character);
+            } else {
+                const color = character === character.toUpperCase() ? "w" : "b";
+                pieces.set(SPRITE_BOARD_FILES[file] + rank, color + character.toLowerCase());
+                file += 1;
+            }
+        }
+    });
+    return pieces;
+}
+
+function drawSpriteBoard(container) {
+    const fen = container.dataset.fen;
+    const lastMove = container.dataset.lastMove || "";
+    const checkedSquare = container.dataset.check || "";
+    const isFlipped = (container.dataset.orientation || "white").toLowerCase() === "black";
+    const useCoordinates = (container.dataset.coordinates || "").toLowerCase() === "true";
+
+    const boardSize = 8 * SPRITE_BOARD_SQUARE_SIZE + 2 * SPRITE_BOARD_BORDER_WIDTH;
+
+    // Returns the [x, y] of the top-left corner of the square with the given name
+    function cornerOfSquare(squareName) {
+        let file = SPRITE_BOARD_FILES.indexOf(squareName[0]);
+        let rowFromTop = 8 - Number(squareName[1]);
+        if (isFlipped) {
+            file = 7 - file;
+            rowFromTop = 7 - rowFromTop;
+        }
+        return [SPRITE_BOARD_BORDER_WIDTH + file * SPRITE_BOARD_SQUARE_SIZE,
+                SPRITE_BOARD_BORDER_WIDTH + rowFromTop * SPRITE_BOARD_SQUARE_SIZE];
+    }
+
+    function useOfSprite(symbol, squareName, className) {
+        const [x, y] = cornerOfSquare(squareName);
+        return svgElement("use", {href: "#" + symbol, class: className, transform: `translate(${x}, ${y})`});
+    }
+
+    const svg = svgElement("svg", {class: "board", viewBox: `0 0 ${boardSize} ${boardSize}`, width: "100%",
+                                   height: "100%"});
+
+    const boardGroup = svgElement("g", {class: "board"});
+    boardGroup.append(svgElement("rect", {class: "border", x: 0, y: 0, width: boardSize, height: boardSize}));
+    boardGroup.append(svgElement("rect", {class: "border-inner",
+                                          x: SPRITE_BOARD_BORDER_WIDTH, y: SPRITE_BOARD_BORDER_WIDTH,
+                                          width: 8 * SPRITE_BOARD_SQUARE_SIZE, height: 8 * SPRITE_BOARD_SQUARE_SIZE}));
+    for (let rank = 1; rank <= 8; rank++) {
+        for (let file = 0; file < 8; file++) {
+            const squareName = SPRITE_BOARD_FILES[file] + rank;
+            const [x, y] = cornerOfSquare(squareName);
+            const color = (file + rank) % 2 === 0 ? "white" : "black";
+            boardGroup.append(svgElement("rect", {class: `square ${color}`, x: x, y: y,
+                                                  width: SPRITE_BOARD_SQUARE_SIZE, height: SPRITE_BOARD_SQUARE_SIZE}));
+        }
+    }
+    svg.append(boardGroup);
+
+    if (useCoordinates) {
+        const coordinatesGroup = svgElement("g", {class: "coordinates"});
+        for (let index = 0; index < 8; index++) {
+            const file = isFlipped ? 7 - index : index;
+            const rank = isFlipped ? index + 1 : 8 - index;
+            const fileLabel = svgElement("text", {class: "coordinate file", "text-anchor": "middle",
+                x: SPRITE_BOARD_BORDER_WIDTH + (index + 0.5) * SPRITE_BOARD_SQUARE_SIZE,
+                y: boardSize - 2});
+            fileLabel.textContent = SPRITE_BOARD_FILES[file];
+            const rankLabel = svgElement("text", {class: "coordinate rank", x: 2,
+                y: SPRITE_BOARD_BORDER_WIDTH + (index + 0.5) * SPRITE_BOARD_SQUARE_SIZE + 3});
+            rankLabel.textContent = String(rank);
+            coordinatesGroup.append(fileLabel, rankLabel);
+        }
+        svg.append(coordinatesGroup);
+    }
+
+    const markersGroup = svgElement("g", {class: "markers"});
+    if (lastMove.length >= 4 && lastMove !== "0000") {
+        markersGroup.append(useOfSprite("markerSquare", lastMove.slice(0, 2), "marker marker-square"));
+        markersGroup.append(useOfSprite("markerSquare", lastMove.slice(2, 4), "marker marker-square"));
+    }
+    if (checkedSquare) {
+        markersGroup.append(useOfSprite("markerCircle", checkedSquare, "marker marker-circle-red"));
+    }
+    svg.append(markersGroup);
+
+    const piecesGroup = svgElement("g", {class: "pieces"});
+    for (const [squareName, symbol] of piecesOfFen(fen)) {
+        piecesGroup.append(useOfSprite(symbol, squareName, "piece " + symbol));
+    }
+    svg.append(piecesGroup);
+
+    return loadSprite(container.dataset.spriteUrl).then(() => container.replaceChildren(svg));
+}
@@ -0,0 +1,238 @@
+"""
+Transposition-aware view of a game tree (“DAG mode”; see docs/transposition.md): the positions of the tree, each
+identified by its polyglot Zobrist hash, with every set of nodes that reach the same position merged into a single
+PositionNode that records all the ways (Origins) in which it is reached.
+
+The tree itself is unchanged: it remains a tree, in which each node has a unique originating node, because navigation
+(deviation histories, the variations table, …) depends on that. The TranspositionIndex is built beside it, as the
+principal-line index is (see principal_lines.py): when the tree is built, if constants.BUILD_TRANSPOSITION_INDEX is
+True, and otherwise on first use (see transposition_index_of()).
+
+Building the index walks the tree depth first on a single chess.Board, pushing each edge’s move on the way down and
+popping it on the way back, and hashes each node’s position with chess.polyglot.zobrist_hash(). The polyglot hash
+covers exactly what identifies a position for the purposes of transposition: the arrangement of pieces, the player to
+move, castling rights, and an en-passant square only if an en-passant capture is possible—not the halfmove clock or
+the fullmove number. Nodes are then merged, in order of node_id (so that a node’s originating node is merged before the
+node itself), into PositionNodes:
+    • The PositionNode of a position is created when the first node with that position is reached; later nodes with
+      the same position are merged into it (recorded in its list_of_node_ids).
+    • Each edge of a merged node becomes an edge of the PositionNode, unless the PositionNode already has an edge with
+      the same move (which, since the two nodes have the same position, leads to the same position).
+    • A PositionNode’s list_of_origins holds one Origin(node_id, choice_id) per distinct (predecessor PositionNode,
+      edge of that PositionNode) by which it is reached, where node_id is the position_id of the predecessor.
+
+position_id_by_zobrist_hash then finds the PositionNode of any position in O(1), and position_id_of_node maps each tree
+node to its PositionNode. merge_report() summarizes how much the merge reduces the numbers of nodes and edges. Thus
+node_ids_of_position() answers “where does this position occur?” (see the /search route in traverse.py) with a hash of
+the FEN and a dictionary lookup, rather than a scan of every node’s FEN.
+"""
+
+from array import array
+from collections import namedtuple
+
+import chess
+import chess.polyglot
+
+from . constants import INITIAL_NODE_ID
+from . game_tree import fen_of_node
+
+
+# An immediate predecessor of a PositionNode: position_id of the predecessor (node_id) and index of the edge at the
+# predecessor that leads to the PositionNode (choice_id). Named as in docs/transposition.md.
+Origin = namedtuple("Origin", ["node_id", "choice_id"])
+
+
+class PositionNode:
+    """
+    A position of the tree, i.e., a node of the transposition DAG; see module docstring.
+    """
+
+    __slots__ = {
+        "position_id":
+            "Index of the PositionNode in TranspositionIndex.positions",
+        "zobrist_hash":
+            "Polyglot Zobrist hash of the position",
+        "list_of_node_ids":
+            "node_ids of the tree’s nodes with this position, in increasing order",
+        "list_of_origins":
+            "List of Origin(position_id of predecessor, index of edge at predecessor) by which the position is "
+            "reached; empty for the initial position (unless it recurs)",
+        "edges":
+            "List of (UCI of move, position_id of destination) of the distinct moves from the position, in order of "
+            "first appearance",
+    }
+
+    def __init__(self, position_id, zobrist_hash):
+        self.position_id = position_id
+        self.zobrist_hash = zobrist_hash
+        self.list_of_node_ids = []
+        self.list_of_origins = []
+        self.edges = []
+
+
+class TranspositionIndex:
+    """
+    The positions of a game tree with transpositions merged; see module docstring.
+    """
+
+    __slots__ = {
+        "zobrist_hash_of_node":
+            "array('Q') indexed by node_id: polyglot Zobrist hash of the node’s position",
+        "position_id_of_node":
+            "array('I') indexed by node_id: position_id of the node’s PositionNode",
+        "positions":
+            "List of PositionNode, indexed by position_id",
+        "position_id_by_zobrist_hash":
+            "Dictionary {Zobrist hash: position_id}",
+    }
+
+    def __init__(self, zobrist_hash_of_node, position_id_of_node, positions, position_id_by_zobrist_hash):
+        self.zobrist_hash_of_node = zobrist_hash_of_node
+        self.position_id_of_node = position_id_of_node
+        self.positions = positions
+        self.position_id_by_zobrist_hash = position_id_by_zobrist_hash
+
+
+    def position_of_zobrist_hash(self, zobrist_hash):
+        """
+        Returns the PositionNode of the position with polyglot Zobrist hash zobrist_hash, or None if no node of the
+        tree has that position
+        """
+        position_id = self.position_id_by_zobrist_hash.get(zobrist_hash)
+        if position_id is None:
+            return None
+        return self.positions[position_id]
+
+
+    def position_of_node(self, node_id):
+        """
+        Returns the PositionNode of node node_id
+        """
+        return self.positions[self.position_id_of_node[node_id]]
+
+
+    def merge_report(self):
+        """
+        Returns a dictionary that summarizes the merge:
+            number_of_nodes:                    nodes of the tree
+            number_of_positions:                PositionNodes, i.e., distinct positions
+            number_of_transposed_positions:     positions reached by more than one node
+            number_of_edges:                    edges of the tree
+            number_of_position_edges:           edges of the PositionNodes, i.e., distinct (position, move) pairs
+            node_reduction:                     fraction by which the merge reduces the number of nodes
+            edge_reduction:                     fraction by which the merge reduces the number of edges
+        """
+        number_of_nodes = len(self.position_id_of_node)
+        number_of_positions = len(self.positions)
+        number_of_edges = number_of_nodes - 1
+        number_of_position_edges = sum(len(position.edges) for position in self.positions)
+        return {
+                "number_of_nodes": number_of_nodes,
+                "number_of_positions": number_of_positions,
+                "number_of_transposed_positions": sum(1 for position in self.positions
+                                                      if len(position.list_of_node_ids) > 1),
+                "number_of_edges": number_of_edges,
+                "number_of_position_edges": number_of_position_edges,
+                "node_reduction": 1 - number_of_positions / number_of_nodes,
+                "edge_reduction": 1 - number_of_position_edges / number_of_edges if number_of_edges else 0.0,
+               }
+
+
+def zobrist_hashes_of_nodes(nodedict):
+    """
+    Returns an array('Q') of the polyglot Zobrist hash of every node’s position, indexed by node_id, computed in a
+    single depth-first walk of the tree on one chess.Board
+    """
+    zobrist_hash_of_node = array("Q", bytes(8 * len(nodedict)))
+    board = chess.Board(fen_of_node(nodedict, INITIAL_NODE_ID))
+    zobrist_hash_of_node[INITIAL_NODE_ID] = chess.polyglot.zobrist_hash(board)
+
+    # Stack of (node_id, list of its edges, index of the next edge to visit); iterative, because a line of a long game
+    # may be deeper than Python’s recursion limit
+    stack = [(INITIAL_NODE_ID, nodedict[INITIAL_NODE_ID].edgeslist, 0)]
+    while stack:
+        node_id, edgeslist, index_of_next_edge = stack[-1]
+        if index_of_next_edge < len(edgeslist):
+            stack[-1] = (node_id, edgeslist, index_of_next_edge + 1)
+            edge = edgeslist[index_of_next_edge]
+            destination_node_id = edge.destination_node_id
+            board.push(chess.Move.from_uci(edge.movetext_dict["uci"]))
+            zobrist_hash_of_node[destination_node_id] = chess.polyglot.zobrist_hash(board)
+            stack.append((destination_node_id, nodedict[destination_node_id].edgeslist, 0))
+        else:
+            stack.pop()
+            if stack:
+                board.pop()
+
+    return zobrist_hash_of_node
+
+
+def build_transposition_index(nodedict):
+    """
+    Builds and returns the TranspositionIndex of nodedict (a GameTree or a CompactGameTree), whose node_ids are
+    consecutive from INITIAL_NODE_ID and each greater than that of the node’s originating node
+    """
+    zobrist_hash_of_node = zobrist_hashes_of_nodes(nodedict)
+    position_id_of_node = array("I", bytes(4 * len(nodedict)))
+    positions = []
+    position_id_by_zobrist_hash = {}
+
+    for node_id in range(INITIAL_NODE_ID, len(nodedict)):
+        zobrist_hash = zobrist_hash_of_node[node_id]
+        position_id = position_id_by_zobrist_hash.get(zobrist_hash)
+        if position_id is None:
+            position_id = len(positions)
+            position_id_by_zobrist_hash[zobrist_hash] = position_id
+            positions.append(PositionNode(position_id, zobrist_hash))
+        position_id_of_node[node_id] = position_id
+        position = positions[position_id]
+        position.list_of_node_ids.append(node_id)
+
+        node = nodedict[node_id]
+        if node.originatingnode_id >= INITIAL_NODE_ID:
+            # The originating node, having a smaller node_id, has been merged already, and has an edge for this node’s
+            # move
+            originating_position = positions[position_id_of_node[node.originatingnode_id]]
+            edge = nodedict[node.originatingnode_id].edgeslist[node.choice_id_at_originatingnode]
+            move_uci = edge.movetext_dict["uci"]
+            for choice_id, (edge_move_uci, _) in enumerate(originating_position.edges):
+                if edge_move_uci == move_uci:
+                    break
+            else:
+                choice_id = len(originating_position.edges)
+                originating_position.edges.append((move_uci, position_id))
+            origin = Origin(originating_position.position_id, choice_id)
+            if origin not in position.list_of_origins:
+                position.list_of_origins.append(origin)
+
+    return TranspositionIndex(zobrist_hash_of_node, position_id_of_node, positions, position_id_by_zobrist_hash)
+
+
+def zobrist_hash_of_fen(fen):
+    """
+    Returns the polyglot Zobrist hash of the position of fen, which may omit the halfmove clock and fullmove number
+    (which the hash ignores). Raises ValueError if fen is not a valid FEN.
+    """
+    return chess.polyglot.zobrist_hash(chess.Board(fen.strip()))
+
+
+def node_ids_of_position(nodedict, fen):
+    """
+    Returns the list, in increasing order, of the node_ids of the nodes of nodedict whose position (arrangement of
+    pieces, player to move, castling rights, and en-passant square if an en-passant capture is possible) is that of fen;
+    the empty list if there are none. Raises ValueError if fen is not a valid FEN.
+    """
+    position = transposition_index_of(nodedict).position_of_zobrist_hash(zobrist_hash_of_fen(fen))
+    if position is None:
+        return []
+    return list(position.list_of_node_ids)
+
+
+def transposition_index_of(nodedict):
+    """
+    Returns nodedict’s TranspositionIndex, building and storing it on nodedict if it has not yet been built. (As for
+    principal_lines.principal_line_index_of(), storing it is benign under concurrency.)
+    """
+    if nodedict.transposition_index is None:
+        nodedict.transposition_index = build_transposition_index(nodedict)
+    return nodedict.transposition_index
@@ -1,19 +1,20 @@
 """
 Routes associated with the PGN file and raversing the tree: '/node/nnn',
-'/report', and 'dump_pgn'
+'/<pgn_id>/node/nnn' (a PGN of the library; see pgn_library.py), '/report', and 'dump_pgn'
 """
 
-# import logging
+import logging
 import os
 
-import chess.pgn
-
+from flask import abort
 from flask import Blueprint
 from flask import flash
+from flask import make_response
+from flask import redirect
+from flask import request
+from flask import session
 from flask import render_template
 
-from . build_tree import buildtree
-from . classes_arboreal import GameTreeReport
 from . import constants
 from . display_chess_board import compile_parameters_for_chessboard_svg
 from . display_chess_board import construct_svg_chessboard
@@ -21,35 +22,214 @@ from . display_chess_board import form_url_for_chessboard_svg
 from . display_text_comments import extract_text_comments_for_current_node
 from . game_tree import characterize_gametree
 from . game_tree import deviation_history_of_node
-from . pgn_tokenizer import PGNTokenizer
+from . error_processing import log_nonfatal_error
+from . game_tree_cache import GameTreeCache
+from . game_tree_cache import hash_of_file_contents
+from . lru_cache import LRUCache
+from . pgn_library import estimated_bytes_of_nodedict
+from . pgn_library import PGNLibrary
+from . request_timing import timed_request
+from . request_timing import timed_stage
 from . process_pgn_file import pgn_file_not_found_fatal_error
 from . variations_table import construct_list_of_rows_for_variations_table
+from . __version__ import __version__
 
-# NOTE: As of 7/1/2022
-# Ultimately I want to perform the tree-creation only once and cache it.
-# At this point, to abstract away from those questions, I will do it EVERY TIME a request is made.
+# The modules that parse PGN, load compiled trees, or hash positions import python-chess (chess.pgn alone pulls in
+# asyncio), so they are imported by the functions below on first use, rather than here: importing this module, and
+# thus create_app(), then loads none of python-chess. See benchmarks/bench_startup.py.
 
 # Re Blueprints, see https://flask.palletsprojects.com/en/2.1.x/tutorial/views/
 blueprint = Blueprint('traverse', __name__)
 
+# Cache of rendered /node/<target>/<board> and /<pgn_id>/node/<target>/<board> pages (and the home page), keyed on
+# (content hash of the PGN, base URL of the page’s links, target_node_id, node_id_for_board, redirect_from_home_page,
+# pending flashed messages). Because the key includes the PGN’s content hash, pages of a superseded PGN are never
+# served; they simply age out.
+page_cache = LRUCache(constants.PAGE_CACHE_CAPACITY)
+
+
 @blueprint.route('/node/<int:target_node_id>/<int:node_id_for_board>')
+@timed_request
 def promote_node_to_main_line(target_node_id=0, node_id_for_board=0, redirect_from_home_page=False):
     """
     When user requests to elevate a particular node (viz., target_node_id) to the main line, displays new
     variations-table web page reflecting the specified node elevated to the main line.
+
+    The page is a pure function of the PGN, the two node_ids, whether this is the home page, and any flashed messages
+    pending in the session. Thus:
+        • Rendered pages are cached in page_cache.
+        • A page with no flashed messages gets a strong ETag (see etag_for_page()) and a public Cache-Control header, and
+          a request whose If-None-Match matches that ETag gets a 304 without the page being rendered or even looked up.
+        • A page with flashed messages (which are particular to the session) is marked “no-store”. When it is served
+          from page_cache, the flashed messages are consumed from the session just as rendering would have consumed
+          them.
     """
 
-    # Gets nodedict embodying the game tree defined by the built-in PGN file
-    nodedict = prepare_nodedict_for_tranversal()
+    # Gets the cached game tree (verifying that the PGN file has not changed), together with the PGN’s content hash
+    with timed_stage("tree"):
+        game_tree_entry = game_tree_cache.get_entry(path_of_built_in_pgn_file())
+
+    return respond_with_variations_table_page(game_tree_entry,
+                                              target_node_id,
+                                              node_id_for_board,
+                                              redirect_from_home_page,
+                                              base_url = constants.VARTABLE_BASE_URL)
+
+
+@blueprint.route('/<pgn_id>/node/<int:target_node_id>/<int:node_id_for_board>')
+@timed_request
+def promote_node_to_main_line_of_library_pgn(pgn_id, target_node_id, node_id_for_board):
+    """
+    As promote_node_to_main_line(), but for the PGN pgn_id of the PGN library (see pgn_library.py), whose tree is
+    built on first request. The page’s links stay within /<pgn_id>/node/.
+    """
+    with timed_stage("tree"):
+        game_tree_entry = pgn_library.get_entry(pgn_id)
+    if game_tree_entry is None:
+        abort(404)
+
+    return respond_with_variations_table_page(game_tree_entry,
+                                              target_node_id,
+                                              node_id_for_board,
+                                              redirect_from_home_page = False,
+                                              base_url = base_url_of_library_pgn(pgn_id))
+
+
+@blueprint.route('/search')
+def search_for_position():
+    """
+    Redirects /search?fen=<FEN> to /node/<node_id>/<node_id> for the first node (in PGN order) of the built-in PGN whose
+    position is that of the FEN, found through the tree’s transposition index (see transpositions.py). Responds 400 if
+    the FEN is missing or invalid, and 404 if the position does not occur in the tree.
+    """
+    game_tree_entry = game_tree_cache.get_entry(path_of_built_in_pgn_file())
+    return redirect_to_node_of_position(game_tree_entry.nodedict, constants.VARTABLE_BASE_URL)
+
+
+@blueprint.route('/<pgn_id>/search')
+def search_for_position_in_library_pgn(pgn_id):
+    """
+    As search_for_position(), but for the PGN pgn_id of the PGN library, redirecting to /<pgn_id>/node/<id>/<id>
+    """
+    game_tree_entry = pgn_library.get_entry(pgn_id)
+    if game_tree_entry is None:
+        abort(404)
+    return redirect_to_node_of_position(game_tree_entry.nodedict, base_url_of_library_pgn(pgn_id))
+
+
+def redirect_to_node_of_position(nodedict, base_url):
+    """
+    Returns the response of a search for the position of the request’s “fen” argument in nodedict: a redirect to
+    base_url + "<node_id>/<node_id>" for the first node with that position, or a 400 or 404 (see search_for_position())
+    """
+    from . transpositions import node_ids_of_position
+
+    fen = request.args.get("fen", "")
+    if not fen.strip():
+        abort(400, description="Specify a position as /search?fen=<FEN>.")
+    try:
+        node_ids = node_ids_of_position(nodedict, fen)
+    except ValueError as error:
+        abort(400, description=f"Invalid FEN “{fen}”: {error}")
+    if not node_ids:
+        abort(404, description=f"The position “{fen}” does not occur in this PGN.")
+    return redirect(f"{base_url}{node_ids[0]}/{node_ids[0]}")
+
+
+def base_url_of_library_pgn(pgn_id):
+    """
+    Returns the base URL of the /<pgn_id>/node/<target>/<board> pages of PGN pgn_id of the library
+    """
+    return f"/{pgn_id}{constants.VARTABLE_BASE_URL}"
+
+
+def respond_with_variations_table_page(game_tree_entry, target_node_id, node_id_for_board, redirect_from_home_page,
+                                       base_url):
+    """
+    Returns the response of a variations-table page of the tree of game_tree_entry (see promote_node_to_main_line())
+    whose links are of the form base_url + "<target>/<board>".
+    """
+
+    if (not redirect_from_home_page) and (target_node_id == 0) and (node_id_for_board == 0):
+        flash_message = f"The game tree has been reset to the original main line."
+        flash(flash_message)
+
+    pending_flashes = tuple(session.get("_flashes", ()))
+
+    if not pending_flashes:
+        etag = etag_for_page(game_tree_entry.content_hash, target_node_id, node_id_for_board, redirect_from_home_page,
+                             base_url)
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+            set_caching_headers_of_page(response, etag)
+            return response
+
+    page_key = (game_tree_entry.content_hash,
+                base_url,
+                target_node_id,
+                node_id_for_board,
+                redirect_from_home_page,
+                pending_flashes)
+    html_of_page = page_cache.get(page_key)
+    if html_of_page is None:
+        html_of_page = render_variations_table_page(game_tree_entry.nodedict,
+                                                    target_node_id,
+                                                    node_id_for_board,
+                                                    redirect_from_home_page,
+                                                    base_url)
+        page_cache.put(page_key, html_of_page)
+    elif pending_flashes:
+        # Consumes the flashed messages, which the cached page already displays
+        session.pop("_flashes", None)
+
+    response = make_response(html_of_page)
+    if pending_flashes:
+        response.headers["Cache-Control"] = "no-store"
+    else:
+        set_caching_headers_of_page(response, etag)
+    return response
+
+
+def etag_for_page(content_hash, target_node_id, node_id_for_board, redirect_from_home_page,
+                  base_url=constants.VARTABLE_BASE_URL):
+    """
+    Returns the (strong) ETag of a flash-free /node/<target>/<board> page: derived from the PGN’s content hash, the app
+    version (which covers changes to templates and rendering), and the page’s parameters (including, for a page of the
+    PGN library, the base URL of its links).
+    """
+    etag = (f"{content_hash[:20]}-{__version__}-{target_node_id}-{node_id_for_board}-"
+            f"{'home' if redirect_from_home_page else 'node'}")
+    if base_url != constants.VARTABLE_BASE_URL:
+        etag += base_url.replace("/", "-").rstrip("-")
+    return etag
+
+
+def set_caching_headers_of_page(response, etag):
+    """
+    Sets the ETag and Cache-Control headers of a flash-free /node/<target>/<board> page (or its 304)
+    """
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={constants.PAGE_CACHE_MAX_AGE_SECONDS}"
+
+
+def render_variations_table_page(nodedict, target_node_id, node_id_for_board, redirect_from_home_page,
+                                 base_url=constants.VARTABLE_BASE_URL):
+    """
+    Renders, and returns as a string, the variations-table page with target_node_id elevated to the main line and the
+    position of node_id_for_board on the board, whose links are of the form base_url + "<target>/<board>".
+    """
 
     # Computes the deviation history required to achieve the specified target_node_id
-    deviation_history = deviation_history_of_node(nodedict, target_node_id)
+    with timed_stage("deviation"):
+        deviation_history = deviation_history_of_node(nodedict, target_node_id)
 
     # Gets a list of HTML table rows for the new variations table
-    list_of_rows_for_variations_table = construct_list_of_rows_for_variations_table(nodedict,
-                                                                                    deviation_history,
-                                                                                    target_node_id,
-                                                                                    node_id_for_board)
+    with timed_stage("rows"):
+        list_of_rows_for_variations_table = construct_list_of_rows_for_variations_table(nodedict,
+                                                                                        deviation_history,
+                                                                                        target_node_id,
+                                                                                        node_id_for_board,
+                                                                                        base_url)
 
     # Determines whether the “welcome block” will shown on the page. If not, the class name
     # “welcome-hide” is included in the list of classes associated with the welcome block.
@@ -59,61 +239,77 @@ def promote_node_to_main_line(target_node_id=0, node_id_for_board=0, redirect_fr
         welcome_display_classname = "welcome-hide"
 
     # Gets parameters for the board to be displayed, including the FEN string
-    parameters_for_board_to_be_displayed = compile_parameters_for_chessboard_svg(nodedict, node_id_for_board)
+    with timed_stage("board"):
+        parameters_for_board_to_be_displayed = compile_parameters_for_chessboard_svg(nodedict, node_id_for_board)
     chessboard_fen = parameters_for_board_to_be_displayed.fen_value
 
     # NOTE: As of 7/24/2022, I replaced using the web service at backscattering.de with directly using chess.svg.board
     # Gets URL for the downloadable SVG chess board
     # chessboard_url = form_url_for_chessboard_svg(parameters_for_board_to_be_displayed)
-    board_as_svg_string = construct_svg_chessboard(parameters_for_board_to_be_displayed)
 
-    # Gets pre- and post-comments for text-annotation area
-    (movetext_string, precomment, postcomment) = extract_text_comments_for_current_node(nodedict, node_id_for_board)
+    # In BOARD_RENDERING_MODE_SPRITE, the board is composed in the browser from parameters_for_board_to_be_displayed
+    # (see static/js/sprite_board.js), so no SVG is rendered here.
+    board_rendering_mode = constants.BOARD_RENDERING_MODE
+    if board_rendering_mode == constants.BOARD_RENDERING_MODE_INLINE_SVG:
+        with timed_stage("svg"):
+            board_as_svg_string = construct_svg_chessboard(parameters_for_board_to_be_displayed)
+    else:
+        board_as_svg_string = None
 
-    if (not redirect_from_home_page) and (target_node_id == 0) and (node_id_for_board == 0):
-        flash_message = f"The game tree has been reset to the original main line."
-        flash(flash_message)
+    # Gets pre- and post-comments for text-annotation area
+    with timed_stage("comments"):
+        (movetext_string, precomment, postcomment) = extract_text_comments_for_current_node(nodedict,
+                                                                                            node_id_for_board)
 
     # Renders the new variations table, incorporating the new rows
-    return render_template("traverse/variations_table.html", 
-                           target_node_id = target_node_id,
-                           list_of_rows_for_variations_table = list_of_rows_for_variations_table,
-                           welcome_display_classname = welcome_display_classname,
-                           fenstring = chessboard_fen,
-                        #    chessboard_url_to_fetch = chessboard_url,
-                           svg_string_for_board = board_as_svg_string,
-                           movetext_string = movetext_string,
-                           pre_move_comment = precomment,
-                           post_move_comment = postcomment)
+    with timed_stage("render"):
+        return render_template("traverse/variations_table.html", 
+                               target_node_id = target_node_id,
+                               vartable_base_url = base_url,
+                               list_of_rows_for_variations_table = list_of_rows_for_variations_table,
+                               welcome_display_classname = welcome_display_classname,
+                               fenstring = chessboard_fen,
+                            #    chessboard_url_to_fetch = chessboard_url,
+                               svg_string_for_board = board_as_svg_string,
+                               board_rendering_mode = board_rendering_mode,
+                               board_parameters = parameters_for_board_to_be_displayed,
+                               board_sprite_filename = constants.BOARD_SPRITE_FILENAME,
+                               movetext_string = movetext_string,
+                               pre_move_comment = precomment,
+                               post_move_comment = postcomment)
 
 
 @blueprint.route('/report')
+@timed_request
 def render_report_of_game_tree_statistics():
     """
     Renders a web page with a report of statistics about the game tree
     """
 
     # Gets nodedict embodying the game tree defined by the built-in PGN file
-    nodedict = prepare_nodedict_for_tranversal()
+    with timed_stage("tree"):
+        nodedict = prepare_nodedict_for_tranversal()
 
-    # Populates the class attributes of class GameTreeReport
-    characterize_gametree(nodedict)
+    # Gets an instance of class GameTreeReport
+    with timed_stage("report"):
+        game_tree_report = characterize_gametree(nodedict)
 
-    depth_histogram = GameTreeReport.depth_histogram
-    length_histogram = GameTreeReport.halfmove_length_histogram
-    number_of_edges_histogram = GameTreeReport.number_of_edges_histogram
+    depth_histogram = game_tree_report.depth_histogram
+    length_histogram = game_tree_report.halfmove_length_histogram
+    number_of_edges_histogram = game_tree_report.number_of_edges_histogram
 
-    # Computes supplemental statistics not included in the class attributes of class GameTreeReport
+    # Computes supplemental statistics not included in the attributes of game_tree_report
     sum_of_depth_histogram_frequencies = sum(depth_histogram.values())
     sum_of_length_histogram_frequencies = sum(length_histogram.values())
     sum_of_number_of_edges_frequencies = sum(number_of_edges_histogram.values())
 
-    return render_template("traverse/report.html",
-                           game_tree_report=GameTreeReport,
-                           sum_of_depth_histogram_frequencies = sum_of_depth_histogram_frequencies,
-                           sum_of_length_histogram_frequencies = sum_of_length_histogram_frequencies,
-                           sum_of_number_of_edges_frequencies = sum_of_number_of_edges_frequencies,
-                           )
+    with timed_stage("render"):
+        return render_template("traverse/report.html",
+                               game_tree_report=game_tree_report,
+                               sum_of_depth_histogram_frequencies = sum_of_depth_histogram_frequencies,
+                               sum_of_length_histogram_frequencies = sum_of_length_histogram_frequencies,
+                               sum_of_number_of_edges_frequencies = sum_of_number_of_edges_frequencies,
+                               )
 
 
 @blueprint.route('/dump_pgn')
@@ -131,56 +327,117 @@ def dump_pgn():
 
 def prepare_nodedict_for_tranversal():
     """
-    Constructs from scratch the nodedict that represents the game tree,
-    starting from reading the built-in PGN file.
+    Returns the nodedict that represents the game tree defined by the built-in PGN file.
 
-    This function should ultimately be cached, because this step should be
-    performed only once; nodedict should never change, because the built-in
-    PGN file which determines it never changes.
+    The nodedict is built only once per process (and rebuilt only if the PGN file’s content changes); see
+    game_tree_cache.py. The returned nodedict is shared across requests and must be treated as read-only.
     """
 
-    # Contructs file path to built-in PGN file
+    return game_tree_cache.get_nodedict(path_of_built_in_pgn_file())
+
+
+def path_of_built_in_pgn_file():
+    """
+    Returns the absolute path of the built-in PGN file
+    """
 
     # Note: in Python 3.9+, I believe that __file__ necessarily returns an absolute path and thus the os.path.abspath
     # part of the next line of code would be unnecessary. See https://www.youtube.com/watch?v=LVhxqOznPg0
     basedir = os.path.abspath(os.path.dirname(__file__))
 
-    pgn_filepath = os.path.join(basedir, constants.PATH_OF_PGN_FILE)
+    return os.path.join(basedir, constants.PATH_OF_PGN_FILE)
+
+
+def load_compiled_game_tree_if_current(pgn_filepath):
+    """
+    Returns the CompactGameTree memory-mapped from the compiled file for pgn_filepath, if that file exists and records
+    the SHA-256 of the PGN file’s current content. Otherwise (including if the compiled file is unreadable) returns None.
+    """
+    from . compiled_game_tree import CompiledGameTreeFormatError
+    from . compiled_game_tree import compiled_filepath_for_pgn_file
+    from . compiled_game_tree import load_compiled_game_tree
+    from . compiled_game_tree import read_source_sha256_of_compiled_file
+
+    compiled_filepath = compiled_filepath_for_pgn_file(pgn_filepath)
+    if not os.path.exists(compiled_filepath):
+        return None
+
+    try:
+        if read_source_sha256_of_compiled_file(compiled_filepath) != bytes.fromhex(hash_of_file_contents(pgn_filepath)):
+            log_nonfatal_error(f"Ignoring stale compiled game tree {compiled_filepath}")
+            return None
+        nodedict = load_compiled_game_tree(compiled_filepath)
+    except CompiledGameTreeFormatError as error:
+        log_nonfatal_error(f"Ignoring unreadable compiled game tree {compiled_filepath}: {error}")
+        return None
+
+    logging.info(f"Loaded compiled game tree {compiled_filepath} ({len(nodedict)} nodes)")
+    return nodedict
+
+
+def build_nodedict_from_pgn_file(pgn_filepath):
+    """
+    Constructs from scratch the nodedict that represents the game tree, starting from reading the PGN file at
+    pgn_filepath.
+
+    Called by game_tree_cache only when no valid cached tree exists.
+
+    If a compiled game-tree file (see compiled_game_tree.py) sits beside the PGN file and was compiled from the PGN
+    file’s current content, the tree is instead memory-mapped from it, which avoids parsing the PGN altogether.
+    """
 
-    # Parse PGN file and return a TokenizedGame object
-    tokenized_game  = get_next_parsed_game_from_PGN_file_using_custom_visitor(pgn_filepath)
+    nodedict = load_compiled_game_tree_if_current(pgn_filepath)
+    if nodedict is not None:
+        return nodedict
 
-    # Builds tree from tokenized_game object
-    nodedict = buildtree(tokenized_game)
+    # Parses PGN file and builds the tree in a single pass (equivalent to, but faster and leaner than, tokenizing with
+    # PGNTokenizer and then calling buildtree() on the resulting TokenizedGame)
+    if constants.USE_COMPACT_GAME_TREE:
+        from . pgn_tree_builder import PGNCompactTreeBuilder
+        Visitor = PGNCompactTreeBuilder
+    else:
+        from . pgn_tree_builder import PGNTreeBuilder
+        Visitor = PGNTreeBuilder
+    nodedict = get_next_parsed_game_from_PGN_file_using_custom_visitor(pgn_filepath, Visitor=Visitor)
     return nodedict
 
 
+# Process-wide cache of the game tree; see game_tree_cache.py
+game_tree_cache = GameTreeCache(build_nodedict_from_pgn_file)
+
+# Process-wide library of PGN files, whose trees are held in a cache of their own, bounded in size; see pgn_library.py
+pgn_library = PGNLibrary(os.path.join(os.path.abspath(os.path.dirname(__file__)), constants.DIRNAME_PGN_LIBRARY),
+                         GameTreeCache(build_nodedict_from_pgn_file,
+                                       maximum_bytes = constants.PGN_LIBRARY_MAXIMUM_TREE_BYTES,
+                                       size_function = estimated_bytes_of_nodedict))
+
+
 def read_static_pgn_file():
     """
     Reads the built-in PGN file and returns a string
     """
 
-    # Note: in Python 3.9+, I believe that __file__ necessarily returns an absolute path and thus the os.path.abspath
-    # part of the next line of code would be unnecessary. See https://www.youtube.com/watch?v=LVhxqOznPg0
-    basedir = os.path.abspath(os.path.dirname(__file__))
-
-    # Constructs path to built-in PGN file
-    pgn_file = os.path.join(basedir, constants.PATH_OF_PGN_FILE)
-
-    with open(pgn_file, "r") as file:
+    with open(path_of_built_in_pgn_file(), "r") as file:
         string_read_from_file = file.read()
 
     return string_read_from_file
 
 
-def get_next_parsed_game_from_PGN_file_using_custom_visitor(pgn_filepath):
+def get_next_parsed_game_from_PGN_file_using_custom_visitor(pgn_filepath, Visitor=None):
     """
-    
+    Reads the first game of the PGN file at pgn_filepath with chess.pgn.read_game(), using the custom visitor class
+    Visitor (by default, PGNTokenizer), and returns the visitor’s result: a TokenizedGame for PGNTokenizer; a GameTree
+    for PGNTreeBuilder.
     """
+    import chess.pgn
+
+    if Visitor is None:
+        from . pgn_tokenizer import PGNTokenizer
+        Visitor = PGNTokenizer
     try:
         # with pgn_filepath.open('r') as pgn_file:
         with open(pgn_filepath, 'r') as pgn_file:
-            parsed_pgn_text_stream = chess.pgn.read_game(pgn_file, Visitor=PGNTokenizer)
+            parsed_pgn_text_stream = chess.pgn.read_game(pgn_file, Visitor=Visitor)
             return parsed_pgn_text_stream
     except FileNotFoundError as err:
         pgn_file_not_found_fatal_error(pgn_filepath, err)
@@ -1,7 +1,14 @@
 """
 Module for functions to produce the variations table.
+
+Rendered rows are cached per game tree (see RowFragment and row_fragment_cache_of()): a row depends only on the node,
+the edge treated as its main line, and any carry-over White edge—plus the target node_id, which appears in the
+mainline anchors, and the node_id for the board, which determines which mainline cell (if any) has the focus class.
+A cached row is stored as a template split at the target node_id, and the focus class is patched in by choosing among
+per-focus variants of the template, so that a row on a hot line costs a dictionary lookup and a join.
 """
 import logging
+import threading
 
 from . classes_arboreal import Edge, GameNode
 from . import constants
@@ -9,6 +16,7 @@ from . constants import (BLACK_MOVE_DEFERRED,
                          MOVETEXT_KEY_FOR_ALTERNATIVES,
                          MOVETEXT_KEY_FOR_MAINLINE,
                          VARTABLE_ALT_HALFMOVE_STYLE_NAME_PREFIX,
+                         VARTABLE_BASE_URL,
                          VARTABLE_VARIATION_ROW_PREFIX,
                          VARTABLE_ROW_SUFFIX,
                          VARTABLE_VARIATION_FAUX_ROW_PREFIX,
@@ -25,22 +33,44 @@ from . constants import (BLACK_MOVE_DEFERRED,
                          VARTABLE_CSS_NAME_ALTERNATIVE_BLACK,
                          VARTABLE_CSS_NAME_ALTERNATIVE_WHITE,
                          VARTABLE_ANCHOR_PREFIX_OPEN,
+                         VARTABLE_ANCHOR_PREFIX_OPEN_BEFORE_URL,
                          VARTABLE_ANCHOR_PREFIX_CLOSE,
                          VARTABLE_ANCHOR_SUFFIX,
                          VARTABLE_MINIMUM_NUMBER_OF_ALTERNATIVES_TO_DISPLAY,
+                         VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY,
+                         VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY_PER_NODE,
                          )
 from . game_tree import compile_movetext_elements_for_output_for_single_node
+from . lru_cache import LRUCache
+from . principal_lines import displayed_line_of_deviation_history
 from . utilities import naglist_as_string_for_mainline
 from . utilities import naglist_as_string_for_alternatives
 
 
-def construct_list_of_rows_for_variations_table(nodedict, deviation_history, target_node_id, node_id_for_board):
+def construct_list_of_rows_for_variations_table(nodedict, deviation_history, target_node_id, node_id_for_board,
+                                                base_url=VARTABLE_BASE_URL):
     """
     Constructs/returns a list of strings, each of which corresponds to the HTML for one row of the variations table
-    defined by deviation_history.
+    defined by deviation_history. The rows’ anchors link to base_url + "<target>/<board>".
+    """
+    return [row_fragment.render(target_node_id, node_id_for_board, base_url)
+            for row_fragment in list_of_row_fragments_for_variations_table(nodedict, deviation_history)]
+
+
+def list_of_row_fragments_for_variations_table(nodedict, deviation_history):
+    """
+    Constructs/returns the list of RowFragments, one for each row of the variations table defined by deviation_history
+    (the first being the invisible faux first row), from which the rows’ HTML (see RowFragment.render()) or structured
+    data (see RowFragment.structured_row()) is produced.
     """
 
-    list_of_strings_for_rows = []
+    list_of_row_fragments = []
+
+    row_fragment_cache = row_fragment_cache_of(nodedict)
+
+    # The node_ids of the line to be displayed, assembled from the principal-line index rather than by walking the tree
+    # from the initial node
+    displayed_line = displayed_line_of_deviation_history(nodedict, deviation_history)
 
     do_continue = True
 
@@ -50,32 +80,47 @@ def construct_list_of_rows_for_variations_table(nodedict, deviation_history, tar
     while do_continue:
 
         if is_first_row:
-            node = get_faux_node_for_invisible_first_row()
+            # The faux node has no node_id; UNDEFINED_TREEISH_VALUE stands in for it in the row-fragment cache key
+            node = None
+            node_id = constants.UNDEFINED_TREEISH_VALUE
             choice_id_as_mainline = 0
             inbound_carryover_white_edge = None
         else:
             if are_key_values_unitialized:
-                # Start at initial node    
-                node_id = constants.INITIAL_NODE_ID
+                # Start at initial node, the first node of displayed_line
+                position_in_displayed_line = 0
                 inbound_carryover_white_edge = None
                 are_key_values_unitialized = False
 
-            # Determine which edge should be treated as the main line
-            # Looks whether node_id is a node at which a deviation is prescribed by history
-            if node_id in deviation_history.keys():
-                # Node node_id has a deviation from the mainline action to deviation_history[node_id]
-                choice_id_as_mainline = deviation_history[node_id]
-            else:
-                # Node node_id doesn't have a deviation; use the mainline action (constants.INDEX_MAINLINE)
-                choice_id_as_mainline = constants.INDEX_MAINLINE
+            node_id = displayed_line[position_in_displayed_line]
+
+            # Determine which edge should be treated as the main line: the deviation prescribed by history for node_id,
+            # if any; otherwise the mainline action (constants.INDEX_MAINLINE)
+            choice_id_as_mainline = deviation_history.get(node_id, constants.INDEX_MAINLINE)
             
             node = nodedict[node_id]
 
-        # Get the info required to create the string of HTML for a single line of the variations table
-        # varitions_line is an object of class Variations_Table_Line
-        variations_line = compile_movetext_elements_for_output_for_single_node(node,
-                                                                               choice_id_as_mainline,
-                                                                               inbound_carryover_white_edge)
+        # A carry-over White edge is identified by its destination node
+        if inbound_carryover_white_edge is None:
+            inbound_carryover_destination_node_id = None
+        else:
+            inbound_carryover_destination_node_id = inbound_carryover_white_edge.destination_node_id
+        row_fragment_key = (node_id, choice_id_as_mainline, inbound_carryover_destination_node_id)
+
+        row_fragment = row_fragment_cache.get(row_fragment_key)
+        if row_fragment is None:
+            if node is None:
+                node = get_faux_node_for_invisible_first_row()
+
+            # Get the info required to create the string of HTML for a single line of the variations table
+            # varitions_line is an object of class Variations_Table_Line
+            variations_line = compile_movetext_elements_for_output_for_single_node(node,
+                                                                                   choice_id_as_mainline,
+                                                                                   inbound_carryover_white_edge)
+            row_fragment = RowFragment(variations_line, is_first_row)
+            row_fragment_cache.put(row_fragment_key, row_fragment)
+
+        variations_line = row_fragment.variations_line
         
         # Reset inbound_carryover_white_edge.
         inbound_carryover_white_edge = None
@@ -94,11 +139,7 @@ def construct_list_of_rows_for_variations_table(nodedict, deviation_history, tar
         elif (not is_terminal_node) or mainline_edge_white:
             # Produce a line of output if either (a) the node is not a terminal node or (b) even if the node is a 
             # terminal node but there was a residual carryover_white_edge that needs to be flushed.
-            string_for_row = string_of_HTML_for_single_row_of_variations_table(variations_line,
-                                                                               target_node_id,
-                                                                               node_id_for_board,
-                                                                               is_first_row=is_first_row)
-            list_of_strings_for_rows.append(string_for_row)
+            list_of_row_fragments.append(row_fragment)
 
         # Finds the next node in the main line
         if do_continue:
@@ -106,11 +147,152 @@ def construct_list_of_rows_for_variations_table(nodedict, deviation_history, tar
             if is_first_row:
                 is_first_row = False
             else:
-                next_node_id = nodedict[node_id].edgeslist[choice_id_as_mainline].destination_node_id
-                node_id = next_node_id
+                position_in_displayed_line += 1
     # End of while not is_terminal_node loop
 
-    return list_of_strings_for_rows
+    return list_of_row_fragments
+
+
+# Stands in for the target node_id when a row is rendered as a template; cannot occur in rendered HTML
+ROW_TEMPLATE_TARGET_NODE_ID_MARKER = "\x00target\x00"
+
+# Serializes creation of a tree’s row-fragment cache
+row_fragment_cache_creation_lock = threading.Lock()
+
+
+def row_fragment_cache_of(nodedict):
+    """
+    Returns nodedict’s LRUCache of RowFragments, creating it on first use.
+
+    The cache is keyed on (node_id, choice_id_as_mainline, destination node_id of the inbound carry-over White edge or
+    None), with node_id UNDEFINED_TREEISH_VALUE for the faux first row. Its statistics() are exposed as
+    nodedict.row_fragment_cache.statistics().
+    """
+    if nodedict.row_fragment_cache is None:
+        with row_fragment_cache_creation_lock:
+            if nodedict.row_fragment_cache is None:
+                nodedict.row_fragment_cache = LRUCache(row_fragment_cache_capacity_of_tree(len(nodedict)))
+    return nodedict.row_fragment_cache
+
+
+def row_fragment_cache_capacity_of_tree(number_of_nodes):
+    """
+    Returns the capacity of the row-fragment cache of a tree of number_of_nodes nodes (see
+    VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY_PER_NODE), counting the faux first row
+    """
+    return min(VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY,
+               VARTABLE_ROW_FRAGMENT_CACHE_CAPACITY_PER_NODE * number_of_nodes + 1)
+
+
+class RowFragment:
+    """
+    A cached row of the variations table: the Variations_Table_Line for a (node, choice_id_as_mainline, carry-over
+    White edge) together with its rendered HTML, stored as templates that lack only the target node_id.
+
+    A row’s HTML also depends on node_id_for_board, but only through whether it is the destination of the row’s White
+    or Black mainline edge (in which case that cell gets the focus class). Thus there are at most three variants of the
+    template per base URL of the anchors (VARTABLE_BASE_URL, or a PGN library’s; see pgn_library.py), keyed by the
+    focused destination node_id (or None) and the base URL, each rendered the first time it is needed.
+    """
+
+    __slots__ = {
+        "variations_line":
+            "The Variations_Table_Line from which the row is rendered",
+        "is_first_row":
+            "True iff this is the faux first row",
+        "mainline_destination_node_ids":
+            "Destination node_ids of the row’s White and Black mainline edges (that exist)",
+        "templates_by_focus":
+            "Dictionary {(focused destination node_id or None, base URL): list of HTML pieces to be joined by the "
+            "target node_id}",
+        "structured_row_of_line":
+            "The row as structured data (see structured_row()), once computed; else None",
+    }
+
+    def __init__(self, variations_line, is_first_row):
+        self.variations_line = variations_line
+        self.is_first_row = is_first_row
+        self.mainline_destination_node_ids = tuple(edge.destination_node_id
+                                                   for edge in (variations_line.mainline_edge_white,
+                                                                variations_line.mainline_edge_black)
+                                                   if edge)
+        self.templates_by_focus = {}
+        self.structured_row_of_line = None
+
+
+    def render(self, target_node_id, node_id_for_board, base_url=VARTABLE_BASE_URL):
+        """
+        Returns the row’s HTML for the given target node and node for the board, identical to that returned by
+        string_of_HTML_for_single_row_of_variations_table() except that its anchors link to base_url (rather than
+        VARTABLE_BASE_URL) + "<target>/<board>"
+        """
+        if node_id_for_board in self.mainline_destination_node_ids:
+            focused_node_id = node_id_for_board
+        else:
+            focused_node_id = None
+
+        template = self.templates_by_focus.get((focused_node_id, base_url))
+        if template is None:
+            string_for_row = string_of_HTML_for_single_row_of_variations_table(self.variations_line,
+                                                                               ROW_TEMPLATE_TARGET_NODE_ID_MARKER,
+                                                                               focused_node_id,
+                                                                               is_first_row=self.is_first_row)
+            if base_url != VARTABLE_BASE_URL:
+                string_for_row = string_for_row.replace(VARTABLE_ANCHOR_PREFIX_OPEN,
+                                                        VARTABLE_ANCHOR_PREFIX_OPEN_BEFORE_URL + base_url)
+            template = string_for_row.split(ROW_TEMPLATE_TARGET_NODE_ID_MARKER)
+            # Two requests racing here store identical templates
+            self.templates_by_focus[(focused_node_id, base_url)] = template
+
+        return str(target_node_id).join(template)
+
+
+    def structured_row(self):
+        """
+        Returns the row as a JSON-compatible dict (see structured_row_of_variations_line()). Unlike the row’s HTML, it
+        depends on neither the target node_id nor the node_id for the board, so it is computed only once.
+        """
+        if self.structured_row_of_line is None:
+            self.structured_row_of_line = structured_row_of_variations_line(self.variations_line)
+        return self.structured_row_of_line
+
+
+def structured_row_of_variations_line(variations_line):
+    """
+    Returns, as a JSON-compatible dict, the content of the row of the variations table described by variations_line:
+        "fullmove":     fullmove number, if the row has a White mainline move; else None
+        "player":       "white" or "black": the player whose alternatives the row shows
+        "white":        the White mainline cell, or None for an ellipsis
+        "black":        the Black mainline cell, or None for a deferred Black move
+        "alternatives": list of alternative cells, in display order
+    where each cell is a dict:
+        "movetext":     the movetext displayed, with any NAGs, e.g., “Nf3!?”
+        "node_id":      destination node_id of the move
+        "alt":          reference index of the move at its node (which determines the cell’s “alt-n” CSS class)
+
+    A mainline cell links to /node/<target>/<node_id>, where target is the target node_id of the table; an alternative
+    cell links to /node/<node_id>/<node_id>.
+    """
+    def cell_of_edge(edge, movetext_key, naglist_as_string):
+        if not edge:
+            return None
+        return {"movetext": edge.movetext_dict[movetext_key] + naglist_as_string(edge.nag_list),
+                "node_id": edge.destination_node_id,
+                "alt": edge.reference_index}
+
+    mainline_edge_white = variations_line.mainline_edge_white
+    list_of_alternative_edges_to_display = variations_line.list_of_alternative_edges_to_display or []
+
+    return {"fullmove": variations_line.fullmovenumber if mainline_edge_white else None,
+            "player": "white" if variations_line.is_player_white else "black",
+            "white": cell_of_edge(mainline_edge_white, MOVETEXT_KEY_FOR_MAINLINE, naglist_as_string_for_mainline),
+            "black": cell_of_edge(variations_line.mainline_edge_black,
+                                  MOVETEXT_KEY_FOR_MAINLINE,
+                                  naglist_as_string_for_mainline),
+            "alternatives": [cell_of_edge(edge, MOVETEXT_KEY_FOR_ALTERNATIVES, naglist_as_string_for_alternatives)
+                             for edge in list_of_alternative_edges_to_display],
+           }
+
 
 def string_of_HTML_for_single_row_of_variations_table(variations_line, target_node_id, node_id_for_board, is_first_row):
     """
@@ -327,8 +509,7 @@ def get_faux_node_for_invisible_first_row():
 
     node = GameNode(depth = 0,
                     halfmovenumber = 1,
-                    originating_node_id = 0,
-                    node_id = constants.UNDEFINED_TREEISH_VALUE)
+                    originating_node_id = 0)
     number_of_edges = constants.VARTABLE_MINIMUM_NUMBER_OF_ALTERNATIVES_TO_DISPLAY + 1
     node.number_of_edges = number_of_edges
     faux_movetext_dict = {"san":"Faux", "lan":"Faux","uci":"Faux"}